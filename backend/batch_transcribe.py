@@ -0,0 +1,361 @@
+"""
+Offline batch transcription of videos at rest.
+
+Videos (or pre-cropped frame tensors, see frame_tensor.py) from a
+directory or a manifest file are decoded in a pool of worker processes
+while the main process runs batched inference through the same loader the
+API uses (load_serving_model: exported model, checkpoint or TFLite, per
+LIPNET_ENGINE). Decoding runs at most a few clips ahead of inference, so
+memory stays bounded however many clips there are.
+
+Results are appended to a JSONL file, one record per clip, and fsynced
+every `--checkpoint-every` clips. The clip list is frozen in
+`<out>.manifest.json` on the first run; running the same command again
+skips every clip already in the results file (a torn final line is
+truncated) and carries on. 75-frame clips are batched together; clips of
+any other length are transcribed in overlapping windows (long_video.py).
+A clip that fails to decode or transcribe is recorded with its error and
+the run continues; `--retry-failed` picks those clips up again.
+
+Usage:
+    python backend/batch_transcribe.py data/s1 --out results/s1.jsonl --workers 6 --batch-size 8
+    python backend/batch_transcribe.py clips.txt --out results/clips.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+try:
+    from executors import available_cpus
+    from frame_tensor import decode_frame_tensor
+    from ingest import TENSOR_SUFFIXES, VIDEO_SUFFIXES
+    from lipnet_utils import char_lookup, decode_predictions, model_version
+    from long_video import WINDOW_FRAMES, transcribe_frames
+    from video_io import get_decoder, normalize_frames
+except ImportError:
+    from backend.executors import available_cpus
+    from backend.frame_tensor import decode_frame_tensor
+    from backend.ingest import TENSOR_SUFFIXES, VIDEO_SUFFIXES
+    from backend.lipnet_utils import char_lookup, decode_predictions, model_version
+    from backend.long_video import WINDOW_FRAMES, transcribe_frames
+    from backend.video_io import get_decoder, normalize_frames
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST_VERSION = 1
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_CHECKPOINT_EVERY = 100
+# Decoded clips allowed to wait for inference, per decode worker
+PREFETCH_PER_WORKER = 4
+
+
+def list_clips(source: str) -> Tuple[str, List[str]]:
+    """
+    (root, clip paths relative to root) for a directory, searched
+    recursively for videos and frame tensors, or for a manifest file with
+    one path per line (relative to the manifest; `#` starts a comment)
+    """
+    suffixes = tuple(VIDEO_SUFFIXES) + TENSOR_SUFFIXES
+    if os.path.isdir(source):
+        root = os.path.abspath(source)
+        clips = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                if name.lower().endswith(suffixes):
+                    clips.append(os.path.relpath(os.path.join(directory, name), root))
+        return root, sorted(clips)
+    root = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r') as f:
+        clips = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    return root, list(dict.fromkeys(clips))
+
+
+def load_manifest(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_manifest(path: str, manifest: dict):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class ResultLog:
+    """
+    Append-only JSONL of per-clip results. Opening it truncates a partly
+    written last line and collects the clips already done; `checkpoint`
+    makes everything written so far durable.
+    """
+
+    def __init__(self, path: str, checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY, retry_failed: bool = False):
+        self.path = path
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.done: Set[str] = set()
+        self.written = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            self._recover(retry_failed)
+        self._file = open(path, 'a')
+
+    def _recover(self, retry_failed: bool):
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('success') or not retry_failed:
+                self.done.add(record['path'])
+            else:
+                self.done.discard(record['path'])
+
+    def write(self, record: dict):
+        self._file.write(json.dumps(record) + '\n')
+        self.done.add(record['path'])
+        self.written += 1
+        if self.written % self.checkpoint_every == 0:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self.checkpoint()
+        self._file.close()
+
+
+def _init_decode_worker():
+    # One decode thread per process: parallelism comes from the pool
+    try:
+        import cv2
+        cv2.setNumThreads(1)
+    except ImportError:
+        pass
+
+
+def decode_clip(
+    path: str, backend: Optional[str], roi: Optional[str]
+) -> Tuple[np.ndarray, bool, Optional[float], float]:
+    """
+    Runs in a decode worker. Returns (frames, normalized, fps, seconds):
+    a normalized (75, 46, 140, 1) float32 clip ready for batching, or the
+    raw uint8 crops of a clip of any other length for windowed transcription.
+    """
+    start = time.perf_counter()
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix in TENSOR_SUFFIXES:
+        with open(path, 'rb') as f:
+            gray, fps = decode_frame_tensor(f.read(), suffix)
+    else:
+        decoder = get_decoder(backend, roi)
+        gray = decoder.decode(path)
+        fps = decoder.frame_rate(path) if gray.shape[0] not in (0, WINDOW_FRAMES) else None
+    if gray.shape[0] == 0:
+        raise ValueError("No frames decoded")
+    if gray.shape[0] == WINDOW_FRAMES:
+        return normalize_frames(gray), True, fps, time.perf_counter() - start
+    return gray, False, fps, time.perf_counter() - start
+
+
+class BatchTranscriber:
+    """Decode pool feeding batched inference in this process"""
+
+    def __init__(self, model, workers: int, batch_size: int = DEFAULT_BATCH_SIZE,
+                 backend: Optional[str] = None, roi: Optional[str] = None,
+                 beam_width: Optional[int] = None, constraint: Optional[str] = None):
+        self.model = model
+        self.workers = workers
+        self.batch_size = batch_size
+        self.backend = backend
+        self.roi = roi
+        self.beam_width = beam_width
+        self.constraint = constraint
+        self.timings = {"decode": 0.0, "inference": 0.0, "long": 0.0}
+
+    def _predict(self, batch: np.ndarray) -> np.ndarray:
+        start = time.perf_counter()
+        yhat = np.asarray(self.model.predict(batch, verbose=0))
+        self.timings["inference"] += time.perf_counter() - start
+        return yhat
+
+    def _flush(self, batch: List[Tuple[str, np.ndarray, float]], log: ResultLog):
+        if not batch:
+            return
+        try:
+            yhat = self._predict(np.stack([clip for _, clip, _ in batch]))
+            texts = decode_predictions(yhat, None, self.beam_width, self.constraint)
+        except Exception as e:
+            # One bad batch fails its own clips, not the run
+            error = str(e) or type(e).__name__
+            for path, _, _ in batch:
+                log.write({"path": path, "success": False, "error": error})
+            batch.clear()
+            return
+        for (path, clip, decode_s), text in zip(batch, texts):
+            log.write({"path": path, "success": True, "prediction": text, "frames": int(clip.shape[0]),
+                       "decode_ms": round(1000.0 * decode_s, 1)})
+        batch.clear()
+
+    def _long(self, path: str, gray: np.ndarray, fps: Optional[float], decode_s: float) -> dict:
+        start = time.perf_counter()
+        result = transcribe_frames(iter(gray), self._predict, char_lookup, fps)
+        self.timings["long"] += time.perf_counter() - start
+        return {"path": path, "success": True, "prediction": result["text"], "frames": result["frames"],
+                "words": result["words"], "duration_s": result["duration_s"],
+                "decode_ms": round(1000.0 * decode_s, 1)}
+
+    def run(self, root: str, clips: Iterable[str], log: ResultLog, progress=None):
+        """Transcribe `clips` (relative to `root`) into `log`"""
+        todo = iter(clips)
+        max_pending = self.workers * PREFETCH_PER_WORKER
+        pending: Dict = {}
+        batch: List[Tuple[str, np.ndarray, float]] = []
+        context = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_decode_worker)
+        try:
+            while True:
+                while len(pending) < max_pending:
+                    path = next(todo, None)
+                    if path is None:
+                        break
+                    future = pool.submit(decode_clip, os.path.join(root, path), self.backend, self.roi)
+                    pending[future] = path
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = pending.pop(future)
+                    if progress is not None:
+                        progress()
+                    try:
+                        frames, normalized, fps, decode_s = future.result()
+                    except Exception as e:
+                        log.write({"path": path, "success": False, "error": str(e) or type(e).__name__})
+                        continue
+                    self.timings["decode"] += decode_s
+                    if normalized:
+                        batch.append((path, frames, decode_s))
+                        if len(batch) >= self.batch_size:
+                            self._flush(batch, log)
+                    else:
+                        try:
+                            record = self._long(path, frames, fps, decode_s)
+                        except Exception as e:
+                            record = {"path": path, "success": False, "error": str(e) or type(e).__name__}
+                        log.write(record)
+            self._flush(batch, log)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable offline transcription of a directory or manifest of videos")
+    parser.add_argument('source', help="Directory of videos, or a text file with one path per line")
+    parser.add_argument('--out', required=True, help="JSONL results file; rerun the same command to resume")
+    parser.add_argument('--workers', type=int, default=0, help="Decode processes (default: half the CPUs)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Clips per forward pass")
+    parser.add_argument('--threads', type=int, default=0,
+                        help="Inference intra-op threads (default: the CPUs not used for decoding)")
+    parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help="Clips between fsyncs of the results file")
+    parser.add_argument('--backend', default=None, help="Video decode backend")
+    parser.add_argument('--roi', default=None, help="Mouth region: fixed or track")
+    parser.add_argument('--engine', default=None, help="Inference engine: keras or tflite")
+    parser.add_argument('--beam-width', type=int, default=None,
+                        help="CTC beam width for 75-frame clips (default: LIPNET_BEAM_WIDTH); "
+                             "windowed clips are always decoded greedily")
+    parser.add_argument('--constraint', default=None,
+                        help="Decoder constraint for 75-frame clips: none, grid or a lexicon file")
+    parser.add_argument('--retry-failed', action='store_true', help="Retry clips whose earlier attempt failed")
+    parser.add_argument('--force', action='store_true', help="Resume even though the model or settings changed")
+    args = parser.parse_args()
+
+    try:
+        from serving import load_serving_model
+    except ImportError:
+        from backend.serving import load_serving_model
+
+    cpus = len(available_cpus())
+    workers = args.workers or max(1, cpus // 2)
+    threads = args.threads or max(1, cpus - workers)
+    settings = {"backend": args.backend, "roi": args.roi, "engine": args.engine,
+                "beam_width": args.beam_width, "constraint": args.constraint}
+    version = model_version(BASE_DIR)
+
+    manifest_path = args.out + '.manifest.json'
+    manifest = load_manifest(manifest_path)
+    if manifest is None:
+        root, clips = list_clips(args.source)
+        manifest = {"version": MANIFEST_VERSION, "source": os.path.abspath(args.source), "root": root,
+                    "created": datetime.now().isoformat(), "model_version": version,
+                    "settings": settings, "clips": clips}
+        write_manifest(manifest_path, manifest)
+    elif (manifest["model_version"], manifest["settings"]) != (version, settings) and not args.force:
+        print(f"{manifest_path} was written with model {manifest['model_version']} and settings "
+              f"{manifest['settings']}; pass --force to resume with the current ones", file=sys.stderr)
+        sys.exit(2)
+
+    log = ResultLog(args.out, args.checkpoint_every, args.retry_failed)
+    todo = [clip for clip in manifest["clips"] if clip not in log.done]
+    total = len(manifest["clips"])
+    print(f"{total} clips, {total - len(todo)} already done; decoding with {workers} processes, "
+          f"inference with {threads} threads", file=sys.stderr)
+    if not todo:
+        log.close()
+        return
+
+    timings = {}
+    _, model = load_serving_model(BASE_DIR, args.engine, timings, threads=(threads, 1))
+    transcriber = BatchTranscriber(model, workers, args.batch_size, args.backend, args.roi,
+                                   args.beam_width, args.constraint)
+    started = time.perf_counter()
+    processed = 0
+
+    def progress():
+        nonlocal processed
+        processed += 1
+        if processed % args.checkpoint_every == 0:
+            elapsed = time.perf_counter() - started
+            print(f"{total - len(todo) + processed}/{total} clips, {processed / elapsed:.2f} clips/s",
+                  file=sys.stderr)
+
+    try:
+        transcriber.run(manifest["root"], todo, log, progress)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume", file=sys.stderr)
+    finally:
+        log.close()
+    elapsed = time.perf_counter() - started
+    summary = {
+        "clips": log.written,
+        "elapsed_s": round(elapsed, 3),
+        "clips_per_s": round(log.written / elapsed, 3) if elapsed > 0 else None,
+        "decode_cpu_s": round(transcriber.timings["decode"], 3),
+        "inference_s": round(transcriber.timings["inference"], 3),
+        "windowed_s": round(transcriber.timings["long"], 3),
+        "model_load": timings,
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
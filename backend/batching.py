@@ -0,0 +1,193 @@
+"""Dynamic micro-batching scheduler for LipNet inference"""
+import os
+import time
+import asyncio
+from typing import Callable, List, Optional
+
+import numpy as np
+
+try:
+    from lipnet_utils import decode_predictions
+    from metrics import BATCH_SIZE, observe_stage
+except ImportError:
+    from backend.lipnet_utils import decode_predictions
+    from backend.metrics import BATCH_SIZE, observe_stage
+
+
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("LIPNET_MAX_BATCH_SIZE", "8"))
+DEFAULT_MAX_WAIT_MS = float(os.getenv("LIPNET_MAX_BATCH_WAIT_MS", "10"))
+
+
+class _PendingRequest:
+    """A single clip waiting to be batched"""
+    __slots__ = ("frames", "future", "enqueued_at")
+
+    def __init__(self, frames: np.ndarray, future: asyncio.Future):
+        self.frames = frames
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchScheduler:
+    """
+    Collects concurrent prediction requests and runs them through the model
+    in one forward pass.
+
+    A batch is flushed as soon as it holds `max_batch_size` clips or the
+    oldest clip has waited `max_wait_ms`, whichever comes first. Each caller
+    awaits its own decoded transcript.
+    """
+
+    def __init__(
+        self,
+        get_model: Callable,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        executor=None,
+        max_concurrent_batches: Optional[int] = None,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be >= 0")
+        self.get_model = get_model
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+        if max_concurrent_batches is None:
+            max_concurrent_batches = max(1, getattr(executor, "inference_processes", 1))
+        self.max_concurrent_batches = max_concurrent_batches
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._batch_tasks: set = set()
+        self.batches_run = 0
+        self.items_processed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """Start the background batching loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop and fail any requests still queued"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        for task in list(self._batch_tasks):
+            task.cancel()
+        await asyncio.gather(self._worker, *self._batch_tasks, return_exceptions=True)
+        self._worker = None
+        while self._queue is not None and not self._queue.empty():
+            pending = self._queue.get_nowait()
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("Batch scheduler stopped"))
+
+    async def submit(self, frames) -> str:
+        """Queue one preprocessed clip and wait for its transcript"""
+        if not self.running:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingRequest(np.asarray(frames, dtype=np.float32), future))
+        return await future
+
+    async def _collect(self) -> List[_PendingRequest]:
+        """Block for the first request, then gather more until size or time limit"""
+        batch = [await self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                # Still drain anything that is already waiting
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Take a slot first so the next batch keeps filling while all
+            # inference workers are busy
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._process(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task):
+        self._batch_tasks.discard(task)
+        self._slots.release()
+
+    async def _run_blocking(self, fn: Callable, *args):
+        if self.executor is not None:
+            return await self.executor.run_io(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _predict(self, video_batch: np.ndarray) -> np.ndarray:
+        if self.executor is not None:
+            return await self.executor.predict(video_batch)
+        return await self._run_blocking(
+            lambda batch: np.asarray(self.get_model().predict(batch, verbose=0)), video_batch
+        )
+
+    async def _process(self, batch: List[_PendingRequest]):
+        """
+        Run batched inference and resolve each caller. Clips are grouped by
+        shape so that a single odd-length clip cannot break the whole batch.
+        """
+        groups = {}
+        for pending in batch:
+            groups.setdefault(pending.frames.shape, []).append(pending)
+
+        for shape, members in groups.items():
+            try:
+                video_batch = np.stack([p.frames for p in members], axis=0)
+                start = time.perf_counter()
+                yhat = await self._predict(video_batch)
+                decoded_at = time.perf_counter()
+                texts = await self._run_blocking(self._decode, yhat, int(shape[0]))
+                observe_stage('inference', decoded_at - start)
+                observe_stage('ctc_decode', time.perf_counter() - decoded_at)
+                BATCH_SIZE.observe(len(members))
+            except Exception as e:
+                for pending in members:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                continue
+            for pending, text in zip(members, texts):
+                if not pending.future.done():
+                    pending.future.set_result(text)
+
+        self.batches_run += 1
+        self.items_processed += len(batch)
+
+    @staticmethod
+    def _decode(yhat: np.ndarray, input_length: int) -> List[str]:
+        return decode_predictions(yhat, [input_length] * len(yhat))
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "batches_run": self.batches_run,
+            "items_processed": self.items_processed,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+        }
@@ -0,0 +1,328 @@
+"""
+Per-stage performance benchmarks on synthetic GRID-shaped videos.
+
+Times video decode (fixed crop and tracked mouth ROI), normalization, the
+forward pass and CTC decoding at several batch sizes, then the end-to-end
+upload endpoint through an in-process ASGI client under concurrent load. Results are written as JSON;
+`compare` flags metrics that got worse than a baseline by more than a
+threshold.
+
+Usage:
+    python backend/benchmark.py run --out bench/baseline.json
+    python backend/benchmark.py run --out bench/new.json --compare bench/baseline.json
+    python backend/benchmark.py compare bench/baseline.json bench/new.json --threshold 0.1
+
+The HTTP stage needs `httpx` (pass --skip-http without it).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import platform
+import tempfile
+import argparse
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    from video_io import DEFAULT_BACKEND, get_decoder, normalize_frames
+    from streaming import synthetic_scene
+except ImportError:
+    from backend.video_io import DEFAULT_BACKEND, get_decoder, normalize_frames
+    from backend.streaming import synthetic_scene
+
+DEFAULT_THRESHOLD = 0.10
+# Metrics where a larger value is better; everything else is a latency
+HIGHER_IS_BETTER = ('_per_s',)
+
+
+def write_synthetic_video(path: str, seed: int = 0, frames: int = 75, fps: float = 25.0) -> str:
+    """Write a 360x288 MJPEG AVI of the synthetic mouth scene"""
+    import cv2
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (360, 288))
+    if not writer.isOpened():
+        raise RuntimeError(f"OpenCV cannot write {path}")
+    for frame in synthetic_scene(frames, seed=seed):
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def synthetic_videos(directory: str, count: int) -> List[str]:
+    """`count` distinct clips, so the prediction cache never short-circuits a request"""
+    return [write_synthetic_video(os.path.join(directory, f'clip-{i:03d}.avi'), seed=i) for i in range(count)]
+
+
+def summarize(samples_s: Sequence[float]) -> Dict[str, float]:
+    ms = 1000.0 * np.asarray(samples_s, dtype=np.float64)
+    return {
+        "ms_mean": float(ms.mean()),
+        "ms_p50": float(np.percentile(ms, 50)),
+        "ms_p95": float(np.percentile(ms, 95)),
+    }
+
+
+def time_calls(fn: Callable, repeats: int, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_decode(paths: Sequence[str], backend: str, repeats: int) -> Dict[str, float]:
+    decoder = get_decoder(backend, roi='fixed')
+    clips = iter(paths * (repeats + 1))
+    return time_calls(lambda: decoder.decode(next(clips)), repeats)
+
+
+def bench_roi_decode(paths: Sequence[str], backend: str, repeats: int) -> Dict[str, dict]:
+    """Decode with mouth tracking, first without and then with the per-video box cache"""
+    try:
+        from roi import ROICache, ROIDecoder
+    except ImportError:
+        from backend.roi import ROICache, ROIDecoder
+
+    source = get_decoder(backend, roi='fixed')
+    results = {}
+    for name, cache in (("uncached", ROICache(0)), ("cached", ROICache(len(paths)))):
+        decoder = ROIDecoder(source, cache=cache)
+        clips = iter(paths * (repeats + 2))
+        results[name] = time_calls(lambda: decoder.decode(next(clips)), repeats, warmup=len(paths) if cache.max_entries else 1)
+    return results
+
+
+def bench_normalize(gray: np.ndarray, repeats: int) -> Dict[str, float]:
+    return time_calls(lambda: normalize_frames(gray), repeats)
+
+
+def bench_predict(model, clip: np.ndarray, batch_sizes: Sequence[int], repeats: int) -> Dict[str, dict]:
+    results = {}
+    for batch_size in batch_sizes:
+        batch = np.repeat(clip[np.newaxis], batch_size, axis=0)
+        stats = time_calls(lambda: model.predict(batch, verbose=0), repeats)
+        stats["clips_per_s"] = 1000.0 * batch_size / stats["ms_p50"]
+        results[f"batch{batch_size}"] = stats
+    return results
+
+
+def bench_ctc(batch_sizes: Sequence[int], repeats: int) -> Dict[str, dict]:
+    try:
+        from lipnet_utils import decode_predictions, char_lookup
+        from ctc_decoding import _synthetic_outputs
+    except ImportError:
+        from backend.lipnet_utils import decode_predictions, char_lookup
+        from backend.ctc_decoding import _synthetic_outputs
+    results = {}
+    for batch_size in batch_sizes:
+        yhat = _synthetic_outputs(batch_size, 75, char_lookup)
+        results[f"batch{batch_size}"] = time_calls(lambda: decode_predictions(yhat, [75] * batch_size), repeats)
+    return results
+
+
+async def _http_load(app, payloads: Sequence[bytes], concurrency: int, requests: int) -> Dict[str, float]:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(client, index: int):
+        nonlocal errors
+        data = payloads[index % len(payloads)]
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/predict/upload", files={"file": (f"clip-{index}.avi", data, "video/x-msvideo")}
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[one(client, i) for i in range(requests)])
+        elapsed = time.perf_counter() - started
+    stats = summarize(latencies)
+    stats["requests_per_s"] = requests / elapsed
+    stats["errors"] = errors
+    return stats
+
+
+async def _bench_http(paths: Sequence[str], concurrency_levels: Sequence[int], requests: int, model=None, serving_model=None) -> Dict[str, dict]:
+    try:
+        import main as server
+        from cache import PredictionCache
+    except ImportError:
+        from backend import main as server
+        from backend.cache import PredictionCache
+
+    # Reuse the already-loaded model and measure uncached requests only
+    if serving_model is not None:
+        server.model, server.serving_model = model, serving_model
+    server.prediction_cache = PredictionCache(max_entries=0)
+    await server.startup_event()
+    await server.app.state.prepare_task
+    payloads = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+    results = {}
+    try:
+        await _http_load(server.app, payloads[:1], 1, 1)  # warm-up
+        for concurrency in concurrency_levels:
+            results[f"concurrency{concurrency}"] = await _http_load(server.app, payloads, concurrency, requests)
+    finally:
+        await server.shutdown_event()
+    return results
+
+
+def run_benchmarks(
+    clips: int = 8,
+    batch_sizes: Sequence[int] = (1, 4, 8),
+    concurrency_levels: Sequence[int] = (1, 4, 16),
+    requests: int = 32,
+    repeats: int = 10,
+    backend: str = DEFAULT_BACKEND,
+    skip_http: bool = False,
+    base_dir: Optional[str] = None,
+) -> dict:
+    """Run every stage and return {"meta": ..., "results": {stage: metrics}}"""
+    try:
+        from serving import load_serving_model
+    except ImportError:
+        from backend.serving import load_serving_model
+
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory(prefix='lipnet-bench-') as tmp:
+        paths = synthetic_videos(tmp, clips)
+        results["decode"] = {backend: bench_decode(paths, backend, repeats)}
+        results["roi_decode"] = bench_roi_decode(paths, backend, repeats)
+        gray = get_decoder(backend).decode(paths[0])
+        results["normalize"] = bench_normalize(gray, repeats)
+        clip = normalize_frames(gray)
+
+        model, serving_model = load_serving_model(base_dir)
+        serving_model.warmup()
+        results["predict"] = bench_predict(serving_model, clip, batch_sizes, repeats)
+        results["ctc_decode"] = bench_ctc(batch_sizes, repeats)
+        if not skip_http:
+            results["http_upload"] = asyncio.run(
+                _bench_http(paths, concurrency_levels, requests, model, serving_model)
+            )
+
+    return {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "video_backend": backend,
+            "clips": clips,
+            "repeats": repeats,
+        },
+        "results": results,
+    }
+
+
+def flatten(results: dict, prefix: str = '') -> Dict[str, float]:
+    """{"predict": {"batch4": {"ms_p50": x}}} -> {"predict.batch4.ms_p50": x}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """
+    Relative change of every metric present in both runs. A metric
+    regresses when it is worse than the baseline by more than `threshold`
+    (0.1 = 10%). Error counts regress on any increase.
+    """
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    rows = []
+    for name in sorted(old.keys() & new.keys()):
+        before, after = old[name], new[name]
+        higher_is_better = name.endswith(HIGHER_IS_BETTER)
+        change = (after - before) / before if before else 0.0
+        if name.endswith('errors'):
+            regressed = after > before
+        else:
+            regressed = (-change if higher_is_better else change) > threshold
+        rows.append({"metric": name, "baseline": before, "current": after, "change": change, "regressed": regressed})
+    return rows
+
+
+def print_comparison(rows: List[dict], threshold: float) -> bool:
+    """Print the comparison table; returns True when anything regressed"""
+    for row in rows:
+        flag = "REGRESSION" if row["regressed"] else ""
+        print(f"{row['metric']:<42} {row['baseline']:>10.2f} -> {row['current']:>10.2f}  {row['change']:+7.1%}  {flag}")
+    regressions = [row for row in rows if row["regressed"]]
+    print(f"{len(regressions)} of {len(rows)} metrics regressed beyond {threshold:.0%}")
+    return bool(regressions)
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage LipNet benchmarks with regression checks")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help="Run the benchmark suite")
+    run.add_argument('--out', default=None, help="Write results JSON here")
+    run.add_argument('--clips', type=int, default=8, help="Number of distinct synthetic videos")
+    run.add_argument('--batch-sizes', type=_int_list, default=[1, 4, 8])
+    run.add_argument('--concurrency', type=_int_list, default=[1, 4, 16])
+    run.add_argument('--requests', type=int, default=32, help="HTTP requests per concurrency level")
+    run.add_argument('--repeats', type=int, default=10)
+    run.add_argument('--backend', default=DEFAULT_BACKEND, help="Video decode backend")
+    run.add_argument('--skip-http', action='store_true')
+    run.add_argument('--compare', default=None, help="Baseline JSON to compare against")
+    run.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    cmp = sub.add_parser('compare', help="Compare two result files")
+    cmp.add_argument('baseline')
+    cmp.add_argument('current')
+    cmp.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        report = run_benchmarks(
+            args.clips, args.batch_sizes, args.concurrency, args.requests,
+            args.repeats, args.backend, args.skip_http,
+        )
+        print(json.dumps(report["results"], indent=2))
+        if args.out:
+            os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+            with open(args.out, 'w') as f:
+                json.dump(report, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+            if print_comparison(compare(baseline, report, args.threshold), args.threshold):
+                sys.exit(1)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        if print_comparison(compare(baseline, current, args.threshold), args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Bulk transcription of many clips in one request.
+
+The request carries any number of video files (or frame tensors, see
+frame_tensor.py), or zip/tar archives of them. Members are read one at a time, and only while fewer than
+`concurrency` clips are in flight, so memory stays bounded by that many
+clips however large the archive is. Each clip goes through the normal
+prediction path (cache, decode on the I/O pool, micro-batched inference),
+so clips in flight share forward passes. Results are yielded as each one
+finishes, in completion order, with its index in the request, any
+per-item error and its timings; a final summary record closes the stream.
+"""
+import os
+import zlib
+import time
+import asyncio
+import tarfile
+import zipfile
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Iterable, Iterator, Optional, Tuple
+
+try:
+    from executors import QueueFullError
+    from ingest import (
+        DEFAULT_MAX_UPLOAD_BYTES, TENSOR_SUFFIXES, VIDEO_SUFFIXES, UploadTooLargeError, upload_suffix
+    )
+except ImportError:
+    from backend.executors import QueueFullError
+    from backend.ingest import (
+        DEFAULT_MAX_UPLOAD_BYTES, TENSOR_SUFFIXES, VIDEO_SUFFIXES, UploadTooLargeError, upload_suffix
+    )
+
+DEFAULT_MAX_BULK_BYTES = int(float(os.getenv("LIPNET_BULK_MAX_MB", "2048")) * 1024 * 1024)
+DEFAULT_MAX_BULK_ITEMS = int(os.getenv("LIPNET_BULK_MAX_ITEMS", "10000"))
+DEFAULT_BULK_CONCURRENCY = int(os.getenv("LIPNET_BULK_CONCURRENCY", "8"))
+# Wait before pulling the next item again when the I/O pool is full and nothing is in flight
+BULK_RETRY_SECONDS = 0.05
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+# Damaged or unsupported archive contents: corrupt deflate streams raise zlib.error,
+# encrypted or unsupported zip members RuntimeError / NotImplementedError
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, zlib.error, RuntimeError, OSError, EOFError)
+
+
+class BulkItem:
+    """One clip of a bulk request: its bytes, or the error that kept them from being read"""
+
+    __slots__ = ("index", "name", "suffix", "data", "error", "read_s")
+
+    def __init__(self, index: int, name: str, data: Optional[bytes] = None, error: Optional[str] = None,
+                 read_s: float = 0.0):
+        self.index = index
+        self.name = name
+        self.suffix = upload_suffix(name)
+        self.data = data
+        self.error = error
+        self.read_s = read_s
+
+
+def detach_upload(upload) -> BinaryIO:
+    """
+    An independent handle on an UploadFile's contents. The framework closes
+    (and deletes) its spooled files when the endpoint returns, which is
+    before a streamed response has been sent; a duplicated descriptor keeps
+    the unlinked temp file alive for as long as the stream needs it.
+    """
+    upload.file.flush()
+    handle = os.fdopen(os.dup(upload.file.fileno()), "rb")
+    handle.seek(0)
+    return handle
+
+
+def is_archive(name: str, handle: BinaryIO) -> bool:
+    lower = (name or "").lower()
+    if lower.endswith(ARCHIVE_SUFFIXES):
+        return True
+    if lower.endswith(TENSOR_SUFFIXES):
+        return False  # .npz is a zip too
+    position = handle.tell()
+    magic = handle.read(4)
+    handle.seek(position)
+    return magic == b"PK\x03\x04"
+
+
+def _skipped(name: str) -> bool:
+    """Directories, dotfiles and macOS resource forks inside archives"""
+    base = os.path.basename(name.rstrip("/"))
+    return not base or base.startswith(".") or name.startswith("__MACOSX/") or "/__MACOSX/" in name
+
+
+def _read_limited(handle: BinaryIO, max_bytes: int) -> bytes:
+    data = handle.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+    return data
+
+
+def _zip_members(handle: BinaryIO, max_bytes: int) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+    with zipfile.ZipFile(handle) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or _skipped(info.filename):
+                continue
+            if info.file_size > max_bytes:
+                yield info.filename, _raiser(UploadTooLargeError(max_bytes))
+                continue
+            yield info.filename, lambda info=info: _read_limited(archive.open(info), max_bytes)
+
+
+def _tar_members(handle: BinaryIO, max_bytes: int) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+    with tarfile.open(fileobj=handle, mode="r:*") as archive:
+        for member in archive:
+            if not member.isfile() or _skipped(member.name):
+                continue
+            if member.size > max_bytes:
+                yield member.name, _raiser(UploadTooLargeError(max_bytes))
+                continue
+            yield member.name, lambda member=member: _read_limited(archive.extractfile(member), max_bytes)
+
+
+def _raiser(error: Exception) -> Callable[[], bytes]:
+    def read() -> bytes:
+        raise error
+    return read
+
+
+def _members(name: str, handle: BinaryIO, max_bytes: int) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+    """(clip name, read) pairs for one upload: the file itself, or the videos in an archive"""
+    if not is_archive(name, handle):
+        yield name, lambda: _read_limited(handle, max_bytes)
+        return
+    members = _zip_members if zipfile.is_zipfile(handle) else _tar_members
+    handle.seek(0)
+    for member, read in members(handle, max_bytes):
+        suffix = os.path.splitext(member)[1].lower()
+        if suffix in VIDEO_SUFFIXES or suffix in TENSOR_SUFFIXES:
+            yield member, read
+
+
+def iter_items(
+    sources: Iterable[Tuple[str, BinaryIO]],
+    max_item_bytes: int = DEFAULT_MAX_UPLOAD_BYTES,
+    max_items: int = DEFAULT_MAX_BULK_ITEMS,
+) -> Iterator[BulkItem]:
+    """
+    Expand (filename, handle) uploads into clips. Each clip is read only
+    when the consumer asks for the next item, and archives are walked in
+    order, so compressed tars never seek backwards. Handles are closed once
+    consumed.
+    """
+    index = 0
+    for name, handle in sources:
+        with handle:
+            members = _members(name, handle, max_item_bytes)
+            while True:
+                try:
+                    member, read = next(members)
+                except StopIteration:
+                    break
+                except ARCHIVE_ERRORS as e:
+                    reason = str(e).splitlines()[0] if str(e) else type(e).__name__
+                    yield BulkItem(index, name, error=f"Unreadable archive: {reason}")
+                    index += 1
+                    break
+                if index >= max_items:
+                    yield BulkItem(index, member, error=f"Too many items (limit {max_items})")
+                    return
+                start = time.perf_counter()
+                try:
+                    item = BulkItem(index, member, data=read(), read_s=time.perf_counter() - start)
+                except (UploadTooLargeError,) + ARCHIVE_ERRORS as e:
+                    item = BulkItem(index, member, error=str(e) or type(e).__name__)
+                yield item
+                index += 1
+
+
+async def run_bulk(
+    items: Iterator[BulkItem],
+    predict: Callable[[bytes, str], Awaitable[dict]],
+    run_io: Callable[..., Awaitable[Any]],
+    concurrency: int = DEFAULT_BULK_CONCURRENCY,
+) -> AsyncIterator[dict]:
+    """
+    Predict every item with at most `concurrency` in flight and yield one
+    record per item as it completes, then a {"summary": ...} record.
+    Items are pulled from `items` on the I/O pool, one at a time, only when
+    a slot is free, and a slot frees up only once its record has been
+    consumed, so a slow reader applies backpressure all the way down.
+    When the I/O pool is full, the next pull waits for a clip in flight
+    to finish (or briefly, if none is) instead of failing the stream.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be >= 1")
+    started = time.perf_counter()
+    succeeded = failed = 0
+    pending: set = set()
+    exhausted = False
+
+    async def one(item: BulkItem) -> dict:
+        record = {"index": item.index, "name": item.name}
+        if item.error is not None:
+            return {**record, "success": False, "error": item.error,
+                    "timings": {"read_ms": round(1000.0 * item.read_s, 1)}}
+        begin = time.perf_counter()
+        try:
+            result = await predict(item.data, item.suffix)
+        except Exception as e:
+            record.update(success=False, error=str(e) or type(e).__name__)
+        else:
+            record.update(result)
+        record["timings"] = {
+            "read_ms": round(1000.0 * item.read_s, 1),
+            "predict_ms": round(1000.0 * (time.perf_counter() - begin), 1),
+        }
+        return record
+
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    item = await run_io(next, items, None)
+                except QueueFullError:
+                    if pending:
+                        break
+                    await asyncio.sleep(BULK_RETRY_SECONDS)
+                    continue
+                if item is None:
+                    exhausted = True
+                else:
+                    pending.add(asyncio.create_task(one(item)))
+            if not pending:
+                break
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                record = task.result()
+                if record.get("success"):
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield record
+    finally:
+        # Client went away: stop the clips still in flight
+        for task in pending:
+            task.cancel()
+        if hasattr(items, "close"):
+            try:
+                items.close()
+            except ValueError:
+                pass  # still being advanced on the I/O pool after a cancel
+    yield {"summary": {
+        "items": succeeded + failed,
+        "succeeded": succeeded,
+        "failed": failed,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }}
+
+
+__all__ = [
+    'BulkItem',
+    'detach_upload',
+    'iter_items',
+    'run_bulk',
+    'DEFAULT_MAX_BULK_BYTES',
+    'DEFAULT_MAX_BULK_ITEMS',
+    'DEFAULT_BULK_CONCURRENCY',
+]
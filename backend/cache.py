@@ -0,0 +1,213 @@
+"""Content-addressed prediction cache with request coalescing"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("LIPNET_CACHE_MAX_ENTRIES", "1024"))
+DEFAULT_MAX_BYTES = int(float(os.getenv("LIPNET_CACHE_MAX_MB", "64")) * 1024 * 1024)
+DEFAULT_TTL_SECONDS = float(os.getenv("LIPNET_CACHE_TTL_SECONDS", "3600"))
+DEFAULT_DISK_DIR = os.getenv("LIPNET_CACHE_DIR") or None
+
+
+def content_key(data: bytes, model_version: str) -> str:
+    """Cache key for an upload: sha256 of the bytes plus the model version"""
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{model_version}:{digest}"
+
+
+class DiskCache:
+    """SQLite-backed cache tier that survives restarts"""
+
+    def __init__(self, directory: str, ttl_seconds: float):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "predictions.sqlite3")
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > self.ttl_seconds:
+            self.delete(key)
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO predictions (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM predictions WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM predictions WHERE created < ?", (time.time() - self.ttl_seconds,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PredictionCache:
+    """
+    Two-tier cache of prediction responses.
+
+    The memory tier is an LRU bounded by entry count and approximate size,
+    with per-entry TTL. The optional disk tier is consulted on a memory miss
+    and promoted back into memory on a hit. Concurrent lookups for the same
+    key share one computation.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        disk_dir: Optional[str] = DEFAULT_DISK_DIR,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk = DiskCache(disk_dir, ttl_seconds) if disk_dir and max_entries > 0 else None
+        self._entries: "OrderedDict[str, Tuple[dict, float, int]]" = OrderedDict()
+        self._size = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _get_memory(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, created, size = entry
+        if time.monotonic() - created > self.ttl_seconds:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key: str, value: dict):
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.monotonic(), size)
+        self._size += size
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._size -= size
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = self._get_memory(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.disk_hits += 1
+                self._set_memory(key, value)
+                return value
+        return None
+
+    async def set(self, key: str, value: dict):
+        self._set_memory(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[dict]]) -> Tuple[dict, bool]:
+        """
+        Return (value, cached). Identical keys arriving while a computation
+        is in flight wait for that computation instead of starting another.
+        The computation runs in its own task, so a caller that is cancelled
+        (a client disconnecting, a job being cancelled) stops waiting
+        without cancelling it for the other callers.
+        """
+        if not self.enabled:
+            return await compute(), False
+
+        value = await self.get(key)
+        if value is not None:
+            return value, True
+
+        inflight = self._inflight.get(key)
+        leader = inflight is None
+        if leader:
+            self.misses += 1
+            inflight = asyncio.ensure_future(self._compute(key, compute))
+            # Mark the exception as retrieved when every caller has gone
+            inflight.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._inflight[key] = inflight
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(inflight), not leader
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+        try:
+            value = await compute()
+            await self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "disk_tier": self.disk is not None,
+        }
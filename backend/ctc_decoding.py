@@ -0,0 +1,345 @@
+"""
+NumPy CTC decoding for batched model outputs.
+
+Greedy decoding matches tf.keras.backend.ctc_decode(greedy=True) and is
+vectorized over the batch. Prefix beam search runs per clip in Python
+(its cost grows with batch size, time steps and beam width) and
+optionally constrains hypotheses to a word lexicon or the fixed GRID
+sentence grammar through a character trie.
+
+Latency report:
+    python backend/ctc_decoding.py --widths 1 4 8 16 --constraint grid
+"""
+import math
+import time
+import argparse
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Matches the epsilon tf.keras.backend.ctc_decode adds before taking the log
+_EPSILON = np.float32(1e-7)
+
+
+def build_lookup(vocabulary: Sequence[str]) -> np.ndarray:
+    """
+    Index -> character table. `vocabulary` is num_to_char.get_vocabulary()
+    (OOV "" at index 0). The CTC blank (last class) and any out-of-range
+    index map to "", as num_to_char does.
+    """
+    return np.array(list(vocabulary) + [''], dtype=object)
+
+
+def _lengths(yhat: np.ndarray, input_lengths: Optional[Sequence[int]]) -> np.ndarray:
+    batch, steps = yhat.shape[:2]
+    if input_lengths is None:
+        return np.full(batch, steps, dtype=np.int64)
+    lengths = np.asarray(input_lengths, dtype=np.int64).reshape(-1)
+    if lengths.size == 1 and batch > 1:
+        lengths = np.repeat(lengths, batch)
+    return np.minimum(lengths, steps)
+
+
+def greedy_decode_indices(yhat, input_lengths: Optional[Sequence[int]] = None) -> List[np.ndarray]:
+    """
+    Greedy CTC decode of (N, T, V) softmax outputs into token indices.
+    Repeats are merged and blanks (class V-1) dropped, exactly like
+    tf.keras.backend.ctc_decode(greedy=True).
+    """
+    yhat = np.asarray(yhat, dtype=np.float32)
+    blank = yhat.shape[-1] - 1
+    lengths = _lengths(yhat, input_lengths)
+
+    best = np.argmax(np.log(yhat + _EPSILON), axis=-1)
+    previous = np.empty_like(best)
+    previous[:, 0] = -1
+    previous[:, 1:] = best[:, :-1]
+    valid = np.arange(best.shape[1])[np.newaxis, :] < lengths[:, np.newaxis]
+    keep = (best != blank) & (best != previous) & valid
+    return [best[row][keep[row]] for row in range(best.shape[0])]
+
+
+def indices_to_text(indices: np.ndarray, lookup: np.ndarray) -> str:
+    """Join token indices through the lookup table (out-of-range -> "")"""
+    indices = np.clip(indices, -1, len(lookup) - 1)
+    return ''.join(lookup[indices]).strip()
+
+
+def greedy_decode(yhat, input_lengths: Optional[Sequence[int]], lookup: np.ndarray) -> List[str]:
+    """Greedy CTC decode of a batch straight to text"""
+    return [indices_to_text(tokens, lookup) for tokens in greedy_decode_indices(yhat, input_lengths)]
+
+
+# GRID sentence grammar: command color preposition letter digit adverb
+GRID_GRAMMAR = [
+    ['bin', 'lay', 'place', 'set'],
+    ['blue', 'green', 'red', 'white'],
+    ['at', 'by', 'in', 'with'],
+    [c for c in 'abcdefghijklmnopqrstuvxyz'],
+    ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine'],
+    ['again', 'now', 'please', 'soon'],
+]
+
+_NEG_INF = float('-inf')
+
+
+class _TrieNode:
+    __slots__ = ('children', 'terminal')
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.terminal = False
+
+
+def _build_trie(words: Iterable[str]) -> _TrieNode:
+    root = _TrieNode()
+    for word in words:
+        node = root
+        for ch in word:
+            node = node.children.setdefault(ch, _TrieNode())
+        node.terminal = True
+    return root
+
+
+class WordConstraint:
+    """
+    Character-level automaton over space-separated words.
+
+    `slots` lists the allowed words for each position in the sentence.
+    With `repeat=True` the slots cycle, so a single slot acts as a lexicon
+    allowing any number of words. States are (slot, trie node) pairs, so
+    advancing costs one dict lookup per character.
+    """
+
+    def __init__(self, slots: Sequence[Iterable[str]], repeat: bool = False):
+        if not slots:
+            raise ValueError("At least one word slot is required")
+        self.tries = [_build_trie(words) for words in slots]
+        self.repeat = repeat
+
+    @property
+    def initial(self) -> Tuple[int, _TrieNode]:
+        return 0, self.tries[0]
+
+    def advance(self, state: Tuple[int, _TrieNode], ch: str) -> Optional[Tuple[int, _TrieNode]]:
+        """Next state after appending `ch`, or None if no allowed sentence has this prefix"""
+        slot, node = state
+        if ch == ' ':
+            if not node.terminal:
+                return None
+            if slot + 1 < len(self.tries):
+                return slot + 1, self.tries[slot + 1]
+            return (0, self.tries[0]) if self.repeat else None
+        child = node.children.get(ch)
+        return None if child is None else (slot, child)
+
+    def is_final(self, state: Tuple[int, _TrieNode]) -> bool:
+        """True when the prefix is a complete sentence"""
+        slot, node = state
+        return node.terminal and (self.repeat or slot == len(self.tries) - 1)
+
+
+def grid_constraint() -> WordConstraint:
+    """Constraint accepting only sentences from the GRID grammar"""
+    return WordConstraint(GRID_GRAMMAR)
+
+
+def lexicon_constraint(words: Iterable[str]) -> WordConstraint:
+    """Constraint accepting any sequence of words from `words`"""
+    return WordConstraint([list(words)], repeat=True)
+
+
+def load_constraint(spec: Optional[str]) -> Optional[WordConstraint]:
+    """'grid', a path to a one-word-per-line lexicon file, or None/'none'"""
+    if not spec or spec == 'none':
+        return None
+    if spec == 'grid':
+        return grid_constraint()
+    with open(spec, 'r') as f:
+        return lexicon_constraint(line.strip().lower() for line in f if line.strip())
+
+
+def _logaddexp(a: float, b: float) -> float:
+    if a == _NEG_INF:
+        return b
+    if b == _NEG_INF:
+        return a
+    if a > b:
+        return a + math.log1p(math.exp(b - a))
+    return b + math.log1p(math.exp(a - b))
+
+
+def prefix_beam_search(
+    log_probs: np.ndarray,
+    lookup: np.ndarray,
+    beam_width: int = 8,
+    constraint: Optional[WordConstraint] = None,
+    prune_log_prob: float = -12.0,
+) -> Tuple[int, ...]:
+    """
+    CTC prefix beam search over one (T, V) log-probability matrix.
+    Characters below `prune_log_prob` at a time step are not expanded;
+    with a constraint, extensions that leave the trie are dropped at once.
+    """
+    blank = log_probs.shape[-1] - 1
+    beams: Dict[Tuple[int, ...], List[float]] = {(): [0.0, _NEG_INF]}
+    states = {(): constraint.initial} if constraint is not None else None
+
+    for t in range(log_probs.shape[0]):
+        step = log_probs[t]
+        candidates = np.nonzero(step > prune_log_prob)[0].tolist()
+        if not candidates:
+            candidates = [int(np.argmax(step))]
+        blank_lp = float(step[blank])
+        next_beams: Dict[Tuple[int, ...], List[float]] = {}
+
+        for prefix, (p_b, p_nb) in beams.items():
+            total = _logaddexp(p_b, p_nb)
+            entry = next_beams.setdefault(prefix, [_NEG_INF, _NEG_INF])
+            entry[0] = _logaddexp(entry[0], total + blank_lp)
+            last = prefix[-1] if prefix else None
+
+            for c in candidates:
+                if c == blank:
+                    continue
+                lp = float(step[c])
+                if c == last:
+                    # Repeat without a blank in between collapses into the prefix
+                    entry[1] = _logaddexp(entry[1], p_nb + lp)
+                    extend = p_b + lp
+                else:
+                    extend = total + lp
+                new_prefix = prefix + (c,)
+                if states is not None and new_prefix not in states:
+                    state = constraint.advance(states[prefix], lookup[c])
+                    if state is None:
+                        continue
+                    states[new_prefix] = state
+                new_entry = next_beams.setdefault(new_prefix, [_NEG_INF, _NEG_INF])
+                new_entry[1] = _logaddexp(new_entry[1], extend)
+
+        ranked = sorted(next_beams.items(), key=lambda kv: _logaddexp(*kv[1]), reverse=True)
+        beams = dict(ranked[:beam_width])
+
+    ranked = sorted(beams.items(), key=lambda kv: _logaddexp(*kv[1]), reverse=True)
+    if states is not None:
+        for prefix, _ in ranked:
+            if constraint.is_final(states[prefix]):
+                return prefix
+    return ranked[0][0]
+
+
+def beam_search_decode(
+    yhat,
+    input_lengths: Optional[Sequence[int]],
+    lookup: np.ndarray,
+    beam_width: int = 8,
+    constraint: Optional[WordConstraint] = None,
+) -> List[str]:
+    """
+    Prefix beam search over a (N, T, V) batch, one string per clip. The
+    log-softmax is taken once for the batch; the search itself loops over
+    clips, so latency is per clip rather than per batch.
+    """
+    yhat = np.asarray(yhat, dtype=np.float32)
+    lengths = _lengths(yhat, input_lengths)
+    log_probs = np.log(yhat + _EPSILON)
+    return [
+        indices_to_text(
+            np.array(prefix_beam_search(log_probs[row, :lengths[row]], lookup, beam_width, constraint), dtype=np.int64),
+            lookup,
+        )
+        for row in range(yhat.shape[0])
+    ]
+
+
+def decode(
+    yhat,
+    input_lengths: Optional[Sequence[int]],
+    lookup: np.ndarray,
+    beam_width: int = 0,
+    constraint: Optional[WordConstraint] = None,
+) -> List[str]:
+    """Greedy when `beam_width` <= 1 and unconstrained, else prefix beam search"""
+    if beam_width <= 1 and constraint is None:
+        return greedy_decode(yhat, input_lengths, lookup)
+    return beam_search_decode(yhat, input_lengths, lookup, max(beam_width, 1), constraint)
+
+
+def latency_report(
+    yhat,
+    input_lengths: Optional[Sequence[int]],
+    lookup: np.ndarray,
+    widths: Sequence[int] = (1, 4, 8, 16),
+    constraint: Optional[WordConstraint] = None,
+    repeats: int = 3,
+) -> List[dict]:
+    """Per-clip decode latency for each beam width (width 1 unconstrained is greedy)"""
+    batch = np.asarray(yhat).shape[0]
+    report = []
+    for width in widths:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            decode(yhat, input_lengths, lookup, width, constraint)
+            timings.append(time.perf_counter() - start)
+        report.append({
+            "beam_width": width,
+            "constrained": constraint is not None,
+            "batch_size": batch,
+            "ms_per_clip": 1000.0 * min(timings) / batch,
+        })
+    return report
+
+
+def _synthetic_outputs(batch: int, steps: int, lookup: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Peaky softmax outputs spelling random GRID sentences, for latency tests"""
+    rng = np.random.default_rng(seed)
+    classes = len(lookup)
+    char_index = {ch: i for i, ch in enumerate(lookup[:-1]) if ch}
+    logits = rng.normal(0.0, 1.0, (batch, steps, classes)).astype(np.float32)
+    for row in range(batch):
+        sentence = ' '.join(rng.choice(words) for words in GRID_GRAMMAR)
+        positions = np.linspace(0, steps - 1, num=len(sentence), dtype=int)
+        logits[row, :, -1] += 4.0
+        for pos, ch in zip(positions, sentence):
+            logits[row, pos, char_index[ch]] += 8.0
+    probs = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return probs / probs.sum(axis=-1, keepdims=True)
+
+
+__all__ = [
+    'build_lookup',
+    'greedy_decode_indices',
+    'greedy_decode',
+    'indices_to_text',
+    'GRID_GRAMMAR',
+    'WordConstraint',
+    'grid_constraint',
+    'lexicon_constraint',
+    'load_constraint',
+    'prefix_beam_search',
+    'beam_search_decode',
+    'decode',
+    'latency_report',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report CTC decode latency per beam width")
+    parser.add_argument('--widths', type=int, nargs='+', default=[1, 4, 8, 16], help="Beam widths to time")
+    parser.add_argument('--constraint', default='none', help="'none', 'grid' or a lexicon file")
+    parser.add_argument('--batch-size', type=int, default=8, help="Clips per batch")
+    parser.add_argument('--outputs', default=None, help="Optional .npy of (N, T, V) model outputs")
+    args = parser.parse_args()
+
+    vocab = [x for x in "abcdefghijklmnopqrstuvwxyz'?!123456789 "]
+    lookup = build_lookup([''] + vocab)
+    yhat = np.load(args.outputs) if args.outputs else _synthetic_outputs(args.batch_size, 75, lookup)
+    for row in latency_report(yhat, None, lookup, args.widths, load_constraint(args.constraint)):
+        print(f"beam_width={row['beam_width']:>3} constrained={row['constrained']!s:<5} "
+              f"{row['ms_per_clip']:.2f} ms/clip")
+
+
+if __name__ == "__main__":
+    main()
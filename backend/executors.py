@@ -0,0 +1,283 @@
+"""Execution layer that keeps blocking work off the asyncio event loop"""
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+
+DEFAULT_IO_WORKERS = int(os.getenv("LIPNET_IO_WORKERS", "4"))
+DEFAULT_INFERENCE_PROCESSES = int(os.getenv("LIPNET_INFERENCE_PROCESSES", "0"))
+DEFAULT_MAX_PENDING_IO = int(os.getenv("LIPNET_MAX_PENDING_IO", "64"))
+DEFAULT_MAX_PENDING_INFERENCE = int(os.getenv("LIPNET_MAX_PENDING_INFERENCE", "16"))
+# Pin each inference process to its own block of CPUs
+DEFAULT_PIN_WORKERS = os.getenv("LIPNET_PIN_WORKERS", "1") == "1"
+# Shared-memory weight buffer instead of a checkpoint restore per process
+DEFAULT_SHARE_WEIGHTS = os.getenv("LIPNET_SHARE_WEIGHTS", "1") == "1"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a pool already has its maximum number of pending tasks"""
+
+
+# Model owned by an inference worker process (set by _init_inference_worker)
+_worker_model = None
+_worker_info: dict = {}
+# Shared by the pool's workers so each warm-up call is held by a different one
+_ready_barrier = None
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_cpus(index: int, workers: int, cpus: Sequence[int]) -> List[int]:
+    """
+    The contiguous block of `cpus` for worker `index` of `workers`; every
+    CPU when there are fewer CPUs than workers. Leftover CPUs go unused
+    so each worker gets the same share.
+    """
+    share = len(cpus) // workers
+    if share == 0:
+        return list(cpus)
+    return list(cpus[index * share:(index + 1) * share])
+
+
+def worker_threads(workers: int, cpus: int) -> tuple:
+    """(intra_op, inter_op) per inference process: its share of the cores, one inter-op thread"""
+    try:
+        from serving import DEFAULT_INTRA_OP_THREADS, DEFAULT_INTER_OP_THREADS
+    except ImportError:
+        from backend.serving import DEFAULT_INTRA_OP_THREADS, DEFAULT_INTER_OP_THREADS
+    return DEFAULT_INTRA_OP_THREADS or max(1, cpus // workers), DEFAULT_INTER_OP_THREADS or 1
+
+
+def _init_inference_worker(base_dir: str, counter, barrier, workers: int, pin: bool, share_weights: bool):
+    """Pin, size thread pools, then load and warm up the configured engine once per inference process"""
+    global _worker_model, _worker_info, _ready_barrier
+    _ready_barrier = barrier
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    cpus = available_cpus()
+    mine = worker_cpus(index, workers, cpus)
+    pinned = pin and hasattr(os, "sched_setaffinity") and len(mine) < len(cpus)
+    if pinned:
+        os.sched_setaffinity(0, mine)
+    intra_op, inter_op = worker_threads(workers, len(cpus))
+    # OpenMP builds of oneDNN read this when TensorFlow loads them
+    os.environ.setdefault("OMP_NUM_THREADS", str(intra_op))
+    try:
+        from serving import DEFAULT_ENGINE, load_serving_model
+        from shared_weights import publish_shared
+    except ImportError:
+        from backend.serving import DEFAULT_ENGINE, load_serving_model
+        from backend.shared_weights import publish_shared
+    timings: dict = {}
+    threads = (intra_op, inter_op)
+    shared_path = None
+    if share_weights and DEFAULT_ENGINE == 'keras':
+        start = time.perf_counter()
+        shared_path = publish_shared(base_dir, threads=threads)
+        timings['publish_shared'] = round(time.perf_counter() - start, 3)
+    if shared_path is not None:
+        _, _worker_model = load_serving_model(
+            base_dir, 'tflite', timings, threads, model_path=shared_path, mapped=True
+        )
+    else:
+        _, _worker_model = load_serving_model(base_dir, timings=timings, threads=threads, mapped=share_weights)
+    _worker_model.warmup()
+    _worker_info = {
+        "pid": os.getpid(),
+        "index": index,
+        "cpus": mine if pinned else None,
+        "intra_op_threads": intra_op,
+        "inter_op_threads": inter_op,
+        "shared_model": shared_path,
+        "timings": timings,
+    }
+
+
+def _process_ready() -> dict:
+    """
+    Returns once the worker's initializer (load + warm-up) has finished:
+    the worker's settings, and whether it serves trained weights. Waits at
+    the pool's barrier first, so a worker cannot answer more than one of
+    the pool-size calls made by `ExecutionLayer.warmup`.
+    """
+    _ready_barrier.wait()
+    loaded = _worker_model is not None and _worker_model.ready and _worker_model.weights_loaded
+    return {**_worker_info, "weights_loaded": bool(loaded)}
+
+
+def _process_predict(video_batch: np.ndarray) -> np.ndarray:
+    """Forward pass inside an inference worker process"""
+    return np.asarray(_worker_model.predict(video_batch, verbose=0))
+
+
+class _BoundedPool:
+    """Executor wrapper that rejects work once `max_pending` tasks are in flight"""
+
+    def __init__(self, name: str, executor, max_pending: int):
+        self.name = name
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+
+    async def submit(self, fn: Callable, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise QueueFullError(f"{self.name} queue is full ({self.max_pending} pending)")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+        }
+
+
+class ExecutionLayer:
+    """
+    Thread pool for file I/O and video decode, plus a pool for CPU-bound
+    inference.
+
+    With `inference_processes > 0` inference runs in a process pool. Each
+    worker is pinned to its own block of CPUs with TensorFlow's thread
+    pools sized to match, so workers do not oversubscribe cores. With
+    `share_weights` the workers serve one float32 TFLite export that the
+    first worker converts once and all of them memory-map, so the weights
+    are held once rather than per process (see shared_weights.py). With
+    `0` inference runs on a single dedicated thread against the in-process
+    model returned by `get_model`; TensorFlow releases the GIL during the
+    forward pass, so decode threads still overlap with it.
+    """
+
+    def __init__(
+        self,
+        get_model: Optional[Callable] = None,
+        io_workers: int = DEFAULT_IO_WORKERS,
+        inference_processes: int = DEFAULT_INFERENCE_PROCESSES,
+        max_pending_io: int = DEFAULT_MAX_PENDING_IO,
+        max_pending_inference: int = DEFAULT_MAX_PENDING_INFERENCE,
+        base_dir: Optional[str] = None,
+        pin_workers: bool = DEFAULT_PIN_WORKERS,
+        share_weights: bool = DEFAULT_SHARE_WEIGHTS,
+    ):
+        if io_workers < 1:
+            raise ValueError("io_workers must be >= 1")
+        if inference_processes < 0:
+            raise ValueError("inference_processes must be >= 0")
+        self.get_model = get_model
+        self.io_workers = io_workers
+        self.inference_processes = inference_processes
+        self.max_pending_io = max_pending_io
+        self.max_pending_inference = max_pending_inference
+        self.base_dir = base_dir or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.pin_workers = pin_workers
+        self.share_weights = share_weights
+        # Settings reported by each inference process once warmed up, by pid
+        self.workers: dict = {}
+        self._io: Optional[_BoundedPool] = None
+        self._inference: Optional[_BoundedPool] = None
+        self.warmed_up = False
+        # Whether every inference process restored trained weights (process mode)
+        self.weights_loaded = False
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.inference_processes > 0
+
+    def start(self):
+        """Create the pools (idempotent)"""
+        if self._io is not None:
+            return
+        self._io = _BoundedPool(
+            "io",
+            ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="lipnet-io"),
+            self.max_pending_io,
+        )
+        if self.uses_processes:
+            # spawn, not fork: TensorFlow's runtime is not fork-safe
+            context = multiprocessing.get_context("spawn")
+            executor = ProcessPoolExecutor(
+                max_workers=self.inference_processes,
+                mp_context=context,
+                initializer=_init_inference_worker,
+                initargs=(self.base_dir, context.Value("i", 0), context.Barrier(self.inference_processes),
+                          self.inference_processes, self.pin_workers, self.share_weights),
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lipnet-inference")
+        self._inference = _BoundedPool("inference", executor, self.max_pending_inference)
+
+    def shutdown(self, wait: bool = True):
+        self.warmed_up = False
+        for pool in (self._io, self._inference):
+            if pool is not None:
+                pool.executor.shutdown(wait=wait, cancel_futures=True)
+        self._io = None
+        self._inference = None
+
+    async def run_io(self, fn: Callable, *args):
+        """Run a blocking I/O or decode call on the I/O thread pool"""
+        self.start()
+        return await self._io.submit(fn, *args)
+
+    async def predict(self, video_batch: np.ndarray) -> np.ndarray:
+        """Run one forward pass over a `(N, T, H, W, C)` batch"""
+        self.start()
+        if self.uses_processes:
+            return await self._inference.submit(_process_predict, video_batch)
+        return await self._inference.submit(self._thread_predict, video_batch)
+
+    async def run_inference(self, fn: Callable, *args):
+        """
+        Run `fn` on the in-process inference thread, serialized with
+        `predict`. Only available without inference processes.
+        """
+        self.start()
+        if self.uses_processes:
+            raise RuntimeError("run_inference needs in-process inference (LIPNET_INFERENCE_PROCESSES=0)")
+        return await self._inference.submit(fn, *args)
+
+    async def warmup(self):
+        """Start every inference process and wait until each has warmed up"""
+        self.start()
+        if self.uses_processes:
+            loop = asyncio.get_running_loop()
+            executor = self._inference.executor
+            # Process pools spawn workers on demand; one call per worker starts them all, and
+            # the barrier in _process_ready keeps any worker from answering two of them
+            reports = await asyncio.gather(*[
+                loop.run_in_executor(executor, _process_ready) for _ in range(self.inference_processes)
+            ])
+            workers = {report["pid"]: report for report in reports}
+            if len(workers) != self.inference_processes:
+                raise RuntimeError(f"{len(workers)} of {self.inference_processes} inference processes reported ready")
+            self.workers = workers
+            self.weights_loaded = all(report["weights_loaded"] for report in reports)
+        self.warmed_up = True
+
+    def _thread_predict(self, video_batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.get_model().predict(video_batch, verbose=0))
+
+    def stats(self) -> dict:
+        return {
+            "io_workers": self.io_workers,
+            "inference_processes": self.inference_processes,
+            "workers": list(self.workers.values()),
+            "io": self._io.stats() if self._io is not None else None,
+            "inference": self._inference.stats() if self._inference is not None else None,
+        }
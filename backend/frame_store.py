@@ -0,0 +1,199 @@
+"""
+Preprocessed frame store for the GRID dataset.
+
+Cropped mouth frames are written once into fixed-shape, memory-mapped
+.npy shards plus an index.json, so training and evaluation read clips
+without decoding video again.
+
+Usage:
+    python backend/frame_store.py --videos data/s1 --out data/frame_store --dtype uint8
+"""
+import os
+import glob
+import json
+import time
+import argparse
+from typing import Dict, Optional
+
+import numpy as np
+
+try:
+    from video_io import EMPTY_SHAPE, get_decoder, normalize_frames, normalization_params
+except ImportError:
+    from backend.video_io import EMPTY_SHAPE, get_decoder, normalize_frames, normalization_params
+
+
+DEFAULT_STORE_DIR = os.getenv("LIPNET_FRAME_STORE", os.path.join('data', 'frame_store'))
+INDEX_FILE = 'index.json'
+FRAME_SHAPE = EMPTY_SHAPE
+STORE_DTYPES = ('uint8', 'float16', 'float32')
+
+
+def _shard_name(shard: int) -> str:
+    return f"shard-{shard:05d}.npy"
+
+
+class FrameStore:
+    """
+    Read side of the store.
+
+    `uint8` shards hold the raw grayscale crop and the index holds each
+    clip's normalization parameters, so reads reproduce load_video exactly.
+    `float16`/`float32` shards hold normalized frames. Only float32 reads
+    are views of the memory map: uint8 reads are normalized into a new
+    float32 array and float16 reads are cast into one, so both copy the
+    clip (a quarter and a half of the float32 disk size, respectively).
+    Clips longer than 75 frames are truncated.
+    """
+
+    def __init__(self, directory: str = DEFAULT_STORE_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        self.dtype = index['dtype']
+        self.frame_shape = tuple(index['frame_shape'])
+        self.clips: Dict[str, dict] = index['clips']
+        self._shards: Dict[int, np.ndarray] = {}
+
+    @classmethod
+    def open(cls, directory: str = DEFAULT_STORE_DIR) -> Optional["FrameStore"]:
+        """Open a store if one exists at `directory`, else return None"""
+        if not os.path.exists(os.path.join(directory, INDEX_FILE)):
+            return None
+        return cls(directory)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.clips
+
+    def __len__(self) -> int:
+        return len(self.clips)
+
+    def _shard(self, shard: int) -> np.ndarray:
+        if shard not in self._shards:
+            self._shards[shard] = np.load(os.path.join(self.directory, _shard_name(shard)), mmap_mode='r')
+        return self._shards[shard]
+
+    def is_stale(self, name: str, source_path: Optional[str] = None) -> bool:
+        """True when the clip is missing or its source video changed since it was stored"""
+        entry = self.clips.get(name)
+        if entry is None:
+            return True
+        source_path = source_path or entry['source']
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            # Source removed: the stored copy is all there is
+            return False
+        return stat.st_mtime != entry['mtime'] or stat.st_size != entry['size']
+
+    def get(self, name: str) -> np.ndarray:
+        """
+        Return the normalized (T, 46, 140, 1) float32 frames for a clip:
+        a read-only view of the shard for float32 stores, a copy otherwise
+        """
+        entry = self.clips[name]
+        if entry['frames'] == 0:
+            return np.zeros(FRAME_SHAPE, dtype=np.float32)
+        frames = self._shard(entry['shard'])[entry['row'], :entry['frames']]
+        if self.dtype == 'uint8':
+            return normalize_frames(frames, entry['mean'], entry['std'])
+        if self.dtype == 'float32':
+            return frames
+        return frames.astype(np.float32)
+
+    def load(self, name: str, source_path: Optional[str] = None) -> Optional[np.ndarray]:
+        """Frames for `name` if stored and fresh, else None"""
+        if self.is_stale(name, source_path):
+            return None
+        return self.get(name)
+
+
+def build_frame_store(
+    video_dir: str,
+    out_dir: str = DEFAULT_STORE_DIR,
+    dtype: str = 'uint8',
+    shard_size: int = 256,
+    backend: Optional[str] = None,
+    pattern: str = '*.mpg',
+) -> int:
+    """
+    Decode every video in `video_dir` into memory-mapped shards.
+    Returns the number of clips stored.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"dtype must be one of {STORE_DTYPES}")
+    decoder = get_decoder(backend)
+    paths = sorted(glob.glob(os.path.join(video_dir, pattern)))
+    os.makedirs(out_dir, exist_ok=True)
+
+    clips = {}
+    shard = None
+    shard_index = -1
+    for i, path in enumerate(paths):
+        row = i % shard_size
+        if row == 0:
+            if shard is not None:
+                shard.flush()
+            shard_index += 1
+            rows = min(shard_size, len(paths) - i)
+            shard = np.lib.format.open_memmap(
+                os.path.join(out_dir, _shard_name(shard_index)),
+                mode='w+', dtype=dtype, shape=(rows,) + FRAME_SHAPE,
+            )
+
+        gray = decoder.decode(path)
+        if gray.shape[1:] != FRAME_SHAPE[1:]:
+            print(f"Skipping {path}: unexpected crop shape {gray.shape[1:]}")
+            gray = gray[:0]
+        mean, std = normalization_params(gray) if gray.size else (0, 0.0)
+        gray = gray[:FRAME_SHAPE[0]]
+        frames = gray if dtype == 'uint8' else normalize_frames(gray, mean, std).astype(dtype)
+        count = gray.shape[0]
+        shard[row, :count] = frames[:count]
+        shard[row, count:] = 0
+
+        stat = os.stat(path)
+        name = os.path.splitext(os.path.basename(path))[0]
+        clips[name] = {
+            'shard': shard_index,
+            'row': row,
+            'frames': count,
+            'mean': mean,
+            'std': std,
+            'source': path,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+        }
+
+    if shard is not None:
+        shard.flush()
+
+    index = {
+        'dtype': dtype,
+        'frame_shape': list(FRAME_SHAPE),
+        'created': time.time(),
+        'clips': clips,
+    }
+    tmp_index = os.path.join(out_dir, INDEX_FILE + '.tmp')
+    with open(tmp_index, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_index, os.path.join(out_dir, INDEX_FILE))
+    return len(clips)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess GRID videos into a memory-mapped frame store")
+    parser.add_argument('--videos', default=os.path.join('data', 's1'), help="Directory of source videos")
+    parser.add_argument('--out', default=DEFAULT_STORE_DIR, help="Output directory for shards and index")
+    parser.add_argument('--dtype', default='uint8', choices=STORE_DTYPES, help="Storage dtype")
+    parser.add_argument('--shard-size', type=int, default=256, help="Clips per shard")
+    parser.add_argument('--backend', default=None, help="Video decoder backend (opencv or ffmpeg)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = build_frame_store(args.videos, args.out, args.dtype, args.shard_size, args.backend)
+    print(f"Stored {count} clips in {args.out} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
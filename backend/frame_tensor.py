@@ -0,0 +1,306 @@
+"""
+Pre-extracted mouth-crop tensors as an alternative to encoded video.
+
+The model only needs (T, 46, 140) uint8 grayscale crops. A client that
+crops locally can upload those instead of a video and the server skips
+decode, grayscale conversion and cropping; normalization and inference are
+unchanged. Accepted payloads:
+
+- `.npy`: a (T, 46, 140) or (T, 46, 140, 1) uint8 array.
+- `.npz`: the same array under `frames` (or as the only array), with an
+  optional scalar `fps`.
+- `.lipf`: an 18-byte header (magic `LIPF`, version, codec, flags, frame
+  count, height, width, fps as float32, little-endian) followed by the
+  frames, compressed with zlib, zstd or lz4 and, with the delta flag set,
+  stored as differences from the previous frame (mod 256), which
+  compress better when little moves between frames.
+
+zstd and lz4 need the optional `zstandard` / `lz4` packages; zlib always
+works.
+
+Usage:
+    python backend/frame_tensor.py clip.mpg clip.lipf --codec zstd
+"""
+import io
+import os
+import math
+import zlib
+import struct
+import zipfile
+import argparse
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    from ingest import TENSOR_SUFFIXES
+    from video_io import EMPTY_SHAPE, get_decoder
+except ImportError:
+    from backend.ingest import TENSOR_SUFFIXES
+    from backend.video_io import EMPTY_SHAPE, get_decoder
+
+FRAME_SIZE = EMPTY_SHAPE[1:3]
+# Decompressed size guard: 10 minutes of 25 fps video is 15000 frames (~97 MB)
+DEFAULT_MAX_TENSOR_FRAMES = int(os.getenv("LIPNET_TENSOR_MAX_FRAMES", "15000"))
+
+MAGIC = b"LIPF"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBxHHHf")
+CODECS = {'none': 0, 'zlib': 1, 'zstd': 2, 'lz4': 3}
+FLAG_DELTA = 1
+NPY_MAGIC = b"\x93NUMPY"
+
+
+class FrameTensorError(ValueError):
+    """Raised for a frame-tensor payload that cannot be used as model input"""
+
+
+def is_frame_tensor(data: bytes, suffix: Optional[str] = None) -> bool:
+    """True for .npy/.npz/.lipf uploads, by suffix or (npy, lipf) magic bytes"""
+    if suffix and suffix.lower() in TENSOR_SUFFIXES:
+        return True
+    return data[:4] == MAGIC or data[:6] == NPY_MAGIC
+
+
+def _module(codec: str):
+    try:
+        if codec == 'zstd':
+            import zstandard
+            return zstandard
+        import lz4.frame
+        return lz4.frame
+    except ImportError:
+        package = 'zstandard' if codec == 'zstd' else 'lz4'
+        raise FrameTensorError(f"Codec '{codec}' needs the '{package}' package") from None
+
+
+def compress(raw: bytes, codec: str, level: Optional[int] = None) -> bytes:
+    if codec == 'none':
+        return raw
+    if codec == 'zlib':
+        return zlib.compress(raw, 6 if level is None else level)
+    if codec == 'zstd':
+        return _module(codec).ZstdCompressor(level=3 if level is None else level).compress(raw)
+    if codec == 'lz4':
+        return _module(codec).compress(raw, compression_level=0 if level is None else level)
+    raise FrameTensorError(f"Unknown codec '{codec}'. Choose from: {', '.join(CODECS)}")
+
+
+def decompress(payload: bytes, codec: str, size: int) -> bytes:
+    """Decompress at most `size` bytes, so a forged header cannot inflate past the frame limit"""
+    if codec == 'none':
+        return payload
+    if codec == 'zlib':
+        inflater = zlib.decompressobj()
+        raw = inflater.decompress(payload, size)
+        if inflater.unconsumed_tail:
+            raise FrameTensorError("Payload is larger than its header says")
+        if not inflater.eof:
+            raise FrameTensorError("Truncated frame tensor payload")
+        return raw
+    if codec == 'zstd':
+        # Read one byte past the limit: a frame header's content size is not trusted
+        reader = _module(codec).ZstdDecompressor().stream_reader(payload)
+        chunks, remaining = [], size + 1
+        while remaining:
+            chunk = reader.read(remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        raw = b"".join(chunks)
+        if len(raw) > size:
+            raise FrameTensorError("Payload is larger than its header says")
+        return raw
+    decompressor = _module(codec).LZ4FrameDecompressor()
+    raw = decompressor.decompress(payload, max_length=size)
+    if not decompressor.eof:
+        raise FrameTensorError("Payload is larger than its header says")
+    return raw
+
+
+def delta_encode(frames: np.ndarray) -> np.ndarray:
+    out = frames.copy()
+    np.subtract(frames[1:], frames[:-1], out=out[1:], dtype=np.uint8)
+    return out
+
+
+def delta_decode(deltas: np.ndarray) -> np.ndarray:
+    return np.cumsum(deltas, axis=0, dtype=np.uint8)
+
+
+def _check_layout(dtype: np.dtype, shape: Tuple[int, ...], max_frames: int):
+    if dtype != np.uint8:
+        raise FrameTensorError(f"Frames must be uint8 grayscale crops, got {dtype}")
+    if len(shape) == 4 and shape[-1] == 1:
+        shape = shape[:-1]
+    if len(shape) != 3 or tuple(shape[1:]) != FRAME_SIZE:
+        raise FrameTensorError(
+            f"Frames must have shape (T, {FRAME_SIZE[0]}, {FRAME_SIZE[1]}[, 1]), got {tuple(shape)}"
+        )
+    if shape[0] > max_frames:
+        raise FrameTensorError(f"Too many frames ({shape[0]} > {max_frames})")
+
+
+def check_frames(frames: np.ndarray, max_frames: int = DEFAULT_MAX_TENSOR_FRAMES) -> np.ndarray:
+    """Validate uint8 mouth crops and return them as (T, 46, 140, 1)"""
+    _check_layout(frames.dtype, frames.shape, max_frames)
+    if frames.ndim == 4:
+        frames = frames[..., 0]
+    return np.ascontiguousarray(frames)[..., np.newaxis]
+
+
+def encode_frames(
+    frames: np.ndarray,
+    codec: str = 'zlib',
+    delta: bool = True,
+    fps: Optional[float] = None,
+    level: Optional[int] = None,
+) -> bytes:
+    """Pack (T, 46, 140[, 1]) uint8 crops into a .lipf payload"""
+    frames = check_frames(np.asarray(frames), max_frames=np.iinfo(np.uint16).max)[..., 0]
+    if codec not in CODECS:
+        raise FrameTensorError(f"Unknown codec '{codec}'. Choose from: {', '.join(CODECS)}")
+    body = delta_encode(frames) if delta and len(frames) else frames
+    header = HEADER.pack(MAGIC, VERSION, CODECS[codec], FLAG_DELTA if delta else 0,
+                         frames.shape[0], FRAME_SIZE[0], FRAME_SIZE[1], fps or 0.0)
+    return header + compress(body.tobytes(), codec, level)
+
+
+def _decode_lipf(data: bytes, max_frames: int) -> Tuple[np.ndarray, Optional[float]]:
+    if len(data) < HEADER.size:
+        raise FrameTensorError("Truncated frame tensor header")
+    magic, version, codec_id, flags, count, height, width, fps = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise FrameTensorError("Not a version 1 .lipf payload")
+    codec = next((name for name, value in CODECS.items() if value == codec_id), None)
+    if codec is None:
+        raise FrameTensorError(f"Unknown codec id {codec_id}")
+    if (height, width) != FRAME_SIZE:
+        raise FrameTensorError(f"Frames must be {FRAME_SIZE[0]}x{FRAME_SIZE[1]}, got {height}x{width}")
+    if count > max_frames:
+        raise FrameTensorError(f"Too many frames ({count} > {max_frames})")
+    size = count * height * width
+    raw = decompress(data[HEADER.size:], codec, size)
+    if len(raw) != size:
+        raise FrameTensorError(f"Expected {size} bytes of frames, got {len(raw)}")
+    frames = np.frombuffer(raw, dtype=np.uint8).reshape(count, height, width)
+    if flags & FLAG_DELTA:
+        frames = delta_decode(frames)
+    return frames[..., np.newaxis], (float(fps) or None)
+
+
+def _npy_header(handle) -> Tuple[Tuple[int, ...], bool, np.dtype]:
+    version = np.lib.format.read_magic(handle)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(handle)
+    if version == (2, 0):
+        return np.lib.format.read_array_header_2_0(handle)
+    raise FrameTensorError(f"Unsupported .npy version {version[0]}.{version[1]}")
+
+
+def _read_npy_body(handle, shape: Tuple[int, ...], fortran_order: bool, dtype: np.dtype) -> np.ndarray:
+    if dtype.hasobject:
+        raise FrameTensorError("Object arrays are not accepted")
+    size = math.prod(shape) * dtype.itemsize
+    raw = handle.read(size)
+    if len(raw) != size:
+        raise FrameTensorError("Truncated .npy payload")
+    return np.frombuffer(raw, dtype=dtype).reshape(shape, order='F' if fortran_order else 'C')
+
+
+def _load_npy_frames(handle, max_frames: int) -> np.ndarray:
+    """
+    Read frames from an .npy stream, checking the header's dtype and shape
+    first: np.load would allocate whatever shape a forged header declares.
+    """
+    shape, fortran_order, dtype = _npy_header(handle)
+    _check_layout(dtype, shape, max_frames)
+    return _read_npy_body(handle, shape, fortran_order, dtype)
+
+
+def _load_npy_fps(handle) -> Optional[float]:
+    shape, fortran_order, dtype = _npy_header(handle)
+    if math.prod(shape) != 1 or dtype.kind not in 'iuf':
+        raise FrameTensorError(f"'fps' must be a single number, got {dtype} array of shape {shape}")
+    fps = float(_read_npy_body(handle, shape, fortran_order, dtype).reshape(()))
+    if not np.isfinite(fps) or fps < 0:
+        raise FrameTensorError(f"Invalid fps {fps}")
+    return fps or None
+
+
+def _decode_npz(data: bytes, max_frames: int) -> Tuple[np.ndarray, Optional[float]]:
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            arrays = {info.filename[:-len('.npy')]: info for info in archive.infolist()
+                      if info.filename.endswith('.npy')}
+            names = [name for name in arrays if name != 'fps']
+            if 'frames' in arrays:
+                name = 'frames'
+            elif len(names) == 1:
+                name = names[0]
+            else:
+                raise FrameTensorError("An .npz payload needs a 'frames' array")
+            with archive.open(arrays[name]) as member:
+                frames = _load_npy_frames(member, max_frames)
+            fps = None
+            if 'fps' in arrays:
+                with archive.open(arrays['fps']) as member:
+                    fps = _load_npy_fps(member)
+    except zipfile.BadZipFile as e:
+        raise FrameTensorError(f"Unreadable .npz: {e}") from None
+    return frames, fps
+
+
+def decode_frame_tensor(
+    data: bytes,
+    suffix: Optional[str] = None,
+    max_frames: int = DEFAULT_MAX_TENSOR_FRAMES,
+) -> Tuple[np.ndarray, Optional[float]]:
+    """
+    Return ((T, 46, 140, 1) uint8 crops, fps or None) for a .lipf, .npz or
+    .npy payload. Raises FrameTensorError for anything else.
+    """
+    suffix = (suffix or '').lower()
+    try:
+        if data[:4] == MAGIC:
+            frames, fps = _decode_lipf(data, max_frames)
+        elif suffix == '.npz' or data[:4] == b"PK\x03\x04":
+            frames, fps = _decode_npz(data, max_frames)
+        elif data[:6] == NPY_MAGIC:
+            frames, fps = _load_npy_frames(io.BytesIO(data), max_frames), None
+        else:
+            raise FrameTensorError("Unrecognized frame tensor payload")
+    except FrameTensorError:
+        raise
+    except (OSError, EOFError, ValueError, MemoryError, zlib.error) as e:
+        raise FrameTensorError(f"Unreadable frame tensor: {e}") from None
+    return check_frames(frames, max_frames), fps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crop a video into a compact .lipf/.npz/.npy frame tensor")
+    parser.add_argument('video')
+    parser.add_argument('output')
+    parser.add_argument('--codec', default='zlib', choices=list(CODECS), help=".lipf compression")
+    parser.add_argument('--no-delta', action='store_true', help="Store frames as-is rather than frame differences")
+    parser.add_argument('--backend', default=None, help="Video decode backend")
+    args = parser.parse_args()
+
+    decoder = get_decoder(args.backend)
+    frames = decoder.decode(args.video)
+    fps = decoder.frame_rate(args.video)
+    if args.output.endswith('.npy'):
+        np.save(args.output, frames)
+    elif args.output.endswith('.npz'):
+        np.savez_compressed(args.output, frames=frames, fps=fps or 0.0)
+    else:
+        with open(args.output, 'wb') as f:
+            f.write(encode_frames(frames, args.codec, not args.no_delta, fps))
+    print(f"{args.video}: {frames.shape[0]} frames, {os.path.getsize(args.video)} -> "
+          f"{os.path.getsize(args.output)} bytes")
+
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,285 @@
+"""
+Incremental sliding-window inference.
+
+The LipNet front-end (three Conv3D/ReLU/MaxPool3D(1,2,2) blocks) is local
+in time: with 'same' padding and kernel 3, a frame's features depend only
+on frames within 3 steps of it. When consecutive windows overlap, those
+features are cached per frame and only new frames go through the
+front-end; each window then runs just the BiLSTM head.
+
+Features within `margin` frames of a window edge see the window's zero
+padding rather than their real neighbours, so those few positions are
+recomputed per window from the frames at the edge. The result matches a
+full forward pass over the same normalized window up to float rounding.
+Realtime streams normalize every window with the statistics of their first
+window (see streaming.py), so that is exactly their full-window output.
+
+Check equivalence and per-hop cost:
+    python backend/incremental.py --frames 300 --hop 15
+"""
+import os
+import time
+import argparse
+from typing import List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+try:
+    from video_io import EMPTY_SHAPE, normalization_params, normalize_frames
+except ImportError:
+    from backend.video_io import EMPTY_SHAPE, normalization_params, normalize_frames
+
+WINDOW_FRAMES = EMPTY_SHAPE[0]
+FRAME_SHAPE = EMPTY_SHAPE[1:]
+DEFAULT_INCREMENTAL = os.getenv("LIPNET_STREAM_INCREMENTAL", "1") == "1"
+
+
+def split_model(model) -> Tuple[list, list, int]:
+    """
+    Split a Sequential LipNet into (front-end layers, head layers, margin),
+    where the front-end is the leading run of time-local layers and
+    `margin` is its temporal receptive radius in frames.
+    """
+    front, margin = [], 0
+    for index, layer in enumerate(model.layers):
+        kind = type(layer).__name__
+        if kind == 'Conv3D':
+            kernel = layer.kernel_size[0]
+            if layer.padding != 'same' or kernel % 2 == 0 or layer.strides[0] != 1 or layer.dilation_rate[0] != 1:
+                raise ValueError(f"{layer.name}: only odd, stride-1 'same' temporal convolutions can be reused")
+            margin += kernel // 2
+        elif kind == 'MaxPool3D' or kind == 'MaxPooling3D':
+            if layer.pool_size[0] != 1 or layer.strides[0] != 1:
+                raise ValueError(f"{layer.name}: temporal pooling breaks per-frame feature reuse")
+        elif kind != 'Activation':
+            return front, list(model.layers[index:]), margin
+        front.append(layer)
+    raise ValueError("Model has no head after the convolutional front-end")
+
+
+class IncrementalModel:
+    """
+    Front-end and head of a LipNet model as two compiled functions.
+    Shared by every stream; per-stream state lives in `IncrementalStream`.
+    """
+
+    def __init__(self, model, window: int = WINDOW_FRAMES, frame_shape: Tuple[int, ...] = FRAME_SHAPE):
+        self.model = model
+        self.window = window
+        self.frame_shape = tuple(frame_shape)
+        self._front_layers, self._head_layers, self.margin = split_model(model)
+        if window <= 2 * self.margin:
+            raise ValueError(f"window must be longer than {2 * self.margin} frames")
+        self._front = tf.function(
+            self._call_front,
+            input_signature=[tf.TensorSpec((None, None) + self.frame_shape, tf.float32)],
+        )
+        # Trace the front-end once to learn the per-frame feature shape
+        probe = self.front(np.zeros((1, 2 * self.margin + 1) + self.frame_shape, dtype=np.float32))
+        self.feature_shape = probe.shape[2:]
+        self._head = tf.function(
+            self._call_head,
+            input_signature=[tf.TensorSpec((None, window) + self.feature_shape, tf.float32)],
+        )
+
+    def _call_front(self, frames):
+        for layer in self._front_layers:
+            frames = layer(frames, training=False)
+        return frames
+
+    def _call_head(self, features):
+        for layer in self._head_layers:
+            features = layer(features, training=False)
+        return features
+
+    def front(self, clips: np.ndarray) -> np.ndarray:
+        """Per-frame features of `(N, T, H, W, C)` clips, zero-padded at each clip's edges"""
+        return self._front(tf.constant(clips, dtype=tf.float32)).numpy()
+
+    def head(self, features: np.ndarray) -> np.ndarray:
+        """Model output for `(N, window, *feature_shape)` features"""
+        return self._head(tf.constant(features, dtype=tf.float32)).numpy()
+
+    def new_stream(self, mean: Optional[int] = None, std: Optional[float] = None) -> 'IncrementalStream':
+        return IncrementalStream(self, mean, std)
+
+
+class IncrementalStream:
+    """
+    Per-stream cache of normalized frames and front-end features.
+
+    The stream starts as if `window - 1` copies of its first frame came
+    before it, matching the repeat-padding the realtime ring buffer applies
+    before it fills. Normalization statistics are fixed for the stream,
+    since cached features are only valid for the normalization they were
+    computed with: pass the realtime session's, or they are taken from the
+    first frames pushed.
+    """
+
+    def __init__(self, engine: IncrementalModel, mean: Optional[int] = None, std: Optional[float] = None):
+        self.engine = engine
+        self.mean = mean
+        self.std = std
+        window, margin = engine.window, engine.margin
+        self._frames = np.zeros((0,) + engine.frame_shape, dtype=np.float32)
+        self._frames_start = 0  # absolute index of self._frames[0]
+        self._features = np.zeros((0,) + tuple(engine.feature_shape), dtype=np.float32)
+        self._features_start = margin  # absolute index of self._features[0]
+        self.total = 0
+        self.frames_computed = 0
+        self._keep_frames = window + margin
+        self._keep_features = window
+
+    @property
+    def _features_end(self) -> int:
+        return self._features_start + len(self._features)
+
+    def push(self, frames: np.ndarray):
+        """Append `(N, H, W, 1)` uint8 frames and compute their interior features"""
+        if len(frames) == 0:
+            return
+        if self.mean is None or self.std is None:
+            self.mean, self.std = normalization_params(frames)
+        normalized = normalize_frames(frames, self.mean, self.std)
+        if self.total == 0:
+            normalized = np.concatenate([np.repeat(normalized[:1], self.engine.window - 1, axis=0), normalized])
+
+        self._frames = np.concatenate([self._frames, normalized])
+        self.total += len(normalized)
+
+        # Interior features need `margin` real frames on both sides
+        margin = self.engine.margin
+        start, end = self._features_end, self.total - margin
+        if end > start:
+            chunk = self._frames[start - margin - self._frames_start:end + margin - self._frames_start]
+            features = self.engine.front(chunk[np.newaxis])[0, margin:margin + (end - start)]
+            self.frames_computed += len(chunk)
+            self._features = np.concatenate([self._features, features])
+
+        if len(self._frames) > self._keep_frames:
+            drop = len(self._frames) - self._keep_frames
+            self._frames = self._frames[drop:]
+            self._frames_start += drop
+        if len(self._features) > self._keep_features:
+            drop = len(self._features) - self._keep_features
+            self._features = self._features[drop:]
+            self._features_start += drop
+
+    def window_frames(self) -> np.ndarray:
+        """The current normalized `(window, H, W, 1)` window"""
+        start = self.total - self.engine.window - self._frames_start
+        return self._frames[start:]
+
+    def window_features(self) -> np.ndarray:
+        """Front-end features of the current window, edges recomputed with window padding"""
+        if self.total < self.engine.window:
+            raise ValueError("No frames pushed yet")
+        window, margin = self.engine.window, self.engine.margin
+        frames = self.window_frames()
+        edges = self.engine.front(np.stack([frames[:2 * margin], frames[-2 * margin:]]))
+        self.frames_computed += 4 * margin
+        start = self.total - window + margin - self._features_start
+        interior = self._features[start:start + window - 2 * margin]
+        return np.concatenate([edges[0, :margin], interior, edges[1, margin:]])
+
+    def predict(self) -> np.ndarray:
+        """`(1, window, classes)` output for the current window"""
+        return self.engine.head(self.window_features()[np.newaxis])
+
+    def step(self, frames: np.ndarray) -> np.ndarray:
+        """Push new frames and predict the window ending at the newest one"""
+        self.push(frames)
+        return self.predict()
+
+
+def verify(engine: IncrementalModel, frames: np.ndarray, hop: int) -> dict:
+    """
+    Stream `frames` in hops the way a realtime session does and compare
+    every window against the session's full-window path: a forward pass
+    over the raw window, repeat-padded before it fills and normalized with
+    the first window's statistics. Returns the largest absolute difference
+    and the front-end frames computed by each path.
+    """
+    window = engine.window
+    # Raw frames as the realtime ring buffer sees them, first frame repeated before it fills
+    padded = np.concatenate([np.repeat(frames[:1], window - 1, axis=0), frames])
+    first = padded[min(hop, len(frames)) - 1:min(hop, len(frames)) - 1 + window]
+    mean, std = normalization_params(first)
+    stream = engine.new_stream(mean, std)
+    max_diff, windows = 0.0, 0
+    for start in range(0, len(frames), hop):
+        incremental = stream.step(frames[start:start + hop])
+        end = window - 1 + min(start + hop, len(frames))
+        full_window = normalize_frames(padded[end - window:end], mean, std)
+        full = engine.model(full_window[np.newaxis], training=False).numpy()
+        max_diff = max(max_diff, float(np.max(np.abs(incremental - full))))
+        windows += 1
+    return {
+        "windows": windows,
+        "max_abs_diff": max_diff,
+        "front_frames_incremental": stream.frames_computed,
+        "front_frames_full": windows * window,
+    }
+
+
+def benchmark(engine: IncrementalModel, frames: np.ndarray, hop: int) -> dict:
+    """Median per-hop latency of incremental vs full-window inference"""
+    stream = engine.new_stream()
+    stream.step(frames[:hop])
+    full_forward = tf.function(
+        lambda x: engine.model(x, training=False),
+        input_signature=[tf.TensorSpec((1, engine.window) + engine.frame_shape, tf.float32)],
+    )
+    full_forward(tf.constant(stream.window_frames()[np.newaxis]))
+    incremental_ms: List[float] = []
+    full_ms: List[float] = []
+    for start in range(hop, len(frames), hop):
+        begin = time.perf_counter()
+        stream.step(frames[start:start + hop])
+        incremental_ms.append(1000.0 * (time.perf_counter() - begin))
+        window = stream.window_frames()[np.newaxis]
+        begin = time.perf_counter()
+        full_forward(tf.constant(window)).numpy()
+        full_ms.append(1000.0 * (time.perf_counter() - begin))
+    return {
+        "hop": hop,
+        "incremental_ms_p50": float(np.percentile(incremental_ms, 50)),
+        "full_ms_p50": float(np.percentile(full_ms, 50)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time incremental sliding-window inference")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--hop', type=int, default=15)
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    try:
+        from lipnet_utils import build_model, load_weights
+        from streaming import synthetic_frames
+        from video_io import decode_frame
+    except ImportError:
+        from backend.lipnet_utils import build_model, load_weights
+        from backend.streaming import synthetic_frames
+        from backend.video_io import decode_frame
+
+    model = build_model()
+    if not load_weights(model):
+        print("Warning: No weights loaded, using untrained model")
+    engine = IncrementalModel(model)
+    frames = np.stack([decode_frame(f) for f in synthetic_frames(args.frames)])
+
+    check = verify(engine, frames, args.hop)
+    print(f"{check['windows']} windows, max |diff| {check['max_abs_diff']:.2e}, "
+          f"front-end frames {check['front_frames_incremental']} vs {check['front_frames_full']} full")
+    timing = benchmark(engine, frames, args.hop)
+    print(f"hop {timing['hop']}: incremental p50 {timing['incremental_ms_p50']:.1f} ms, "
+          f"full window p50 {timing['full_ms_p50']:.1f} ms")
+    if check['max_abs_diff'] > args.tolerance:
+        raise SystemExit(f"Incremental output differs from full recomputation by {check['max_abs_diff']:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Size-limited upload ingestion straight into memory"""
+import os
+from typing import Optional
+
+DEFAULT_MAX_UPLOAD_BYTES = int(float(os.getenv("LIPNET_MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+CHUNK_SIZE = 1024 * 1024
+
+VIDEO_SUFFIXES = {'.mpg', '.mpeg', '.mp4', '.avi', '.mov', '.mkv', '.webm'}
+# Pre-cropped frame tensors (see frame_tensor.py)
+TENSOR_SUFFIXES = ('.npy', '.npz', '.lipf')
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size limit"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds limit of {max_bytes // (1024 * 1024)} MB")
+        self.max_bytes = max_bytes
+
+
+def upload_suffix(filename: Optional[str], default: str = '.mpg') -> str:
+    """File extension to use for an upload, taken from its filename"""
+    suffix = os.path.splitext(filename or '')[1].lower()
+    return suffix if suffix in VIDEO_SUFFIXES or suffix in TENSOR_SUFFIXES else default
+
+
+def check_content_length(header: Optional[str], max_bytes: int = DEFAULT_MAX_UPLOAD_BYTES):
+    """Reject early when the client already announced an oversized body"""
+    if header and header.isdigit() and int(header) > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+
+
+async def read_upload(file, max_bytes: int = DEFAULT_MAX_UPLOAD_BYTES) -> bytes:
+    """Read an UploadFile into memory in chunks, stopping as soon as it is too large"""
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise UploadTooLargeError(max_bytes)
+    return bytes(buffer)
+
+
+async def read_stream(stream, max_bytes: int = DEFAULT_MAX_UPLOAD_BYTES) -> bytes:
+    """Read a raw request body (`request.stream()`) into memory with a size limit"""
+    buffer = bytearray()
+    async for chunk in stream:
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise UploadTooLargeError(max_bytes)
+    return bytes(buffer)
+
+
+__all__ = [
+    'UploadTooLargeError',
+    'upload_suffix',
+    'check_content_length',
+    'read_upload',
+    'read_stream',
+    'DEFAULT_MAX_UPLOAD_BYTES',
+    'VIDEO_SUFFIXES',
+    'TENSOR_SUFFIXES',
+]
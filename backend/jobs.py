@@ -0,0 +1,333 @@
+"""
+Asynchronous transcription jobs.
+
+Uploads are spooled to disk and queued; a fixed number of worker tasks
+run them through the normal prediction path. Clients poll for status and
+fetch the result later instead of holding a connection open for the whole
+decode and inference. Job metadata and results live in SQLite (WAL), so
+every uvicorn worker sharing LIPNET_JOB_DIR can answer status queries,
+and finished jobs are purged after LIPNET_JOB_TTL_SECONDS.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+DEFAULT_JOB_DIR = os.getenv("LIPNET_JOB_DIR", os.path.join("data", "jobs"))
+DEFAULT_JOB_WORKERS = int(os.getenv("LIPNET_JOB_WORKERS", "2"))
+DEFAULT_MAX_QUEUED_JOBS = int(os.getenv("LIPNET_JOB_QUEUE", "32"))
+DEFAULT_JOB_TTL_SECONDS = float(os.getenv("LIPNET_JOB_TTL_SECONDS", "3600"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when the job queue already holds its maximum number of jobs"""
+
+    def __init__(self, max_queued: int, retry_after: int):
+        super().__init__(f"Job queue is full ({max_queued} queued)")
+        self.retry_after = retry_after
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """SQLite table of job metadata and results"""
+
+    COLUMNS = ("id", "status", "filename", "size", "created", "started", "finished", "expires", "result", "error")
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "jobs.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT, size INTEGER, "
+                "created REAL NOT NULL, started REAL, finished REAL, expires REAL, "
+                "result TEXT, error TEXT, owner INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires)")
+            self._conn.commit()
+
+    def create(self, job_id: str, filename: Optional[str], size: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, filename, size, created, owner) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, filename, size, time.time(), os.getpid()),
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        if job["expires"] is not None and job["expires"] < time.time():
+            return None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def update(self, job_id: str, only_if: Optional[tuple] = None, **fields) -> bool:
+        """Set fields on a job, optionally only while its status is in `only_if`"""
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        query = f"UPDATE jobs SET {assignments} WHERE id = ?"
+        params = list(fields.values()) + [job_id]
+        if only_if:
+            query += f" AND status IN ({', '.join('?' for _ in only_if)})"
+            params += list(only_if)
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def fail_orphaned(self, ttl_seconds: float) -> int:
+        """Fail unfinished jobs whose owning process has exited (e.g. after a restart)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, owner FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+        orphaned = [job_id for job_id, owner in rows if owner != os.getpid() and not _pid_alive(owner)]
+        for job_id in orphaned:
+            self.update(job_id, only_if=(QUEUED, RUNNING), status=FAILED,
+                        error="Server restarted before the job finished", finished=time.time(),
+                        expires=time.time() + ttl_seconds)
+        return len(orphaned)
+
+    def purge_expired(self) -> List[str]:
+        now = time.time()
+        with self._lock:
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT id FROM jobs WHERE expires IS NOT NULL AND expires < ?", (now,)
+            )]
+            self._conn.execute("DELETE FROM jobs WHERE expires IS NOT NULL AND expires < ?", (now,))
+            self._conn.commit()
+        return expired
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """
+    Bounded queue of spooled uploads processed by `workers` asyncio tasks.
+    `run(data, suffix, **options)` is the prediction coroutine; its return
+    value is stored as the job result.
+    """
+
+    def __init__(
+        self,
+        run: Callable[..., Awaitable[dict]],
+        directory: str = DEFAULT_JOB_DIR,
+        workers: int = DEFAULT_JOB_WORKERS,
+        max_queued: int = DEFAULT_MAX_QUEUED_JOBS,
+        ttl_seconds: float = DEFAULT_JOB_TTL_SECONDS,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.run = run
+        self.directory = directory
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        self.spool_dir = os.path.join(directory, "spool")
+        self.store: Optional[JobStore] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._durations: List[float] = []
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    async def start(self):
+        if self._tasks:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.store = await asyncio.to_thread(JobStore, self.directory)
+        await asyncio.to_thread(self.store.fail_orphaned, self.ttl_seconds)
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._purge_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up"""
+        recent = self._durations[-20:]
+        average = sum(recent) / len(recent) if recent else 5.0
+        return max(1, int(average * max(self.depth, 1) / self.workers))
+
+    def _spool_path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}{suffix}")
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def submit(self, data: bytes, suffix: str, filename: Optional[str] = None, **options) -> str:
+        """Spool an upload and queue it; raises JobQueueFullError when the queue is full"""
+        await self.start()
+        if self._queue.full():
+            self.rejected += 1
+            raise JobQueueFullError(self.max_queued, self.retry_after())
+        job_id = uuid.uuid4().hex
+        path = self._spool_path(job_id, suffix)
+        await asyncio.to_thread(self._write, path, data)
+        await asyncio.to_thread(self.store.create, job_id, filename, len(data))
+        try:
+            self._queue.put_nowait((job_id, path, suffix, options))
+        except asyncio.QueueFull:
+            # Another submit took the last slot while this one was spooling
+            self.rejected += 1
+            await asyncio.to_thread(self.store.update, job_id, status=FAILED, error="Job queue is full",
+                                    finished=time.time(), expires=time.time() + self.ttl_seconds)
+            await asyncio.to_thread(self._remove, path)
+            raise JobQueueFullError(self.max_queued, self.retry_after())
+        self.submitted += 1
+        return job_id
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    async def _worker(self):
+        while True:
+            job_id, path, suffix, options = await self._queue.get()
+            try:
+                await self._process(job_id, path, suffix, options)
+            finally:
+                self._queue.task_done()
+                await asyncio.to_thread(self._remove, path)
+
+    async def _process(self, job_id: str, path: str, suffix: str, options: dict):
+        started = time.time()
+        # Skipped when the job was cancelled while queued
+        if not await asyncio.to_thread(self.store.update, job_id, only_if=(QUEUED,), status=RUNNING, started=started):
+            return
+        task = asyncio.create_task(self._run(path, suffix, options))
+        self._running[job_id] = task
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise  # the worker itself is being stopped
+            return  # cancel() has already recorded the job as cancelled
+        except Exception as e:
+            self.failed += 1
+            fields = dict(status=FAILED, error=str(e))
+        else:
+            self.completed += 1
+            fields = dict(status=DONE, result=result)
+        finally:
+            self._running.pop(job_id, None)
+        finished = time.time()
+        self._durations = self._durations[-99:] + [finished - started]
+        await asyncio.to_thread(self.store.update, job_id, only_if=(RUNNING,), finished=finished,
+                                expires=finished + self.ttl_seconds, **fields)
+
+    async def _run(self, path: str, suffix: str, options: dict) -> dict:
+        data = await asyncio.to_thread(self._read, path)
+        return await self.run(data, suffix, **options)
+
+    async def status(self, job_id: str) -> Optional[dict]:
+        await self.start()
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        """
+        Cancel a queued or running job; finished jobs are left unchanged.
+        Cancelling a running job only stops this job's wait: work it shares
+        with other requests (a coalesced prediction in PredictionCache) runs
+        in its own task and still completes for them.
+        """
+        await self.start()
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        # Queued jobs are skipped by the worker that dequeues them. Running
+        # jobs owned by another server process cannot be interrupted here.
+        now = time.time()
+        statuses = (QUEUED, RUNNING) if task is not None else (QUEUED,)
+        if await asyncio.to_thread(self.store.update, job_id, only_if=statuses, status=CANCELLED,
+                                   finished=now, expires=now + self.ttl_seconds):
+            self.cancelled += 1
+        return await self.status(job_id)
+
+    async def _purge_loop(self, interval: float = 60.0):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.store.purge_expired)
+            except sqlite3.Error as e:
+                print(f"Job purge failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self.depth,
+            "running": len(self._running),
+            "max_queued": self.max_queued,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+        }
+
+
+__all__ = [
+    'JobQueue',
+    'JobStore',
+    'JobQueueFullError',
+    'QUEUED',
+    'RUNNING',
+    'DONE',
+    'FAILED',
+    'CANCELLED',
+    'FINISHED',
+]
@@ -1,48 +1,82 @@
-"""LipNet Utilities - Consolidated from notebook and scripts"""
+"""
+LipNet Utilities - Consolidated from notebook and scripts
+
+TensorFlow is imported inside the functions that need it, so importing
+this module (and the API server) does not pay TensorFlow's import cost.
+"""
+from __future__ import annotations
+
 import os
-import cv2
-import tensorflow as tf
+import hashlib
 import numpy as np
-from typing import List, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+try:
+    from video_io import get_decoder
+    from frame_store import FrameStore, DEFAULT_STORE_DIR
+    from ctc_decoding import build_lookup, greedy_decode, decode as ctc_decode_batch, load_constraint
+except ImportError:
+    from backend.video_io import get_decoder
+    from backend.frame_store import FrameStore, DEFAULT_STORE_DIR
+    from backend.ctc_decoding import build_lookup, greedy_decode, decode as ctc_decode_batch, load_constraint
 
 # Setup vocabulary (from notebook)
 vocab = [x for x in "abcdefghijklmnopqrstuvwxyz'?!123456789 "]
-char_to_num = tf.keras.layers.StringLookup(vocabulary=vocab, oov_token="")
-num_to_char = tf.keras.layers.StringLookup(
-    vocabulary=char_to_num.get_vocabulary(), oov_token="", invert=True
-)
+# Index 0 is the OOV token: this is what StringLookup(vocab, oov_token="").get_vocabulary() returns
+lookup_vocabulary = [''] + vocab
+# Precomputed index -> character table for NumPy CTC decoding
+char_lookup = build_lookup(lookup_vocabulary)
+_string_lookups = None
+
+def get_string_lookups():
+    """(char_to_num, num_to_char) StringLookup layers, built on first use"""
+    global _string_lookups
+    if _string_lookups is None:
+        import tensorflow as tf
+        char_to_num = tf.keras.layers.StringLookup(vocabulary=vocab, oov_token="")
+        num_to_char = tf.keras.layers.StringLookup(
+            vocabulary=char_to_num.get_vocabulary(), oov_token="", invert=True
+        )
+        _string_lookups = (char_to_num, num_to_char)
+    return _string_lookups
+
+def __getattr__(name: str):
+    # `from lipnet_utils import char_to_num` keeps working, but only then loads TensorFlow
+    if name == 'char_to_num':
+        return get_string_lookups()[0]
+    if name == 'num_to_char':
+        return get_string_lookups()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def load_video(path: str) -> tf.Tensor:
+def load_video(path: str, backend: str = None) -> tf.Tensor:
     """
     Load video from path and preprocess frames.
     From notebook cell 9 - enhanced with error handling.
+
+    `backend` selects the decoder ('opencv' or 'ffmpeg', default from
+    LIPNET_VIDEO_BACKEND); every backend returns the same frames.
     """
-    cap = cv2.VideoCapture(path)
-    frames = []
-    
-    if not cap.isOpened():
-        return tf.zeros((75, 46, 140, 1), dtype=tf.float32)
-    
-    for _ in range(int(cap.get(cv2.CAP_PROP_FRAME_COUNT))):
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame = tf.image.rgb_to_grayscale(frame)
-        frames.append(frame[190:236, 80:220, :])
-    cap.release()
-    
-    if len(frames) == 0:
-        return tf.zeros((75, 46, 140, 1), dtype=tf.float32)
-    
-    mean = tf.math.reduce_mean(frames)
-    std = tf.math.reduce_std(tf.cast(frames, tf.float32))
-    return tf.cast((frames - mean), tf.float32) / (std + 1e-8)
+    import tensorflow as tf
+    return tf.convert_to_tensor(load_video_array(path, backend))
+
+def load_video_array(path: str, backend: str = None) -> np.ndarray:
+    """Same as load_video but returns a float32 NumPy array"""
+    return get_decoder(backend).load(path)
+
+def load_video_bytes(data: bytes, suffix: str = '.mpg', backend: str = None) -> np.ndarray:
+    """Decode and preprocess a video held in memory (no temp file for streamable containers)"""
+    return get_decoder(backend).load_bytes(data, suffix)
 
 def load_alignments(path: str) -> tf.Tensor:
     """
     Load alignment file and convert to tokens.
     From notebook cell 15 - enhanced with error handling.
     """
+    import tensorflow as tf
+    char_to_num = get_string_lookups()[0]
     try:
         with open(path, 'r') as f:
             lines = f.readlines()
@@ -56,11 +90,21 @@ def load_alignments(path: str) -> tf.Tensor:
         print(f"Error loading alignments: {e}")
         return tf.constant([], dtype=tf.int64)
 
+_frame_store = None
+
+def get_frame_store(directory: str = DEFAULT_STORE_DIR):
+    """Open the preprocessed frame store once; None when it has not been built"""
+    global _frame_store
+    if _frame_store is None or _frame_store.directory != directory:
+        _frame_store = FrameStore.open(directory)
+    return _frame_store
+
 def load_data(path: str) -> Tuple[tf.Tensor, tf.Tensor]:
     """
     Load video and alignments for a given path.
     From notebook cell 16 - enhanced for both tensor and string paths.
     """
+    import tensorflow as tf
     # Handle both tensor and string paths
     if hasattr(path, 'numpy'):
         path = bytes.decode(path.numpy())
@@ -75,7 +119,15 @@ def load_data(path: str) -> Tuple[tf.Tensor, tf.Tensor]:
     video_path = os.path.join('data', 's1', f'{file_name}.mpg')
     alignment_path = os.path.join('data', 'alignments', 's1', f'{file_name}.align')
     
-    frames = load_video(video_path)
+    # Prefer preprocessed frames (backend/frame_store.py) when fresh
+    frames = None
+    store = get_frame_store()
+    if store is not None:
+        stored = store.load(file_name, video_path)
+        if stored is not None:
+            frames = tf.convert_to_tensor(stored)
+    if frames is None:
+        frames = load_video(video_path)
     alignments = load_alignments(alignment_path)
     
     return frames, alignments
@@ -85,6 +137,7 @@ def mappable_function(path: str):
     Mappable function for TensorFlow dataset.
     From notebook cell 23.
     """
+    import tensorflow as tf
     result = tf.py_function(load_data, [path], (tf.float32, tf.int64))
     return result
 
@@ -127,30 +180,115 @@ def build_model():
     model.add(Bidirectional(LSTM(128, kernel_initializer='Orthogonal', return_sequences=True)))
     model.add(Dropout(.5))
     
-    model.add(Dense(char_to_num.vocabulary_size() + 1, kernel_initializer='he_normal', activation='softmax'))
+    model.add(Dense(len(lookup_vocabulary) + 1, kernel_initializer='he_normal', activation='softmax'))
     
     return model
 
-def CTCLoss(y_true, y_pred):
+def checkpoint_paths(base_dir: str = None) -> List[str]:
+    """Candidate checkpoint prefixes, in search order"""
+    if base_dir is None:
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    candidates = [
+        os.path.join(base_dir, 'models', 'models', 'checkpoint'),
+        os.path.join(base_dir, 'models', 'checkpoint'),
+        'models/models/checkpoint',
+        'models/checkpoint'
+    ]
+    # The relative paths usually resolve to the same files as the base_dir ones
+    unique, seen = [], set()
+    for path in candidates:
+        if os.path.abspath(path) not in seen:
+            seen.add(os.path.abspath(path))
+            unique.append(path)
+    return unique
+
+def load_weights(model, base_dir: str = None) -> bool:
+    """
+    Restore model weights from the first checkpoint found.
+    Returns True when weights were loaded.
+    """
+    import tensorflow as tf
+    for checkpoint_path in checkpoint_paths(base_dir):
+        if os.path.exists(checkpoint_path + '.index'):
+            try:
+                checkpoint = tf.train.Checkpoint(model=model)
+                checkpoint.restore(checkpoint_path).expect_partial()
+                return True
+            except (tf.errors.OpError, ValueError, AssertionError) as e:
+                print(f"Could not restore {checkpoint_path}: {e}")
+    return False
+
+# Pre-exported model (SavedModel directory or .keras archive) loaded
+# directly at startup instead of rebuilding the graph and restoring a
+# checkpoint; see `python backend/serving.py export`
+DEFAULT_MODEL_PATH = os.getenv('LIPNET_MODEL_PATH', os.path.join('models', 'lipnet.keras'))
+
+def exported_model_path(base_dir: str = None, path: str = None) -> Optional[str]:
+    """The exported model to load, or None when it has not been exported"""
+    path = path or DEFAULT_MODEL_PATH
+    if not os.path.isabs(path):
+        if base_dir is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        path = os.path.join(base_dir, path)
+    return path if os.path.exists(path) else None
+
+def model_version(base_dir: str = None) -> str:
+    """
+    Identifier for the weights that would be served.
+    LIPNET_MODEL_VERSION overrides; otherwise derived from the size and
+    mtime of the exported model, or else of the checkpoint index file.
+    """
+    override = os.getenv('LIPNET_MODEL_VERSION')
+    if override:
+        return override
+    exported = exported_model_path(base_dir)
+    if exported is not None:
+        if os.path.isdir(exported):
+            exported = os.path.join(exported, 'saved_model.pb')
+        stat = os.stat(exported)
+        return f"export-{stat.st_size:x}-{int(stat.st_mtime):x}"
+    for checkpoint_path in checkpoint_paths(base_dir):
+        index_path = checkpoint_path + '.index'
+        if os.path.exists(index_path):
+            stat = os.stat(index_path)
+            return f"ckpt-{stat.st_size:x}-{int(stat.st_mtime):x}"
+    return 'untrained'
+
+def CTCLoss(y_true, y_pred, input_length=None):
     """
     CTC Loss function for training.
     From notebook cell 48.
+
+    Labels are padded with 0 (the OOV index, never a real token), so each
+    label's length is its count of non-zero tokens rather than the padded
+    width. `input_length` gives the real frames per clip (default: all of
+    y_pred's time steps). Uses the dense tf.nn.ctc_loss path, which also
+    compiles under XLA. Returns (batch, 1) like ctc_batch_cost.
     """
-    batch_len = tf.cast(tf.shape(y_true)[0], dtype="int64")
-    input_length = tf.cast(tf.shape(y_pred)[1], dtype="int64")
-    label_length = tf.cast(tf.shape(y_true)[1], dtype="int64")
-    
-    input_length = input_length * tf.ones(shape=(batch_len, 1), dtype="int64")
-    label_length = label_length * tf.ones(shape=(batch_len, 1), dtype="int64")
-    
-    loss = tf.keras.backend.ctc_batch_cost(y_true, y_pred, input_length, label_length)
-    return loss
+    import tensorflow as tf
+    labels = tf.cast(y_true, tf.int32)
+    label_length = tf.math.count_nonzero(labels, axis=1, dtype=tf.int32)
+    if input_length is None:
+        input_length = tf.fill(tf.shape(labels)[:1], tf.shape(y_pred)[1])
+    input_length = tf.reshape(tf.cast(input_length, tf.int32), [-1])
+    # y_pred is a softmax, so its log is already normalized logits
+    logits = tf.math.log(tf.cast(y_pred, tf.float32) + 1e-7)
+    loss = tf.nn.ctc_loss(
+        labels=labels,
+        logits=logits,
+        label_length=label_length,
+        logit_length=input_length,
+        logits_time_major=False,
+        blank_index=-1,
+    )
+    return tf.expand_dims(loss, 1)
 
 def scheduler(epoch, lr):
     """
     Learning rate scheduler.
     From notebook cell 47.
     """
+    import tensorflow as tf
     if epoch < 30:
         return lr
     else:
@@ -161,15 +299,53 @@ def decode_prediction(yhat, input_length=75):
     Decode model prediction to text.
     From notebook cells 62, 68.
     """
-    decoded = tf.keras.backend.ctc_decode(yhat, input_length=[input_length], greedy=True)[0][0].numpy()
-    predicted_text = tf.strings.reduce_join([num_to_char(word) for word in decoded[0]]).numpy().decode('utf-8')
-    return predicted_text.strip()
+    return greedy_decode(yhat, [input_length], char_lookup)[0]
+
+# Serving-time decoder settings: LIPNET_BEAM_WIDTH (0 = greedy) and
+# LIPNET_DECODER_CONSTRAINT ('none', 'grid' or a lexicon file path)
+DEFAULT_BEAM_WIDTH = int(os.getenv('LIPNET_BEAM_WIDTH', '0'))
+DEFAULT_CONSTRAINT = os.getenv('LIPNET_DECODER_CONSTRAINT', 'none')
+_constraints = {}
+
+def get_constraint(spec: str = None):
+    """Load (once) the decoder constraint named by `spec`"""
+    spec = DEFAULT_CONSTRAINT if spec is None else spec
+    if spec not in _constraints:
+        _constraints[spec] = load_constraint(spec)
+    return _constraints[spec]
+
+def decoder_version(beam_width: int = None, constraint: str = None) -> str:
+    """
+    Identifier for the serving-time decoder: beam width plus the constraint,
+    with a lexicon identified by a hash of its contents
+    """
+    beam_width = DEFAULT_BEAM_WIDTH if beam_width is None else beam_width
+    spec = DEFAULT_CONSTRAINT if constraint is None else constraint
+    if not spec or spec in ('none', 'grid'):
+        name = spec or 'none'
+    else:
+        try:
+            with open(spec, 'rb') as f:
+                name = 'lexicon-' + hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+        except OSError:
+            name = 'lexicon-missing'
+    return f"beam{beam_width}-{name}"
+
+def decode_predictions(yhat, input_lengths=None, beam_width: int = None, constraint: str = None) -> List[str]:
+    """
+    Decode a batch of (N, T, V) predictions to text, one string per clip.
+    `input_lengths` gives the valid time steps per clip (default: all).
+    Greedy unless a beam width > 1 or a constraint is configured.
+    """
+    beam_width = DEFAULT_BEAM_WIDTH if beam_width is None else beam_width
+    return ctc_decode_batch(yhat, input_lengths, char_lookup, beam_width, get_constraint(constraint))
 
 def process_video_for_prediction(video_path: str, model):
     """
     Complete pipeline: load video, make prediction, return text.
     Combines notebook functions.
     """
+    import tensorflow as tf
     frames = load_video(video_path)
     video_batch = tf.expand_dims(frames, axis=0)
     yhat = model.predict(video_batch, verbose=0)
@@ -179,16 +355,27 @@ def process_video_for_prediction(video_path: str, model):
 # Export all utilities
 __all__ = [
     'load_video',
+    'load_video_array',
+    'load_video_bytes',
     'load_alignments',
     'load_data',
+    'get_frame_store',
     'mappable_function',
     'build_model',
+    'load_weights',
+    'exported_model_path',
+    'model_version',
     'CTCLoss',
     'scheduler',
     'decode_prediction',
+    'decode_predictions',
+    'decoder_version',
+    'get_constraint',
     'process_video_for_prediction',
     'char_to_num',
     'num_to_char',
+    'get_string_lookups',
+    'char_lookup',
     'vocab'
 ]
 
@@ -0,0 +1,243 @@
+"""
+Arbitrary-length video transcription.
+
+The model takes exactly 75 frames. Longer (or shorter) videos are read
+frame by frame, cut into overlapping 75-frame windows (the last one
+padded by repeating its final frame), normalized per window like a GRID
+clip and run through the model in batches. Per-frame greedy CTC tokens are
+stitched across windows: each frame in an overlap is taken from the window
+it sits nearer the centre of, and the stitched token stream is collapsed
+into one transcript with per-word timestamps.
+
+Memory is bounded by the batch: at most `batch_size` windows of frames and
+outputs are held at once, whatever the video length.
+
+Usage:
+    python backend/long_video.py recording.mp4 --overlap 25 --batch-size 8
+"""
+import os
+import json
+import time
+import argparse
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from frame_tensor import decode_frame_tensor, is_frame_tensor
+    from video_io import EMPTY_SHAPE, get_decoder, memory_file, normalization_params, normalize_frames
+except ImportError:
+    from backend.frame_tensor import decode_frame_tensor, is_frame_tensor
+    from backend.video_io import EMPTY_SHAPE, get_decoder, memory_file, normalization_params, normalize_frames
+
+WINDOW_FRAMES = EMPTY_SHAPE[0]
+DEFAULT_OVERLAP = int(os.getenv("LIPNET_LONG_OVERLAP", "25"))
+DEFAULT_LONG_BATCH = int(os.getenv("LIPNET_LONG_BATCH", "8"))
+# GRID recordings are 25 fps; used when the container does not report a rate
+DEFAULT_FPS = 25.0
+
+
+def iter_windows(
+    frames: Iterable[np.ndarray],
+    window: int = WINDOW_FRAMES,
+    overlap: int = DEFAULT_OVERLAP,
+) -> Iterator[Tuple[int, np.ndarray, int]]:
+    """
+    Yield (start frame, (window, H, W, 1) uint8 clip, valid frames) for
+    overlapping windows over a frame stream. The final window is padded by
+    repeating its last frame; `valid` counts the real frames in it.
+    """
+    if not 0 <= overlap < window:
+        raise ValueError("overlap must be in [0, window)")
+    stride = window - overlap
+    buffer = None
+    filled = 0
+    start = 0
+    emitted = False
+    for frame in frames:
+        if buffer is None:
+            buffer = np.empty((window,) + frame.shape, dtype=np.uint8)
+        buffer[filled] = frame
+        filled += 1
+        if filled == window:
+            yield start, buffer.copy(), window
+            emitted = True
+            buffer[:overlap] = buffer[stride:]
+            filled = overlap
+            start += stride
+    # Frames after the last full window (or a video shorter than one window)
+    if buffer is not None and (filled > overlap or not emitted):
+        buffer[filled:] = buffer[filled - 1]
+        yield start, buffer.copy(), filled
+
+
+def prepare_window(clip: np.ndarray, valid: int) -> np.ndarray:
+    """Normalize a window with the statistics of its real frames"""
+    mean, std = normalization_params(clip[:valid])
+    return normalize_frames(clip, mean, std)
+
+
+class TranscriptStitcher:
+    """
+    Stitches per-window CTC outputs into one greedy transcript.
+
+    Window outputs must arrive in order. Frames in the overlap between two
+    windows come from the earlier window up to the overlap midpoint and
+    from the later one after it, so every frame is decoded with context on
+    both sides except at the very start and end of the video. Each window
+    owns the `stride` frames from its own midpoint cut to the next one's,
+    which always lie inside it, so overlaps of more than half a window
+    never emit a frame twice.
+    """
+
+    def __init__(self, lookup: np.ndarray, overlap: int = DEFAULT_OVERLAP, window: int = WINDOW_FRAMES,
+                 fps: float = DEFAULT_FPS):
+        self.lookup = lookup
+        self.blank = len(lookup) - 1
+        self.overlap = overlap
+        self.stride = window - overlap
+        self.fps = fps
+        self._tail: Optional[Tuple[int, np.ndarray]] = None
+        self._previous = -1
+        # (character, first frame, last frame) after collapsing repeats
+        self._chars: List[List] = []
+        self.frames = 0
+
+    def add(self, start: int, yhat: np.ndarray, valid: int):
+        """Add one window's (T, V) softmax output"""
+        tokens = np.argmax(yhat[:valid], axis=-1)
+        first = 0
+        if self._tail is not None:
+            # The previous window's frames end where this window's begin
+            tail_start, tail_tokens = self._tail
+            cut = start + self.overlap // 2
+            self._emit(tail_start, tail_tokens[:cut - tail_start])
+            first = cut - start
+        # Held back until the next window fixes where this one's frames end
+        self._tail = (start + first, tokens[first:])
+
+    def _emit(self, first_frame: int, tokens: np.ndarray):
+        for offset, token in enumerate(tokens):
+            frame = first_frame + offset
+            token = int(token)
+            if token != self._previous and token != self.blank:
+                ch = self.lookup[token] if 0 <= token < len(self.lookup) else ''
+                if ch:
+                    self._chars.append([ch, frame, frame])
+            elif token == self._previous and token != self.blank and self._chars:
+                self._chars[-1][2] = frame
+            self._previous = token
+            self.frames = frame + 1
+
+    def finish(self) -> dict:
+        """Flush the last window and return {"text", "words", "duration_s"}"""
+        if self._tail is not None:
+            self._emit(*self._tail)
+            self._tail = None
+        words, current = [], []
+        for entry in self._chars + [[' ', self.frames, self.frames]]:
+            if entry[0] == ' ':
+                if current:
+                    words.append({
+                        "word": ''.join(ch for ch, _, _ in current),
+                        "start": round(current[0][1] / self.fps, 3),
+                        "end": round((current[-1][2] + 1) / self.fps, 3),
+                    })
+                current = []
+            else:
+                current.append(entry)
+        return {
+            "text": ' '.join(w["word"] for w in words),
+            "words": words,
+            "duration_s": round(self.frames / self.fps, 3),
+        }
+
+
+def transcribe_frames(
+    frames: Iterable[np.ndarray],
+    predict: Callable[[np.ndarray], np.ndarray],
+    lookup: np.ndarray,
+    fps: Optional[float] = None,
+    overlap: int = DEFAULT_OVERLAP,
+    batch_size: int = DEFAULT_LONG_BATCH,
+) -> dict:
+    """
+    Transcribe a frame stream of any length. `predict` maps a
+    (N, 75, 46, 140, 1) float32 batch to (N, 75, V) softmax outputs.
+    """
+    stitcher = TranscriptStitcher(lookup, overlap, fps=fps or DEFAULT_FPS)
+    pending: List[Tuple[int, np.ndarray, int]] = []
+    windows = 0
+
+    def flush():
+        yhat = np.asarray(predict(np.stack([clip for _, clip, _ in pending])))
+        for (start, _, valid), out in zip(pending, yhat):
+            stitcher.add(start, out, valid)
+        pending.clear()
+
+    for start, clip, valid in iter_windows(frames, overlap=overlap):
+        pending.append((start, prepare_window(clip, valid), valid))
+        windows += 1
+        if len(pending) >= batch_size:
+            flush()
+    if pending:
+        flush()
+    return {**stitcher.finish(), "windows": windows, "frames": stitcher.frames, "fps": stitcher.fps}
+
+
+def transcribe_video(
+    path: str,
+    predict: Callable[[np.ndarray], np.ndarray],
+    lookup: np.ndarray,
+    backend: Optional[str] = None,
+    overlap: int = DEFAULT_OVERLAP,
+    batch_size: int = DEFAULT_LONG_BATCH,
+) -> dict:
+    """transcribe_frames over a video file, decoded incrementally"""
+    decoder = get_decoder(backend)
+    return transcribe_frames(decoder.iter_frames(path), predict, lookup, decoder.frame_rate(path), overlap, batch_size)
+
+
+def transcribe_bytes(
+    data: bytes,
+    suffix: str,
+    predict: Callable[[np.ndarray], np.ndarray],
+    lookup: np.ndarray,
+    backend: Optional[str] = None,
+    overlap: int = DEFAULT_OVERLAP,
+    batch_size: int = DEFAULT_LONG_BATCH,
+) -> dict:
+    """transcribe_video for an in-memory upload (a video or a frame tensor)"""
+    if is_frame_tensor(data, suffix):
+        frames, fps = decode_frame_tensor(data, suffix)
+        return transcribe_frames(iter(frames), predict, lookup, fps, overlap, batch_size)
+    decoder = get_decoder(backend)
+    with memory_file(data, suffix) as path:
+        return transcribe_frames(decoder.iter_frames(path), predict, lookup, decoder.frame_rate(path),
+                                 overlap, batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe a video of any length with overlapping windows")
+    parser.add_argument('video')
+    parser.add_argument('--overlap', type=int, default=DEFAULT_OVERLAP, help="Frames shared by adjacent windows")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_LONG_BATCH, help="Windows per forward pass")
+    parser.add_argument('--backend', default=None, help="Video decode backend")
+    args = parser.parse_args()
+
+    try:
+        from serving import load_serving_model
+        from lipnet_utils import char_lookup
+    except ImportError:
+        from backend.serving import load_serving_model
+        from backend.lipnet_utils import char_lookup
+    _, model = load_serving_model()
+    started = time.perf_counter()
+    result = transcribe_video(args.video, lambda batch: model.predict(batch, verbose=0), char_lookup,
+                              args.backend, args.overlap, args.batch_size)
+    result["elapsed_s"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,20 @@
 """Backend API for LipNet Application"""
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
+import time
+# Reference point for the startup timing breakdown
+_module_started = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import os
-import cv2
-import tensorflow as tf
 import numpy as np
-import tempfile
-import shutil
-from typing import Optional
-import secrets
-from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from datetime import datetime
 import json
+import asyncio
+import itertools
+import threading
 
 # Import model utilities
 import sys
@@ -39,51 +41,40 @@ USERS_DB = {
     "user": {"password": "user123", "name": "Test User"},
 }
 
-# Session management (simple in-memory)
-active_sessions = {}
+# Session tokens live in `session_store` (see sessions.py), created with the other services below.
+# Store calls can block on SQLite, so they run in a thread rather than on the event loop
+# (not the I/O pool, whose back-pressure is for uploads and would refuse logins under load).
 
-def verify_user(credentials: HTTPBasicCredentials = Depends(security)):
+async def verify_user(credentials: HTTPBasicCredentials = Depends(security)):
     """Verify user credentials"""
     if credentials.username in USERS_DB:
         if credentials.password == USERS_DB[credentials.username]["password"]:
             # Create session token
-            session_token = secrets.token_urlsafe(32)
-            active_sessions[session_token] = {
-                "username": credentials.username,
-                "expires": datetime.now() + timedelta(hours=24)
-            }
-            return session_token
+            return await asyncio.to_thread(session_store.create, credentials.username)
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid credentials",
         headers={"WWW-Authenticate": "Basic"},
     )
 
-def get_current_user(session_token: Optional[str] = None):
+async def get_current_user(session_token: Optional[str] = None):
     """Get current user from session"""
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    if session_token not in active_sessions:
-        raise HTTPException(status_code=401, detail="Invalid session")
-    
-    session = active_sessions[session_token]
-    if datetime.now() > session["expires"]:
-        del active_sessions[session_token]
-        raise HTTPException(status_code=401, detail="Session expired")
+    session = await asyncio.to_thread(session_store.get, session_token)
+    if session is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired session")
     
     return session["username"]
 
 # Import LipNet utilities from notebook and scripts
 try:
     from lipnet_utils import (
-        load_video,
-        build_model,
-        decode_prediction,
-        process_video_for_prediction,
-        char_to_num,
-        num_to_char,
-        vocab
+        model_version,
+        decode_predictions,
+        decoder_version,
+        char_lookup,
     )
 except ImportError:
     # Fallback: import from same directory
@@ -91,51 +82,219 @@ except ImportError:
     backend_dir = os.path.dirname(os.path.abspath(__file__))
     sys.path.insert(0, backend_dir)
     from lipnet_utils import (
-        load_video,
-        build_model,
-        decode_prediction,
-        process_video_for_prediction,
-        char_to_num,
-        num_to_char,
-        vocab
+        model_version,
+        decode_predictions,
+        decoder_version,
+        char_lookup,
     )
+from batching import BatchScheduler
+from bulk import DEFAULT_MAX_BULK_BYTES, detach_upload, iter_items, run_bulk
+from executors import ExecutionLayer, QueueFullError
+from frame_tensor import FrameTensorError, decode_frame_tensor, is_frame_tensor
+from cache import PredictionCache, content_key
+from jobs import JobQueue, JobQueueFullError, DONE, FAILED, CANCELLED
+from long_video import WINDOW_FRAMES, transcribe_bytes, transcribe_frames
+from ingest import UploadTooLargeError, check_content_length, read_upload, read_stream, upload_suffix
+from roi import MouthTracker, roi_cache, roi_stats
+from sessions import create_session_store, sweep_loop
+from serving import engine_version, load_serving_model
+from streaming import StreamSession
+from video_io import DEFAULT_ROI_MODE, EMPTY_SHAPE, decode_frame, get_decoder, memory_file, normalize_frames
+from metrics import (
+    ERRORS, FRAMES, IN_FLIGHT, REQUESTS, REQUEST_SECONDS, SESSION_EVICTIONS,
+    mark_worker_dead, observe_stage, render as render_metrics, sample_gauges, time_stage
+)
+
+# Per-video ROI detection/tracking totals feed the stage histograms (LIPNET_ROI=track)
+roi_stats.observer = observe_stage
+
+# Login sessions (LIPNET_SESSION_BACKEND=memory|sqlite, LIPNET_SESSION_DIR,
+# LIPNET_SESSION_TTL_SECONDS, LIPNET_SESSIONS_PER_USER, LIPNET_SESSION_CACHE_SECONDS)
+session_store = create_session_store()
+session_store.on_evict = lambda reason, count: SESSION_EVICTIONS.labels(reason).inc(count)
 
 # Global model variable
 model = None
+# Serving engine: compiled wrapper around `model` (LIPNET_BATCH_BUCKETS, LIPNET_XLA,
+# LIPNET_WARMUP_RUNS) or a TFLite interpreter (LIPNET_ENGINE=tflite)
+serving_model = None
+# Conv front-end/head split of `model` for realtime streams (LIPNET_STREAM_INCREMENTAL)
+incremental_model = None
+_model_lock = threading.Lock()
+# Seconds per startup phase (import_app, import_tensorflow, load_model or
+# build_model + restore_weights, warmup, ...) and the warm-up error, if any
+startup_timings = {}
+startup_error = None
+
+def get_model():
+    """Return the compiled serving model, loading it on first use"""
+    if serving_model is None:
+        load_model_weights()
+    return serving_model
+
+def is_ready() -> bool:
+    """True once the model is loaded and warmed up"""
+    if execution.uses_processes:
+        return execution.warmed_up
+    return serving_model is not None and serving_model.ready
+
+def weights_loaded() -> bool:
+    """True once trained weights (not a freshly initialized model) are being served"""
+    if execution.uses_processes:
+        return execution.weights_loaded
+    return serving_model is not None and serving_model.weights_loaded
+
+# Worker pools for blocking I/O, decode and inference
+# (LIPNET_IO_WORKERS, LIPNET_INFERENCE_PROCESSES, LIPNET_MAX_PENDING_*)
+execution = ExecutionLayer(get_model, base_dir=BASE_DIR)
+
+# Micro-batching scheduler between the upload endpoint and the model
+# (limits: LIPNET_MAX_BATCH_SIZE, LIPNET_MAX_BATCH_WAIT_MS)
+batch_scheduler = BatchScheduler(get_model, executor=execution)
+
+# Content-addressed cache of prediction responses
+# (LIPNET_CACHE_MAX_ENTRIES, LIPNET_CACHE_MAX_MB, LIPNET_CACHE_TTL_SECONDS, LIPNET_CACHE_DIR)
+prediction_cache = PredictionCache()
+MODEL_VERSION = model_version(BASE_DIR)
+# Cache keys also depend on the inference engine (Keras or which TFLite
+# quantization), the CTC decoder (LIPNET_BEAM_WIDTH, LIPNET_DECODER_CONSTRAINT)
+# and how the mouth region is found
+_shared_engine = execution.uses_processes and execution.share_weights
+PREDICTION_VERSION = f"{MODEL_VERSION}+{engine_version(BASE_DIR, shared=_shared_engine)}+{decoder_version()}"
+if DEFAULT_ROI_MODE != "fixed":
+    PREDICTION_VERSION += f"+roi-{DEFAULT_ROI_MODE}"
 
 def load_model_weights():
     """Load model weights"""
-    global model
-    if model is None:
-        model = build_model()
-        
-        # Try to load weights
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        checkpoint_paths = [
-            os.path.join(base_dir, 'models', 'models', 'checkpoint'),
-            os.path.join(base_dir, 'models', 'checkpoint'),
-            'models/models/checkpoint',
-            'models/checkpoint'
-        ]
-        
-        weights_loaded = False
-        for checkpoint_path in checkpoint_paths:
-            if os.path.exists(checkpoint_path + '.index'):
-                try:
-                    checkpoint = tf.train.Checkpoint(model=model)
-                    checkpoint.restore(checkpoint_path).expect_partial()
-                    weights_loaded = True
-                    break
-                except:
-                    continue
-        
-        if not weights_loaded:
-            print("Warning: No weights loaded, using untrained model")
+    global model, serving_model
+    with _model_lock:
+        if serving_model is None:
+            # Exported model, checkpoint or TFLite, per LIPNET_ENGINE / LIPNET_MODEL_PATH
+            model, serving_model = load_serving_model(BASE_DIR, timings=startup_timings)
+
+def get_incremental_model():
+    """
+    Incremental engine for realtime streams. None when disabled, when
+    inference runs in worker processes, or for the TFLite engine.
+    """
+    global incremental_model
+    from incremental import IncrementalModel, DEFAULT_INCREMENTAL
+    if not DEFAULT_INCREMENTAL or execution.uses_processes:
+        return None
+    load_model_weights()
+    with _model_lock:
+        if incremental_model is None and model is not None:
+            incremental_model = IncrementalModel(model)
+    return incremental_model
+
+def incremental_predictor(engine):
+    """Per-connection predictor that feeds only new frames through the front-end"""
+    stream = None
+
+    async def predict(frames, mean, std):
+        nonlocal stream
+        if stream is None:
+            # Normalization is fixed by the session's first window
+            stream = engine.new_stream(mean, std)
+        yhat = await execution.run_inference(stream.step, frames)
+        return (await execution.run_io(decode_predictions, yhat, [engine.window]))[0]
+
+    return predict
+
+def warm_up_model():
+    """Load the model and compile every batch bucket before serving"""
+    load_model_weights()
+    start = time.perf_counter()
+    timings = serving_model.warmup()
+    startup_timings['warmup'] = round(time.perf_counter() - start, 3)
+    start = time.perf_counter()
+    if get_incremental_model() is not None:
+        startup_timings['incremental_model'] = round(time.perf_counter() - start, 3)
+    print(f"Model warm-up complete: {serving_model.stats()['warmup_seconds']}")
+    return timings
+
+async def prepare_model():
+    """Background startup task: the API answers liveness checks while this runs"""
+    global startup_error
+    start = time.perf_counter()
+    try:
+        if execution.uses_processes:
+            # Inference processes load and warm up their own model
+            await execution.warmup()
+            startup_timings['worker_warmup'] = round(time.perf_counter() - start, 3)
+        else:
+            await execution.run_io(warm_up_model)
+    except Exception as e:
+        startup_error = str(e)
+        print(f"Model warm-up failed: {e}")
+        return
+    startup_timings['ready_after'] = round(time.perf_counter() - _module_started, 3)
+    print(f"Startup timings (s): {startup_timings}")
+
+# Open realtime WebSocket connections in this worker
+realtime_connections = 0
+
+def queue_depths() -> dict:
+    """Items waiting in the batching queue and the worker pools"""
+    pools = execution.stats()
+    return {
+        "batch": batch_scheduler.stats()["queue_depth"],
+        "io": pools["io"]["pending"] if pools["io"] else 0,
+        "inference": pools["inference"]["pending"] if pools["inference"] else 0,
+        "jobs": job_queue.depth,
+    }
+
+def session_counts() -> dict:
+    return {"realtime": realtime_connections}
+
+def session_store_size() -> dict:
+    return {session_store.backend: session_store.size()}
 
 # Load model on startup
 @app.on_event("startup")
 async def startup_event():
-    load_model_weights()
+    startup_timings['import_app'] = round(time.perf_counter() - _module_started, 3)
+    execution.start()
+    await batch_scheduler.start()
+    await job_queue.start()
+    app.state.prepare_task = asyncio.create_task(prepare_model())
+    app.state.metrics_task = asyncio.create_task(
+        sample_gauges({
+            "queue_depth": queue_depths,
+            "active_sessions": session_counts,
+            "session_store": session_store_size,
+        })
+    )
+    app.state.session_task = asyncio.create_task(sweep_loop(session_store))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.metrics_task.cancel()
+    app.state.session_task.cancel()
+    await job_queue.stop()
+    await batch_scheduler.stop()
+    execution.shutdown(wait=False)
+    mark_worker_dead()
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Request count, latency and error metrics, labelled by route template"""
+    IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        # Route templates (not raw paths) keep label cardinality bounded
+        path = getattr(route, "path", "unmatched")
+        REQUESTS.labels(path, request.method).inc()
+        REQUEST_SECONDS.labels(path).observe(time.perf_counter() - start)
+        if status_code >= 400:
+            ERRORS.labels(path, str(status_code)).inc()
 
 @app.get("/")
 async def root():
@@ -144,7 +303,7 @@ async def root():
 @app.post("/api/auth/login")
 async def login(credentials: HTTPBasicCredentials = Depends(security)):
     """Login endpoint"""
-    session_token = verify_user(credentials)
+    session_token = await verify_user(credentials)
     return {
         "success": True,
         "session_token": session_token,
@@ -155,86 +314,354 @@ async def login(credentials: HTTPBasicCredentials = Depends(security)):
 @app.post("/api/auth/logout")
 async def logout(session_token: str):
     """Logout endpoint"""
-    if session_token in active_sessions:
-        del active_sessions[session_token]
+    await asyncio.to_thread(session_store.delete, session_token)
     return {"success": True, "message": "Logged out"}
 
 @app.get("/api/auth/verify")
 async def verify_session(session_token: str):
     """Verify session token"""
     try:
-        username = get_current_user(session_token)
+        username = await get_current_user(session_token)
         return {"success": True, "username": username}
     except:
         return {"success": False, "message": "Invalid session"}
 
+async def predict_from_bytes(data: bytes, suffix: str, long: bool = False) -> dict:
+    """Serve a prediction from cache, or run it once for identical concurrent uploads"""
+    version = f"{PREDICTION_VERSION}:long" if long else PREDICTION_VERSION
+    run = run_long_prediction if long else run_prediction
+    key = await execution.run_io(content_key, data, version)
+    result, cached = await prediction_cache.get_or_compute(
+        key, lambda: run(data, suffix)
+    )
+    return {**result, "cached": cached}
+
+def decode_upload(data: bytes, suffix: str, predict) -> Tuple[Optional[np.ndarray], Optional[dict]]:
+    """
+    (crops, None) for an upload of exactly one 75-frame window (or no
+    frames), else (None, windowed transcript). Videos are decoded frame by
+    frame and any other length is transcribed as it decodes, so a long
+    upload never sits in memory whole; frame tensors are already crops.
+    """
+    if is_frame_tensor(data, suffix):
+        with time_stage('decode'):
+            gray, fps = decode_frame_tensor(data, suffix)
+        if gray.shape[0] in (0, WINDOW_FRAMES):
+            return gray, None
+        return None, transcribe_frames(iter(gray), predict, char_lookup, fps)
+    decoder = get_decoder()
+    with memory_file(data, suffix) as path:
+        frames = decoder.iter_frames(path)
+        try:
+            with time_stage('decode'):
+                head = list(itertools.islice(frames, WINDOW_FRAMES + 1))
+            if not head:
+                return np.zeros((0,) + EMPTY_SHAPE[1:], dtype=np.uint8), None
+            if len(head) == WINDOW_FRAMES:
+                return np.stack(head), None
+            return None, transcribe_frames(itertools.chain(head, frames), predict, char_lookup,
+                                           decoder.frame_rate(path))
+        finally:
+            frames.close()
+
+def preprocess_clip(gray: np.ndarray) -> np.ndarray:
+    """load_video normalization for a single 75-frame clip"""
+    with time_stage('preprocess'):
+        return normalize_frames(gray) if gray.shape[0] else np.zeros(EMPTY_SHAPE, dtype=np.float32)
+
+def blocking_predict(loop: asyncio.AbstractEventLoop):
+    """Synchronous predict for io threads; each batch runs on the execution layer of `loop`"""
+    def predict(video_batch: np.ndarray) -> np.ndarray:
+        with time_stage('inference'):
+            return asyncio.run_coroutine_threadsafe(execution.predict(video_batch), loop).result()
+    return predict
+
+def long_result(result: dict) -> dict:
+    return {
+        "success": True,
+        "prediction": result["text"],
+        "words": result["words"],
+        "duration_s": result["duration_s"],
+        "windows": result["windows"],
+        "frames_processed": result["frames"],
+        "video_shape": [result["frames"]] + list(EMPTY_SHAPE[1:]),
+    }
+
+async def run_prediction(data: bytes, suffix: str) -> dict:
+    """Decode an in-memory video and run a 75-frame clip through the batching scheduler"""
+    gray, result = await execution.run_io(
+        decode_upload, data, suffix, blocking_predict(asyncio.get_running_loop())
+    )
+    if result is not None:
+        # Any other length is transcribed in overlapping 75-frame windows
+        FRAMES.labels("upload").inc(result["frames"])
+        return long_result(result)
+
+    # Preprocess with notebook functions, then hand the clip to the
+    # batching scheduler so concurrent uploads share a forward pass
+    frames = await execution.run_io(preprocess_clip, gray)
+    predicted_text = await batch_scheduler.submit(frames)
+    FRAMES.labels("upload").inc(int(frames.shape[0]))
+    
+    return {
+        "success": True,
+        "prediction": predicted_text,
+        "frames_processed": int(frames.shape[0]),
+        "video_shape": list(frames.shape)
+    }
+
+async def run_long_prediction(data: bytes, suffix: str) -> dict:
+    """Transcribe a video of any length, decoding it frame by frame"""
+    result = await execution.run_io(
+        transcribe_bytes, data, suffix, blocking_predict(asyncio.get_running_loop()), char_lookup
+    )
+    FRAMES.labels("long").inc(result["frames"])
+    return long_result(result)
+
 @app.post("/api/predict/upload")
 async def predict_from_upload(
+    request: Request,
     file: UploadFile = File(...),
     session_token: Optional[str] = None
 ):
-    """Predict from uploaded video file"""
+    """Predict from an uploaded video file, or pre-cropped frames (.npy, .npz, .lipf)"""
     try:
         # Verify session (optional for demo)
-        # username = get_current_user(session_token)
-        
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mpg') as tmp_file:
-            shutil.copyfileobj(file.file, tmp_file)
-            tmp_path = tmp_file.name
+        # username = await get_current_user(session_token)
         
-        try:
-            # Make prediction using notebook functions
-            if model is None:
-                load_model_weights()
-            
-            # Use unified processing function from notebook
-            predicted_text, frames = process_video_for_prediction(tmp_path, model)
-            
-            return {
-                "success": True,
-                "prediction": predicted_text,
-                "frames_processed": int(frames.shape[0]),
-                "video_shape": list(frames.shape)
-            }
-        finally:
-            # Clean up temp file
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+        check_content_length(request.headers.get("content-length"))
+        with time_stage('upload_receive'):
+            data = await read_upload(file)
+        return await predict_from_bytes(data, upload_suffix(file.filename))
                 
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FrameTensorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
-@app.post("/api/predict/realtime")
-async def predict_realtime(
-    frames_data: dict,
+@app.post("/api/predict/stream")
+async def predict_from_stream(
+    request: Request,
+    filename: Optional[str] = None,
     session_token: Optional[str] = None
 ):
-    """Predict from realtime camera frames (dummy implementation)"""
+    """Predict from a raw video request body (no multipart, streamed with a size limit)"""
     try:
-        # Verify session (optional for demo)
-        # username = get_current_user(session_token)
-        
-        # Dummy implementation - in real app, process camera frames
-        # For now, return a placeholder
-        return {
-            "success": True,
-            "prediction": "realtime prediction (dummy mode)",
-            "message": "Realtime camera tracking is in development",
-            "frames_received": frames_data.get("frame_count", 0)
-        }
+        check_content_length(request.headers.get("content-length"))
+        with time_stage('upload_receive'):
+            data = await read_stream(request.stream())
+        return await predict_from_bytes(data, upload_suffix(filename))
+    
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FrameTensorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Realtime prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+@app.post("/api/predict/long")
+async def predict_long_video(
+    request: Request,
+    file: UploadFile = File(...),
+    session_token: Optional[str] = None
+):
+    """
+    Transcribe a recording of any length. Frames are decoded incrementally
+    and run in overlapping windows; the response adds per-word timestamps.
+    """
+    try:
+        check_content_length(request.headers.get("content-length"))
+        with time_stage('upload_receive'):
+            data = await read_upload(file)
+        return await predict_from_bytes(data, upload_suffix(file.filename), long=True)
+
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FrameTensorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+@app.post("/api/predict/batch")
+async def predict_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    session_token: Optional[str] = None
+):
+    """
+    Transcribe many clips in one request: any number of videos and/or
+    zip/tar archives of them. Results stream back as newline-delimited JSON,
+    one record per clip in completion order, then a summary record.
+    """
+    try:
+        check_content_length(request.headers.get("content-length"), DEFAULT_MAX_BULK_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    sources = [(f.filename, await execution.run_io(detach_upload, f)) for f in files]
+
+    async def records():
+        async for record in run_bulk(iter_items(sources), predict_from_bytes, execution.run_io):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(records(), media_type="application/x-ndjson")
+
+async def predict_job(data: bytes, suffix: str, long: bool = False) -> dict:
+    """Job runner: the same cached, batched path as the synchronous endpoints"""
+    return await predict_from_bytes(data, suffix, long=long)
+
+# Background transcription jobs (LIPNET_JOB_DIR, LIPNET_JOB_WORKERS,
+# LIPNET_JOB_QUEUE, LIPNET_JOB_TTL_SECONDS)
+job_queue = JobQueue(predict_job)
+
+def job_links(job_id: str) -> dict:
+    return {"status_url": f"/api/jobs/{job_id}", "result_url": f"/api/jobs/{job_id}/result"}
+
+@app.post("/api/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(
+    request: Request,
+    file: UploadFile = File(...),
+    long: bool = False,
+    session_token: Optional[str] = None
+):
+    """
+    Queue a video for transcription; poll the returned status URL for the
+    result. Pass long=true for recordings longer than one 75-frame clip.
+    """
+    try:
+        check_content_length(request.headers.get("content-length"))
+        with time_stage('upload_receive'):
+            data = await read_upload(file)
+        job_id = await job_queue.submit(data, upload_suffix(file.filename), file.filename, long=long)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return {"job_id": job_id, "status": "queued", **job_links(job_id)}
+
+async def get_job_or_404(job_id: str) -> dict:
+    job = await job_queue.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Job status and timing, without the result payload"""
+    job = await get_job_or_404(job_id)
+    return {**{k: v for k, v in job.items() if k != "result"}, **job_links(job_id)}
+
+@app.get("/api/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """The prediction once done; 202 while queued or running, 409 if failed or cancelled"""
+    job = await get_job_or_404(job_id)
+    if job["status"] == DONE:
+        return job["result"]
+    if job["status"] in (FAILED, CANCELLED):
+        raise HTTPException(status_code=409, detail=job["error"] or f"Job {job['status']}")
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": job["status"]},
+        headers={"Retry-After": "1"},
+    )
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    await get_job_or_404(job_id)
+    job = await job_queue.cancel(job_id)
+    return {"job_id": job_id, "status": job["status"] if job else CANCELLED}
+
+@app.websocket("/api/predict/realtime")
+async def predict_realtime(websocket: WebSocket, session_token: Optional[str] = None):
+    """
+    Stream compressed camera frames (binary messages) and receive partial
+    and final transcripts. Send {"type": "end"} to flush and close.
+    """
+    global realtime_connections
+    # Verify session (optional for demo)
+    # username = await get_current_user(session_token)
+    await websocket.accept()
+    # Frames of one connection are decoded in order, so one tracker per connection is safe
+    tracker = MouthTracker() if DEFAULT_ROI_MODE == "track" else None
+    session = StreamSession(
+        predict=batch_scheduler.submit,
+        decode=lambda data: execution.run_io(decode_frame, data, tracker),
+        # Not built until warm-up has finished; until then windows are recomputed in full
+        predict_incremental=incremental_predictor(incremental_model) if incremental_model is not None else None,
+    )
+    realtime_connections += 1
+    try:
+        await session.run(websocket.receive, websocket.send_json)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        # Anything the session could not report itself: tell the client before closing
+        try:
+            await websocket.send_json({"type": "error", "message": str(e) or type(e).__name__})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        realtime_connections -= 1
+        FRAMES.labels("realtime").inc(session.frames_received - session.frames_dropped - session.frames_failed)
+        if tracker is not None:
+            roi_stats.record(tracker.timings, cached=False)
+
+def health_status() -> str:
+    """healthy only once trained weights are loaded and warmed up"""
+    if startup_error is not None:
+        return "unhealthy"
+    if not is_ready():
+        return "starting"
+    return "healthy" if weights_loaded() else "degraded"
 
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
     return {
-        "status": "healthy",
-        "model_loaded": model is not None,
+        "status": health_status(),
+        "model_loaded": weights_loaded(),
+        "ready": is_ready(),
+        "serving": serving_model.stats() if serving_model is not None else None,
+        "execution": execution.stats(),
+        "model_version": MODEL_VERSION,
+        "cache": prediction_cache.stats(),
+        "jobs": job_queue.stats(),
+        "sessions": session_store.stats(),
+        "roi": {"mode": DEFAULT_ROI_MODE, **roi_stats.snapshot(), "cached_videos": len(roi_cache)},
+        "startup": {"timings": startup_timings, "error": startup_error},
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/api/health/live")
+async def liveness():
+    """Liveness probe: the process is up and the event loop responds"""
+    return {"status": "alive"}
+
+@app.get("/api/health/ready")
+async def readiness():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 before"""
+    status_name = health_status()
+    body = {"status": status_name, "ready": is_ready(), "model_loaded": weights_loaded()}
+    if not is_ready():
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint (aggregated across workers with PROMETHEUS_MULTIPROC_DIR)"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,127 @@
+"""
+Prometheus metrics for the LipNet API.
+
+Stage latencies are histograms labelled by stage; requests, errors and
+frames are counters; in-flight requests, queue depths and active sessions
+are gauges. Queue depths and session counts are sampled by a background
+task rather than updated on every enqueue, which keeps the hot path to a
+single histogram observation per stage.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory before starting the server: each worker then writes its
+samples to memory-mapped files there and /metrics aggregates all of them.
+"""
+import os
+import time
+import asyncio
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+)
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+DEFAULT_SAMPLE_INTERVAL = float(os.getenv("LIPNET_METRICS_INTERVAL_SECONDS", "1"))
+
+# roi_* are per-video totals, only recorded with LIPNET_ROI=track
+STAGES = ('upload_receive', 'decode', 'preprocess', 'inference', 'ctc_decode', 'roi_detect', 'roi_track')
+# 1 ms to 30 s: decode and batched inference on CPU run to several seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    'lipnet_stage_seconds', 'Time spent in each prediction stage', ['stage'], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    'lipnet_request_seconds', 'End-to-end HTTP request latency', ['route'], buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    'lipnet_inference_batch_size', 'Clips per inference batch', buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+REQUESTS = Counter('lipnet_requests', 'HTTP requests handled', ['route', 'method'])
+ERRORS = Counter('lipnet_request_errors', 'HTTP responses with status >= 400', ['route', 'status'])
+FRAMES = Counter('lipnet_frames_processed', 'Video frames run through the model', ['source'])
+# Gauges are summed over live workers in multiprocess mode
+IN_FLIGHT = Gauge('lipnet_inflight_requests', 'HTTP requests currently being handled', multiprocess_mode='livesum')
+QUEUE_DEPTH = Gauge('lipnet_queue_depth', 'Items waiting in each queue', ['queue'], multiprocess_mode='livesum')
+ACTIVE_SESSIONS = Gauge('lipnet_active_sessions', 'Open sessions by kind', ['kind'], multiprocess_mode='livesum')
+# A shared (sqlite) store reports the same size from every worker, so take the max
+SESSION_STORE_SIZE = Gauge('lipnet_session_store_size', 'Login sessions in the session store', ['backend'],
+                           multiprocess_mode='livemax')
+SESSION_EVICTIONS = Counter('lipnet_session_evictions', 'Login sessions removed, by reason', ['reason'])
+
+# Label children resolved once; .labels() takes a lock on every call
+_stage_children = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+
+
+def observe_stage(stage: str, seconds: float):
+    _stage_children[stage].observe(seconds)
+
+
+@contextmanager
+def time_stage(stage: str):
+    """Record the duration of the enclosed block under `stage`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_children[stage].observe(time.perf_counter() - start)
+
+
+def render() -> tuple:
+    """(body, content type) for the /metrics response"""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead():
+    """Drop this worker's live gauges from the multiprocess aggregate"""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
+
+
+async def sample_gauges(sources: Dict[str, Callable[[], Dict[str, int]]], interval: float = DEFAULT_SAMPLE_INTERVAL):
+    """
+    Periodically copy queue depths and session counts into gauges.
+    `sources` maps a gauge name ('queue_depth', 'active_sessions',
+    'session_store') to a callable returning {label: value}.
+    """
+    gauges = {'queue_depth': QUEUE_DEPTH, 'active_sessions': ACTIVE_SESSIONS, 'session_store': SESSION_STORE_SIZE}
+    while True:
+        for name, read in sources.items():
+            try:
+                values = read()
+            except Exception:
+                continue
+            for label, value in values.items():
+                gauges[name].labels(label).set(value)
+        await asyncio.sleep(interval)
+
+
+__all__ = [
+    'STAGES',
+    'STAGE_SECONDS',
+    'REQUEST_SECONDS',
+    'BATCH_SIZE',
+    'REQUESTS',
+    'ERRORS',
+    'FRAMES',
+    'IN_FLIGHT',
+    'QUEUE_DEPTH',
+    'ACTIVE_SESSIONS',
+    'SESSION_STORE_SIZE',
+    'SESSION_EVICTIONS',
+    'observe_stage',
+    'time_stage',
+    'render',
+    'mark_worker_dead',
+    'sample_gauges',
+]
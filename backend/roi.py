@@ -0,0 +1,403 @@
+"""
+Mouth region-of-interest detection and tracking.
+
+load_video always crops frame[190:236, 80:220], which only fits speakers
+framed like the GRID corpus. With LIPNET_ROI=track the decoders locate the
+mouth instead: OpenCV's bundled Haar face cascade runs every
+LIPNET_ROI_DETECT_EVERY frames, the mouth box is placed in the lower part
+of the face, and between detections the box is followed by template
+matching in a small search window of a downscaled grayscale frame. Each box
+is resampled to the 46x140 model input.
+
+Boxes are cached per video (by content hash, or path, size and mtime), so
+decoding the same video again skips detection and tracking. Detection,
+tracking and resampling time is accumulated in `roi_stats`.
+
+Until a face has been found the fixed GRID crop is used, so GRID videos
+whose faces the cascade misses still get the crop the model was trained on.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+try:
+    from video_io import CROP_LEFT, CROP_TOP, EMPTY_SHAPE, VideoDecoder, memory_file, to_grayscale
+except ImportError:
+    from backend.video_io import CROP_LEFT, CROP_TOP, EMPTY_SHAPE, VideoDecoder, memory_file, to_grayscale
+
+DEFAULT_DETECT_EVERY = int(os.getenv("LIPNET_ROI_DETECT_EVERY", "10"))
+DEFAULT_ROI_CACHE_ENTRIES = int(os.getenv("LIPNET_ROI_CACHE_ENTRIES", "256"))
+DEFAULT_CASCADE = os.getenv("LIPNET_ROI_CASCADE")
+
+OUT_H, OUT_W = EMPTY_SHAPE[1:3]
+# Mouth box relative to a Haar face box: width as a fraction of the face
+# width, vertical centre as a fraction of the face height. Chosen so a GRID
+# face gives roughly the same framing as the fixed crop.
+MOUTH_WIDTH = 0.85
+MOUTH_CENTER_Y = 0.82
+# Tracking runs on frames downscaled to at most this width
+TRACK_WIDTH = 320
+# Search window around the previous box, as a fraction of its size
+SEARCH_MARGIN = 0.3
+# Template matches below this score count as lost; detection runs next frame
+MIN_TRACK_SCORE = 0.5
+
+Box = Tuple[float, float, float, float]  # x, y, width, height in frame pixels
+
+_local = threading.local()
+
+
+def _cascade(path: Optional[str] = None):
+    """Per-thread CascadeClassifier; detectMultiScale is not safe to share"""
+    import cv2
+
+    if not hasattr(cv2, 'CascadeClassifier'):
+        raise RuntimeError("LIPNET_ROI=track needs cv2.CascadeClassifier (OpenCV 4.x)")
+    path = path or DEFAULT_CASCADE or os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+    cascades = getattr(_local, 'cascades', None)
+    if cascades is None:
+        cascades = _local.cascades = {}
+    if path not in cascades:
+        cascade = cv2.CascadeClassifier(path)
+        if cascade.empty():
+            raise RuntimeError(f"Could not load face cascade {path}")
+        cascades[path] = cascade
+    return cascades[path]
+
+
+def fixed_box(height: int, width: int) -> Box:
+    """The GRID crop as a box, shifted to fit inside smaller frames"""
+    x = min(CROP_LEFT, max(width - OUT_W, 0))
+    y = min(CROP_TOP, max(height - OUT_H, 0))
+    return float(x), float(y), float(min(OUT_W, width)), float(min(OUT_H, height))
+
+
+def clip_box(box: Box, height: int, width: int) -> Tuple[int, int, int, int]:
+    """Integer (x, y, w, h) inside the frame; boxes at the edge are shifted in, not shrunk"""
+    x, y, w, h = box
+    w = int(round(min(max(w, 1.0), width)))
+    h = int(round(min(max(h, 1.0), height)))
+    x = int(round(min(max(x, 0.0), width - w)))
+    y = int(round(min(max(y, 0.0), height - h)))
+    return x, y, w, h
+
+
+def resample(frame: np.ndarray, box: Box) -> np.ndarray:
+    """Crop `box` from a BGR frame and return a (46, 140, 1) uint8 grayscale ROI"""
+    import cv2
+
+    x, y, w, h = clip_box(box, *frame.shape[:2])
+    crop = frame[y:y + h, x:x + w]
+    if crop.shape[:2] != (OUT_H, OUT_W):
+        interpolation = cv2.INTER_AREA if w >= OUT_W else cv2.INTER_LINEAR
+        crop = cv2.resize(crop, (OUT_W, OUT_H), interpolation=interpolation)
+    return to_grayscale(crop)
+
+
+class ROITimings:
+    """Per-video counters and seconds spent in each ROI step"""
+
+    __slots__ = ('frames', 'detections', 'detected', 'tracked', 'lost', 'detect_s', 'track_s', 'resample_s')
+
+    def __init__(self):
+        self.frames = self.detections = self.detected = self.tracked = self.lost = 0
+        self.detect_s = self.track_s = self.resample_s = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class MouthTracker:
+    """
+    Locates the mouth frame by frame: face detection every `detect_every`
+    frames (or as soon as tracking is lost), template tracking in between.
+    One tracker per video or stream; not thread-safe.
+    """
+
+    def __init__(self, detect_every: int = DEFAULT_DETECT_EVERY, cascade: Optional[str] = None,
+                 smoothing: float = 0.5):
+        if detect_every < 1:
+            raise ValueError("detect_every must be >= 1")
+        self.detect_every = detect_every
+        self.cascade = cascade
+        self.smoothing = smoothing
+        self.timings = ROITimings()
+        self._box: Optional[Box] = None
+        self._template: Optional[np.ndarray] = None
+        self._since_detect = detect_every  # detect on the first frame
+
+    def _small_gray(self, frame: np.ndarray) -> Tuple[np.ndarray, float]:
+        import cv2
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 and frame.shape[2] == 3 else frame
+        scale = min(1.0, TRACK_WIDTH / gray.shape[1])
+        if scale < 1.0:
+            gray = cv2.resize(gray, (int(gray.shape[1] * scale), int(gray.shape[0] * scale)),
+                              interpolation=cv2.INTER_AREA)
+        return gray, scale
+
+    def _detect(self, small: np.ndarray, scale: float) -> Optional[Box]:
+        import cv2
+
+        faces = _cascade(self.cascade).detectMultiScale(
+            cv2.equalizeHist(small), scaleFactor=1.1, minNeighbors=5, minSize=(24, 24)
+        )
+        self.timings.detections += 1
+        if len(faces) == 0:
+            return None
+        fx, fy, fw, fh = (float(v) / scale for v in max(faces, key=lambda f: f[2] * f[3]))
+        w = MOUTH_WIDTH * fw
+        h = w * OUT_H / OUT_W
+        return fx + fw / 2 - w / 2, fy + MOUTH_CENTER_Y * fh - h / 2, w, h
+
+    def _small_box(self, small: np.ndarray, scale: float) -> Tuple[int, int, int, int]:
+        x, y, w, h = self._box
+        return clip_box((x * scale, y * scale, w * scale, h * scale), *small.shape[:2])
+
+    def _track(self, small: np.ndarray, scale: float) -> Optional[Box]:
+        import cv2
+
+        x, y, w, h = self._small_box(small, scale)
+        if self._template is None or self._template.shape != (h, w):
+            return None
+        mx, my = int(w * SEARCH_MARGIN) + 1, int(h * SEARCH_MARGIN) + 1
+        top, left = max(y - my, 0), max(x - mx, 0)
+        region = small[top:min(y + h + my, small.shape[0]), left:min(x + w + mx, small.shape[1])]
+        if region.shape[0] < h or region.shape[1] < w:
+            return None
+        _, score, _, (dx, dy) = cv2.minMaxLoc(cv2.matchTemplate(region, self._template, cv2.TM_CCOEFF_NORMED))
+        if score < MIN_TRACK_SCORE:
+            return None
+        _, _, bw, bh = self._box
+        return (left + dx) / scale, (top + dy) / scale, bw, bh
+
+    def locate(self, frame: np.ndarray) -> Box:
+        """Mouth box for the next BGR (or grayscale) frame of the video"""
+        self.timings.frames += 1
+        small, scale = self._small_gray(frame)
+        box = None
+        detected = False
+        if self._since_detect >= self.detect_every:
+            start = time.perf_counter()
+            found = self._detect(small, scale)
+            self.timings.detect_s += time.perf_counter() - start
+            # Retried after another `detect_every` frames when nothing is found
+            self._since_detect = 0
+            if found is not None:
+                self.timings.detected += 1
+                if self._box is not None:
+                    a = self.smoothing
+                    found = tuple(a * old + (1 - a) * new for old, new in zip(self._box, found))
+                box, detected = found, True
+        if box is None and self._box is not None:
+            start = time.perf_counter()
+            box = self._track(small, scale)
+            self.timings.track_s += time.perf_counter() - start
+            if box is None:
+                # Hold the last box and re-detect on the next frame
+                self.timings.lost += 1
+                self._since_detect = self.detect_every
+                box = self._box
+            else:
+                self.timings.tracked += 1
+        self._since_detect += 1
+        if box is None:
+            return fixed_box(*frame.shape[:2])
+        self._box = box
+        if detected:
+            # The template stays anchored to the last detection, so tracking
+            # errors do not accumulate from frame to frame
+            sx, sy, sw, sh = self._small_box(small, scale)
+            self._template = small[sy:sy + sh, sx:sx + sw].copy()
+        return box
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """locate() and resample() in one step"""
+        box = self.locate(frame)
+        start = time.perf_counter()
+        roi = resample(frame, box)
+        self.timings.resample_s += time.perf_counter() - start
+        return roi
+
+
+class ROICache:
+    """LRU of per-frame mouth boxes, keyed by video identity"""
+
+    def __init__(self, max_entries: int = DEFAULT_ROI_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Optional[str]) -> Optional[np.ndarray]:
+        if key is None:
+            return None
+        with self._lock:
+            boxes = self._entries.get(key)
+            if boxes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return boxes
+
+    def put(self, key: Optional[str], boxes: np.ndarray):
+        if key is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = boxes
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def bytes_key(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def path_key(path: str) -> Optional[str]:
+    """Identity of a video file; None for in-memory uploads exposed through /proc"""
+    if path.startswith('/proc/'):
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.realpath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+class ROIStats:
+    """Totals over every video decoded with tracking, for health checks and benchmarks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.videos = 0
+        self.cache_hits = 0
+        self.totals = ROITimings()
+        # Called with ('roi_detect' | 'roi_track', seconds) once per video
+        self.observer: Optional[Callable[[str, float], None]] = None
+
+    def record(self, timings: ROITimings, cached: bool):
+        with self._lock:
+            self.videos += 1
+            self.cache_hits += int(cached)
+            for name in ROITimings.__slots__:
+                setattr(self.totals, name, getattr(self.totals, name) + getattr(timings, name))
+        if self.observer is not None and not cached:
+            self.observer('roi_detect', timings.detect_s)
+            self.observer('roi_track', timings.track_s + timings.resample_s)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            totals = self.totals.as_dict()
+            frames = max(self.totals.frames, 1)
+            return {
+                "videos": self.videos,
+                "cache_hits": self.cache_hits,
+                **totals,
+                "detect_ms_per_frame": round(1000.0 * self.totals.detect_s / frames, 3),
+                "track_ms_per_frame": round(1000.0 * self.totals.track_s / frames, 3),
+            }
+
+
+roi_stats = ROIStats()
+roi_cache = ROICache()
+
+
+def track_frames(frames: Iterable[np.ndarray], key: Optional[str] = None,
+                 detect_every: int = DEFAULT_DETECT_EVERY, cache: ROICache = roi_cache) -> Iterator[np.ndarray]:
+    """
+    Yield a (46, 140, 1) uint8 mouth ROI for each BGR frame. Boxes come from
+    `cache` when the video was seen before, otherwise from a MouthTracker;
+    a fully consumed video's boxes are cached under `key`.
+    """
+    boxes = cache.get(key)
+    if boxes is not None:
+        timings = ROITimings()
+        for frame, box in zip(frames, boxes):
+            # Timed before yielding, so the consumer's work on the frame is not counted
+            start = time.perf_counter()
+            roi = resample(frame, tuple(box))
+            timings.resample_s += time.perf_counter() - start
+            timings.frames += 1
+            yield roi
+        roi_stats.record(timings, cached=True)
+        return
+
+    tracker = MouthTracker(detect_every)
+    located = []
+    for frame in frames:
+        box = tracker.locate(frame)
+        located.append(box)
+        start = time.perf_counter()
+        roi = resample(frame, box)
+        tracker.timings.resample_s += time.perf_counter() - start
+        yield roi
+    roi_stats.record(tracker.timings, cached=False)
+    if located:
+        cache.put(key, np.asarray(located, dtype=np.float32))
+
+
+class ROIDecoder(VideoDecoder):
+    """
+    Wraps a decoder's uncropped frames with mouth tracking. Output has the
+    same (T, 46, 140, 1) uint8 shape as the fixed-crop decoders.
+    """
+
+    def __init__(self, source: VideoDecoder, detect_every: int = DEFAULT_DETECT_EVERY, cache: ROICache = roi_cache):
+        self.source = source
+        self.name = f"{source.name}+roi"
+        self.detect_every = detect_every
+        self.cache = cache
+
+    def _track(self, path: str, key: Optional[str]) -> Iterator[np.ndarray]:
+        return track_frames(self.source.iter_color_frames(path), key, self.detect_every, self.cache)
+
+    @staticmethod
+    def _stack(frames: Iterable[np.ndarray]) -> np.ndarray:
+        frames = list(frames)
+        if not frames:
+            return np.zeros((0,) + EMPTY_SHAPE[1:], dtype=np.uint8)
+        return np.stack(frames)
+
+    def decode(self, path: str) -> np.ndarray:
+        return self._stack(self._track(path, path_key(path)))
+
+    def decode_bytes(self, data: bytes, suffix: str = ".mpg") -> np.ndarray:
+        with memory_file(data, suffix) as path:
+            return self._stack(self._track(path, bytes_key(data)))
+
+    def iter_frames(self, path: str) -> Iterator[np.ndarray]:
+        yield from self._track(path, path_key(path))
+
+    def iter_frames_bytes(self, data: bytes, suffix: str = ".mpg") -> Iterator[np.ndarray]:
+        with memory_file(data, suffix) as path:
+            yield from self._track(path, bytes_key(data))
+
+    def frame_rate(self, path: str) -> Optional[float]:
+        return self.source.frame_rate(path)
+
+
+__all__ = [
+    'ROIDecoder',
+    'MouthTracker',
+    'ROICache',
+    'ROIStats',
+    'ROITimings',
+    'roi_cache',
+    'roi_stats',
+    'track_frames',
+    'resample',
+    'fixed_box',
+    'bytes_key',
+    'path_key',
+]
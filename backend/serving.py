@@ -0,0 +1,328 @@
+"""
+Compiled, warmed-up inference wrapper around the LipNet model.
+
+TensorFlow is imported when a model is first built or loaded, not at
+module import. A pre-exported model (LIPNET_MODEL_PATH, a SavedModel
+directory or .keras archive) is loaded directly; without one the
+architecture is rebuilt and the checkpoint restored.
+
+Export the restored checkpoint:
+    python backend/serving.py export --out models/lipnet.keras
+    python backend/serving.py export --out models/lipnet_savedmodel
+"""
+import os
+import time
+import argparse
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def _parse_buckets(value: str) -> Tuple[int, ...]:
+    return tuple(sorted({int(v) for v in value.split(',') if v.strip()}))
+
+
+DEFAULT_BATCH_BUCKETS = _parse_buckets(os.getenv("LIPNET_BATCH_BUCKETS", "1,2,4,8"))
+DEFAULT_JIT_COMPILE = os.getenv("LIPNET_XLA", "0") == "1"
+DEFAULT_WARMUP_RUNS = int(os.getenv("LIPNET_WARMUP_RUNS", "1"))
+# Inference engine chosen at startup: 'keras' or 'tflite' (LIPNET_TFLITE_PATH)
+DEFAULT_ENGINE = os.getenv("LIPNET_ENGINE", "keras")
+DEFAULT_TFLITE_PATH = os.getenv("LIPNET_TFLITE_PATH", os.path.join('models', 'lipnet-dynamic.tflite'))
+# TensorFlow thread pools; 0 keeps TensorFlow's default (one thread per core)
+DEFAULT_INTRA_OP_THREADS = int(os.getenv("LIPNET_INTRA_OP_THREADS", "0"))
+DEFAULT_INTER_OP_THREADS = int(os.getenv("LIPNET_INTER_OP_THREADS", "0"))
+INPUT_SHAPE = (75, 46, 140, 1)
+
+
+class CompiledModel:
+    """
+    Serving wrapper with the same `predict(batch, verbose=0)` call as a Keras
+    model, but backed by one tf.function with a fixed input signature.
+
+    Batches are zero-padded up to the next bucket size (and split when
+    larger than the biggest bucket), so XLA compiles at most one program
+    per bucket and warm-up can cover every shape served. Clips whose frame
+    shape differs from the model input fall back to `model.predict`.
+    """
+
+    def __init__(
+        self,
+        model,
+        batch_buckets: Sequence[int] = DEFAULT_BATCH_BUCKETS,
+        jit_compile: bool = DEFAULT_JIT_COMPILE,
+        input_shape: Tuple[int, ...] = INPUT_SHAPE,
+        weights_loaded: bool = True,
+    ):
+        import tensorflow as tf
+
+        if not batch_buckets:
+            raise ValueError("At least one batch bucket is required")
+        self.model = model
+        self.batch_buckets = tuple(sorted(batch_buckets))
+        self.jit_compile = jit_compile
+        self.input_shape = tuple(input_shape)
+        self.weights_loaded = weights_loaded
+        self.ready = False
+        self.warmup_seconds: Dict[int, float] = {}
+        self._constant = tf.constant
+        self._forward = tf.function(
+            self._call,
+            input_signature=[tf.TensorSpec(shape=(None,) + self.input_shape, dtype=tf.float32)],
+            jit_compile=jit_compile,
+        )
+
+    def _call(self, video_batch):
+        return self.model(video_batch, training=False)
+
+    def bucket_for(self, batch_size: int) -> int:
+        """Smallest bucket that fits `batch_size` (the largest bucket if none does)"""
+        for bucket in self.batch_buckets:
+            if bucket >= batch_size:
+                return bucket
+        return self.batch_buckets[-1]
+
+    def _run_bucket(self, video_batch: np.ndarray) -> np.ndarray:
+        count = video_batch.shape[0]
+        bucket = self.bucket_for(count)
+        if bucket != count:
+            padded = np.zeros((bucket,) + self.input_shape, dtype=np.float32)
+            padded[:count] = video_batch
+            video_batch = padded
+        return self._forward(self._constant(video_batch)).numpy()[:count]
+
+    def predict(self, video_batch, verbose: int = 0) -> np.ndarray:
+        """Run a `(N, 75, 46, 140, 1)` batch through the compiled function"""
+        video_batch = np.asarray(video_batch, dtype=np.float32)
+        if video_batch.shape[1:] != self.input_shape:
+            return np.asarray(self.model.predict(video_batch, verbose=verbose))
+        largest = self.batch_buckets[-1]
+        if video_batch.shape[0] <= largest:
+            return self._run_bucket(video_batch)
+        return np.concatenate(
+            [self._run_bucket(video_batch[i:i + largest]) for i in range(0, video_batch.shape[0], largest)],
+            axis=0,
+        )
+
+    def warmup(self, runs: int = DEFAULT_WARMUP_RUNS) -> Dict[int, float]:
+        """
+        Trace (and XLA-compile) every bucket before serving.
+        Returns the seconds spent per bucket and marks the model ready.
+        """
+        for bucket in self.batch_buckets:
+            dummy = np.zeros((bucket,) + self.input_shape, dtype=np.float32)
+            start = time.perf_counter()
+            for _ in range(max(runs, 1)):
+                self._run_bucket(dummy)
+            self.warmup_seconds[bucket] = time.perf_counter() - start
+        self.ready = True
+        return self.warmup_seconds
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "weights_loaded": self.weights_loaded,
+            "batch_buckets": list(self.batch_buckets),
+            "jit_compile": self.jit_compile,
+            "warmup_seconds": {str(k): round(v, 3) for k, v in self.warmup_seconds.items()},
+        }
+
+
+def compile_model(model, warmup: bool = True, **kwargs) -> CompiledModel:
+    """Wrap a Keras model for serving and optionally warm it up"""
+    compiled = CompiledModel(model, **kwargs)
+    if warmup:
+        compiled.warmup()
+    return compiled
+
+
+class SavedModelFunction:
+    """
+    Model-like view of an exported SavedModel's serving function, so it
+    can be wrapped in CompiledModel like a Keras model.
+    """
+
+    def __init__(self, path: str):
+        import tensorflow as tf
+
+        self.path = path
+        self._loaded = tf.saved_model.load(path)
+        self._serve = self._loaded.signatures['serving_default']
+        self._constant = tf.constant
+
+    def __call__(self, video_batch, training: bool = False):
+        return next(iter(self._serve(video=video_batch).values()))
+
+    def predict(self, video_batch, verbose: int = 0) -> np.ndarray:
+        return self(self._constant(np.asarray(video_batch, dtype=np.float32))).numpy()
+
+
+def export_model(model, path: str) -> str:
+    """
+    Serialize a Keras model for fast startup: a `.keras`/`.h5` path gets a
+    Keras archive, anything else a SavedModel directory with a
+    `serving_default` signature over `(None, 75, 46, 140, 1)` float32 input.
+    """
+    import tensorflow as tf
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith(('.keras', '.h5')):
+        model.save(path)
+        return path
+
+    module = tf.Module()
+    module.model = model
+    module.serve = tf.function(
+        lambda video: {"output": model(video, training=False)},
+        input_signature=[tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32, name='video')],
+    )
+    tf.saved_model.save(module, path, signatures={'serving_default': module.serve})
+    return path
+
+
+def load_exported_model(path: str):
+    """
+    Load an exported model. Returns (keras_model or None, model-like
+    callable); a SavedModel has no Keras layers to return.
+    """
+    if os.path.isdir(path):
+        return None, SavedModelFunction(path)
+    import tensorflow as tf
+
+    keras_model = tf.keras.models.load_model(path, compile=False)
+    return keras_model, keras_model
+
+
+@contextmanager
+def _timed(timings: Optional[dict], phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[phase] = round(time.perf_counter() - start, 3)
+
+
+def configure_threads(intra_op: int = DEFAULT_INTRA_OP_THREADS, inter_op: int = DEFAULT_INTER_OP_THREADS):
+    """Size TensorFlow's thread pools; must run before the first op executes"""
+    import tensorflow as tf
+
+    if intra_op > 0:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    if inter_op > 0:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+
+def tflite_path(base_dir: Optional[str] = None) -> str:
+    path = DEFAULT_TFLITE_PATH
+    if not os.path.isabs(path) and base_dir is not None:
+        path = os.path.join(base_dir, path)
+    return path
+
+
+def engine_version(base_dir: Optional[str] = None, engine: Optional[str] = None, shared: bool = False) -> str:
+    """
+    Identifier for the engine that produces predictions: 'keras', or the
+    TFLite model's file name (which names its quantization), size and mtime.
+    `shared` is set when inference processes serve the Keras model through
+    its shared float32 TFLite export (shared_weights.py).
+    """
+    engine = engine or DEFAULT_ENGINE
+    if engine != 'tflite':
+        return f"{engine}-tflite-float32" if shared else engine
+    path = tflite_path(base_dir)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return f"tflite-{os.path.basename(path)}-missing"
+    return f"tflite-{os.path.basename(path)}-{stat.st_size:x}-{int(stat.st_mtime):x}"
+
+
+def load_serving_model(
+    base_dir: Optional[str] = None,
+    engine: Optional[str] = None,
+    timings: Optional[dict] = None,
+    threads: Optional[Tuple[int, int]] = None,
+    model_path: Optional[str] = None,
+    mapped: bool = False,
+):
+    """
+    Build the engine selected by LIPNET_ENGINE.
+    Returns (keras_model or None, serving model with `predict` and `warmup`).
+    Seconds spent per phase are recorded in `timings` when given.
+    `threads` is (intra_op, inter_op), defaulting to LIPNET_INTRA_OP_THREADS /
+    LIPNET_INTER_OP_THREADS. For the TFLite engine, `model_path` replaces
+    LIPNET_TFLITE_PATH and `mapped` keeps the weights in the mapped file
+    (see TFLiteModel and shared_weights.py).
+    """
+    engine = engine or DEFAULT_ENGINE
+    with _timed(timings, 'import_tensorflow'):
+        import tensorflow  # noqa: F401
+    configure_threads(*(threads or (DEFAULT_INTRA_OP_THREADS, DEFAULT_INTER_OP_THREADS)))
+
+    if engine == 'tflite':
+        try:
+            from tflite_engine import TFLiteModel
+        except ImportError:
+            from backend.tflite_engine import TFLiteModel
+        path = model_path or tflite_path(base_dir)
+        with _timed(timings, 'load_model'):
+            if threads and threads[0] > 0 and not os.getenv("LIPNET_TFLITE_THREADS"):
+                return None, TFLiteModel(path, num_threads=threads[0], mapped=mapped)
+            return None, TFLiteModel(path, mapped=mapped)
+    if engine != 'keras':
+        raise ValueError(f"Unknown engine '{engine}'. Choose 'keras' or 'tflite'")
+
+    try:
+        from lipnet_utils import build_model, load_weights, exported_model_path
+    except ImportError:
+        from backend.lipnet_utils import build_model, load_weights, exported_model_path
+    exported = exported_model_path(base_dir)
+    if exported is not None:
+        with _timed(timings, 'load_model'):
+            keras_model, forward = load_exported_model(exported)
+            return keras_model, CompiledModel(forward)
+
+    with _timed(timings, 'build_model'):
+        keras_model = build_model()
+    with _timed(timings, 'restore_weights'):
+        loaded = load_weights(keras_model, base_dir)
+    if not loaded:
+        print("Warning: No weights loaded, using untrained model")
+    return keras_model, CompiledModel(keras_model, weights_loaded=loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the restored checkpoint for fast server startup")
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help="Write a SavedModel directory or .keras archive")
+    export.add_argument('--out', default=os.path.join('models', 'lipnet.keras'),
+                        help="Path ending in .keras for a Keras archive, otherwise a SavedModel directory")
+    args = parser.parse_args()
+
+    try:
+        from lipnet_utils import build_model, load_weights
+    except ImportError:
+        from backend.lipnet_utils import build_model, load_weights
+    model = build_model()
+    if not load_weights(model):
+        raise SystemExit("No checkpoint found to export")
+    export_model(model, args.out)
+    print(f"Exported to {args.out}; point LIPNET_MODEL_PATH at it if not the default")
+
+
+__all__ = [
+    'CompiledModel',
+    'compile_model',
+    'load_serving_model',
+    'engine_version',
+    'configure_threads',
+    'export_model',
+    'load_exported_model',
+    'SavedModelFunction',
+    'DEFAULT_BATCH_BUCKETS',
+]
+
+
+if __name__ == "__main__":
+    main()
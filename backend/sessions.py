@@ -0,0 +1,361 @@
+"""
+Login session stores.
+
+`MemorySessionStore` keeps sessions in a dict and reclaims expired ones
+with a timing wheel: each session sits in the wheel slot of its expiry
+tick, and a periodic sweep only visits the slots whose ticks have passed,
+so expiry costs O(1) per session regardless of how many are live.
+
+`SQLiteSessionStore` keeps sessions in a WAL-mode SQLite file shared by
+every uvicorn worker (LIPNET_SESSION_DIR), so a token issued by one worker
+is valid on all of them. Successful validations are cached in-process for
+LIPNET_SESSION_CACHE_SECONDS; a logout on another worker therefore takes
+up to that long to be seen here. Expired rows are deleted through an index
+on the expiry time.
+
+Both stores keep at most LIPNET_SESSIONS_PER_USER sessions per user, so
+repeated logins cannot grow the store without bound, and count evictions
+by reason ('expired', 'logout', 'user_limit').
+"""
+import os
+import math
+import time
+import asyncio
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+DEFAULT_SESSION_BACKEND = os.getenv("LIPNET_SESSION_BACKEND", "memory")
+DEFAULT_SESSION_DIR = os.getenv("LIPNET_SESSION_DIR", os.path.join("data", "sessions"))
+DEFAULT_SESSION_TTL_SECONDS = float(os.getenv("LIPNET_SESSION_TTL_SECONDS", str(24 * 3600)))
+DEFAULT_SESSIONS_PER_USER = int(os.getenv("LIPNET_SESSIONS_PER_USER", "10"))
+DEFAULT_VALIDATION_CACHE_SECONDS = float(os.getenv("LIPNET_SESSION_CACHE_SECONDS", "5"))
+DEFAULT_SWEEP_SECONDS = float(os.getenv("LIPNET_SESSION_SWEEP_SECONDS", "30"))
+
+EXPIRED, LOGOUT, USER_LIMIT = "expired", "logout", "user_limit"
+
+
+class TimingWheel:
+    """
+    Keys bucketed by expiry tick. `advance(now)` empties the slots of every
+    tick that has fully elapsed since the last call and returns their keys.
+    Keys expiring more than one revolution ahead share a slot with earlier
+    ones; callers re-add keys that turn out not to be due yet.
+    """
+
+    def __init__(self, resolution: float, span: float, now: Optional[float] = None):
+        self.resolution = resolution
+        self._slots: List[set] = [set() for _ in range(int(math.ceil(span / resolution)) + 1)]
+        self._tick = self._tick_of(time.time() if now is None else now)
+
+    def _tick_of(self, t: float) -> int:
+        return int(t // self.resolution)
+
+    def add(self, key: str, expires: float):
+        self._slots[self._tick_of(expires) % len(self._slots)].add(key)
+
+    def discard(self, key: str, expires: float):
+        self._slots[self._tick_of(expires) % len(self._slots)].discard(key)
+
+    def advance(self, now: float) -> List[str]:
+        current = self._tick_of(now)
+        due: List[str] = []
+        # A full revolution visits every slot; more steps would revisit them
+        for tick in range(self._tick, min(current, self._tick + len(self._slots))):
+            slot = self._slots[tick % len(self._slots)]
+            due.extend(slot)
+            slot.clear()
+        self._tick = max(self._tick, current)
+        return due
+
+
+class SessionStore:
+    """Base class: issue, validate and revoke session tokens"""
+
+    backend = "base"
+
+    def __init__(self, ttl_seconds: float = DEFAULT_SESSION_TTL_SECONDS, per_user: int = DEFAULT_SESSIONS_PER_USER):
+        self.ttl_seconds = ttl_seconds
+        self.per_user = per_user
+        self.created = 0
+        self.evictions: Dict[str, int] = {EXPIRED: 0, LOGOUT: 0, USER_LIMIT: 0}
+        # Called with (reason, count) whenever sessions are removed
+        self.on_evict: Optional[Callable[[str, int], None]] = None
+
+    def _evicted(self, reason: str, count: int = 1):
+        if count <= 0:
+            return
+        self.evictions[reason] += count
+        if self.on_evict is not None:
+            self.on_evict(reason, count)
+
+    def create(self, username: str) -> str:
+        """Issue a new token for `username`"""
+        raise NotImplementedError
+
+    def get(self, token: str) -> Optional[dict]:
+        """{"username", "expires"} for a live token, else None"""
+        raise NotImplementedError
+
+    def delete(self, token: str) -> bool:
+        raise NotImplementedError
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Remove expired sessions; returns how many were removed"""
+        raise NotImplementedError
+
+    def size(self) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "size": self.size(),
+            "created": self.created,
+            "evictions": dict(self.evictions),
+            "ttl_seconds": self.ttl_seconds,
+            "per_user": self.per_user,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local sessions with timing-wheel expiry"""
+
+    backend = "memory"
+
+    def __init__(self, ttl_seconds: float = DEFAULT_SESSION_TTL_SECONDS, per_user: int = DEFAULT_SESSIONS_PER_USER,
+                 resolution: Optional[float] = None):
+        super().__init__(ttl_seconds, per_user)
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Tuple[str, float]] = {}
+        # Each user's tokens, oldest first
+        self._by_user: Dict[str, 'OrderedDict[str, None]'] = {}
+        self._wheel = TimingWheel(resolution or max(ttl_seconds / 4096, 1.0), ttl_seconds)
+
+    def _remove(self, token: str, reason: str) -> bool:
+        entry = self._sessions.pop(token, None)
+        if entry is None:
+            return False
+        username, expires = entry
+        self._wheel.discard(token, expires)
+        tokens = self._by_user.get(username)
+        if tokens is not None:
+            tokens.pop(token, None)
+            if not tokens:
+                del self._by_user[username]
+        self._evicted(reason)
+        return True
+
+    def create(self, username: str) -> str:
+        token = secrets.token_urlsafe(32)
+        expires = time.time() + self.ttl_seconds
+        with self._lock:
+            self._sessions[token] = (username, expires)
+            self._wheel.add(token, expires)
+            tokens = self._by_user.setdefault(username, OrderedDict())
+            tokens[token] = None
+            while len(tokens) > self.per_user:
+                self._remove(next(iter(tokens)), USER_LIMIT)
+            self.created += 1
+        return token
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self._remove(token, EXPIRED)
+                return None
+        return {"username": entry[0], "expires": entry[1]}
+
+    def delete(self, token: str) -> bool:
+        with self._lock:
+            return self._remove(token, LOGOUT)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            for token in self._wheel.advance(now):
+                entry = self._sessions.get(token)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    removed += self._remove(token, EXPIRED)
+                else:
+                    # Due in a later revolution of the wheel
+                    self._wheel.add(token, entry[1])
+        return removed
+
+    def size(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions shared across worker processes through a WAL-mode SQLite file"""
+
+    backend = "sqlite"
+
+    def __init__(self, directory: str = DEFAULT_SESSION_DIR, ttl_seconds: float = DEFAULT_SESSION_TTL_SECONDS,
+                 per_user: int = DEFAULT_SESSIONS_PER_USER,
+                 cache_seconds: float = DEFAULT_VALIDATION_CACHE_SECONDS, cache_entries: int = 4096):
+        super().__init__(ttl_seconds, per_user)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "sessions.sqlite3")
+        self.cache_seconds = cache_seconds
+        self.cache_entries = cache_entries
+        # token -> (username, expires, validated at)
+        self._validated: 'OrderedDict[str, Tuple[str, float, float]]' = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "token TEXT PRIMARY KEY, username TEXT NOT NULL, created REAL NOT NULL, expires REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_username ON sessions (username, created)")
+            self._conn.commit()
+            self._size = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def create(self, username: str) -> str:
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (token, username, created, expires) VALUES (?, ?, ?, ?)",
+                (token, username, now, now + self.ttl_seconds),
+            )
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE username = ? AND token NOT IN ("
+                "SELECT token FROM sessions WHERE username = ? ORDER BY created DESC LIMIT ?)",
+                (username, username, self.per_user),
+            )
+            self._conn.commit()
+            self._size += 1 - cursor.rowcount
+            self.created += 1
+        # Tokens dropped here may still sit in a validation cache for cache_seconds
+        self._evicted(USER_LIMIT, cursor.rowcount)
+        return token
+
+    def _cached(self, token: str, now: float) -> Optional[dict]:
+        entry = self._validated.get(token)
+        if entry is None:
+            return None
+        username, expires, validated = entry
+        if now - validated > self.cache_seconds or expires <= now:
+            del self._validated[token]
+            return None
+        self._validated.move_to_end(token)
+        return {"username": username, "expires": expires}
+
+    def get(self, token: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            session = self._cached(token, now)
+            if session is not None:
+                self.cache_hits += 1
+                return session
+            self.cache_misses += 1
+            row = self._conn.execute(
+                "SELECT username, expires FROM sessions WHERE token = ?", (token,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self._delete(token, EXPIRED)
+            return None
+        with self._lock:
+            self._validated[token] = (row[0], row[1], now)
+            while len(self._validated) > self.cache_entries:
+                self._validated.popitem(last=False)
+        return {"username": row[0], "expires": row[1]}
+
+    def _delete(self, token: str, reason: str) -> bool:
+        with self._lock:
+            self._validated.pop(token, None)
+            cursor = self._conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+            self._conn.commit()
+            self._size -= cursor.rowcount
+        self._evicted(reason, cursor.rowcount)
+        return cursor.rowcount > 0
+
+    def delete(self, token: str) -> bool:
+        return self._delete(token, LOGOUT)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+            self._conn.commit()
+            # Other workers create and delete sessions too; resync the count
+            self._size = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            for token in [t for t, (_, expires, _) in self._validated.items() if expires <= now]:
+                del self._validated[token]
+        self._evicted(EXPIRED, cursor.rowcount)
+        return cursor.rowcount
+
+    def size(self) -> int:
+        """Sessions in the shared file, as of the last sweep plus this worker's changes since"""
+        return self._size
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "validation_cache": {
+                "entries": len(self._validated),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "ttl_seconds": self.cache_seconds,
+            },
+        }
+
+
+SESSION_BACKENDS = {
+    MemorySessionStore.backend: MemorySessionStore,
+    SQLiteSessionStore.backend: SQLiteSessionStore,
+}
+
+
+def create_session_store(backend: Optional[str] = None, **kwargs) -> SessionStore:
+    """Session store by backend name (default: LIPNET_SESSION_BACKEND)"""
+    backend = backend or DEFAULT_SESSION_BACKEND
+    if backend not in SESSION_BACKENDS:
+        raise ValueError(f"Unknown session backend '{backend}'. Choose from: {', '.join(SESSION_BACKENDS)}")
+    return SESSION_BACKENDS[backend](**kwargs)
+
+
+async def sweep_loop(store: SessionStore, interval: float = DEFAULT_SWEEP_SECONDS):
+    """Periodically remove expired sessions off the event loop"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(store.sweep)
+        except sqlite3.Error as e:
+            print(f"Session sweep failed: {e}")
+
+
+__all__ = [
+    'SessionStore',
+    'MemorySessionStore',
+    'SQLiteSessionStore',
+    'TimingWheel',
+    'SESSION_BACKENDS',
+    'create_session_store',
+    'sweep_loop',
+]
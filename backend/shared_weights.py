@@ -0,0 +1,106 @@
+"""
+Model weights shared by inference worker processes.
+
+TensorFlow is not fork-safe, so inference workers are spawned, and Keras
+variables live in each process's own TensorFlow runtime: a Keras model per
+worker always means a private copy of the weights per worker. To keep one
+copy, workers in this mode serve a float32 TFLite export of the model
+instead. The first worker to take the file lock restores the checkpoint
+and converts it once into LIPNET_SHARED_WEIGHTS_DIR (/dev/shm by default);
+every worker then opens that file with the TFLite interpreter, which
+memory-maps the flatbuffer and reads constant tensors straight from it, so
+the weight pages are shared through the page cache instead of copied.
+These interpreters run without the default XNNPACK delegate, which would
+repack the weights into per-process buffers (see TFLiteModel).
+
+The file is keyed by model version, so restarting the pool with the same
+checkpoint skips the restore and the conversion. It is removed when the
+process that created it exits; mappings already open, in this server or
+another, survive the unlink.
+"""
+import os
+import re
+import fcntl
+import tempfile
+from contextlib import contextmanager
+from multiprocessing.util import Finalize
+from typing import Iterator, Optional, Tuple
+
+try:
+    from lipnet_utils import model_version
+except ImportError:
+    from backend.lipnet_utils import model_version
+
+DEFAULT_SHARED_WEIGHTS_DIR = os.getenv("LIPNET_SHARED_WEIGHTS_DIR") or (
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+)
+PREFIX = "lipnet-weights-"
+
+
+def weights_name(version: str) -> str:
+    return PREFIX + re.sub(r"[^A-Za-z0-9_.-]", "_", version)
+
+
+def shared_model_path(version: str, directory: str = DEFAULT_SHARED_WEIGHTS_DIR) -> str:
+    return os.path.join(directory, weights_name(version) + ".tflite")
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Exclusive lock across processes; released when the block exits"""
+    with open(path, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def publish_shared(
+    base_dir: Optional[str] = None,
+    directory: str = DEFAULT_SHARED_WEIGHTS_DIR,
+    threads: Optional[Tuple[int, int]] = None,
+) -> Optional[str]:
+    """
+    Path of the shared float32 TFLite model for the current checkpoint,
+    restoring and converting it first if no process has yet. None when
+    there are no trained weights to share. `threads` must match what the
+    caller passes to load_serving_model afterwards.
+    """
+    version = model_version(base_dir)
+    if version == "untrained":
+        return None
+    os.makedirs(directory, exist_ok=True)
+    path = shared_model_path(version, directory)
+    with file_lock(path + ".lock"):
+        if os.path.exists(path):
+            return path
+        try:
+            from serving import load_serving_model
+            from tflite_engine import export_tflite
+        except ImportError:
+            from backend.serving import load_serving_model
+            from backend.tflite_engine import export_tflite
+        _, compiled = load_serving_model(base_dir, engine='keras', threads=threads)
+        if not compiled.weights_loaded:
+            return None
+        export_tflite(compiled.model, path + ".tmp", 'float32')
+        os.replace(path + ".tmp", path)
+    # Only the creator removes it, and only once this process is done with it
+    Finalize(None, _remove, args=(path,), exitpriority=10)
+    return path
+
+
+__all__ = [
+    'DEFAULT_SHARED_WEIGHTS_DIR',
+    'publish_shared',
+    'shared_model_path',
+    'weights_name',
+]
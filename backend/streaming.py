@@ -0,0 +1,319 @@
+"""
+Streaming lip reading over WebSocket.
+
+Clients send compressed frames (one JPEG/PNG per binary message). Each
+connection keeps a ring buffer sized to the model's 75-frame window and
+runs inference every `hop` frames; transcripts are pushed back as
+"partial" messages and as a "final" message once they stop changing.
+When the client sends faster than frames can be decoded, the oldest
+queued frames are dropped. With an incremental predictor (see
+incremental.py) only the frames added since the previous window are sent
+to the model, which reuses cached front-end features for the rest.
+
+Every window of a connection is normalized with the mean and std of its
+first window rather than its own. Cached features are only valid for one
+normalization, so this is what lets the incremental predictor reuse them,
+and it keeps the two predictors' outputs identical up to float rounding.
+
+Synthetic test client (needs the `websockets` package):
+    python backend/streaming.py --url ws://localhost:8000/api/predict/realtime --seconds 5
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import Awaitable, Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from video_io import EMPTY_SHAPE, normalization_params, normalize_frames
+except ImportError:
+    from backend.video_io import EMPTY_SHAPE, normalization_params, normalize_frames
+
+
+WINDOW_FRAMES = EMPTY_SHAPE[0]
+DEFAULT_HOP = int(os.getenv("LIPNET_STREAM_HOP", "15"))
+DEFAULT_QUEUE_FRAMES = int(os.getenv("LIPNET_STREAM_QUEUE", "50"))
+DEFAULT_STABLE_HOPS = int(os.getenv("LIPNET_STREAM_STABLE_HOPS", "2"))
+
+
+class FrameRingBuffer:
+    """Fixed-capacity buffer of uint8 mouth crops; the oldest frame is overwritten"""
+
+    def __init__(self, capacity: int = WINDOW_FRAMES, frame_shape=EMPTY_SHAPE[1:]):
+        self.capacity = capacity
+        self._frames = np.zeros((capacity,) + tuple(frame_shape), dtype=np.uint8)
+        self._next = 0
+        self.count = 0
+        self.total = 0
+
+    def append(self, frame: np.ndarray):
+        self._frames[self._next] = frame
+        self._next = (self._next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total += 1
+
+    def window(self) -> np.ndarray:
+        """
+        The last `capacity` frames in order. Before the buffer has filled,
+        the first frame is repeated at the front so the model always sees a
+        full window.
+        """
+        if self.count == self.capacity:
+            return np.roll(self._frames, -self._next, axis=0)
+        frames = self._frames[:self.count]
+        if self.count == 0:
+            return np.zeros_like(self._frames)
+        pad = np.repeat(frames[:1], self.capacity - self.count, axis=0)
+        return np.concatenate([pad, frames], axis=0)
+
+
+class TranscriptStabilizer:
+    """
+    Marks a transcript final once the same text comes back for
+    `stable_hops` consecutive windows; each distinct text is finalized once.
+    """
+
+    def __init__(self, stable_hops: int = DEFAULT_STABLE_HOPS):
+        self.stable_hops = max(stable_hops, 1)
+        self.last: Optional[str] = None
+        self.repeats = 0
+        self.finalized: Optional[str] = None
+
+    def update(self, text: str) -> Optional[str]:
+        """Return 'partial', 'final', or None when nothing new should be sent"""
+        if text == self.last:
+            self.repeats += 1
+        else:
+            self.last = text
+            self.repeats = 1
+        if self.repeats >= self.stable_hops:
+            if text == self.finalized:
+                return None
+            self.finalized = text
+            return 'final'
+        return 'partial'
+
+
+class StreamSession:
+    """
+    One streaming connection. Transport-agnostic: `receive` returns ASGI
+    websocket messages and `send_json` sends a dict, so it runs over a
+    Starlette WebSocket or a test double.
+    """
+
+    def __init__(
+        self,
+        predict: Callable[[np.ndarray], Awaitable[str]],
+        decode: Callable[[bytes], Awaitable[np.ndarray]],
+        hop: int = DEFAULT_HOP,
+        max_queued_frames: int = DEFAULT_QUEUE_FRAMES,
+        stable_hops: int = DEFAULT_STABLE_HOPS,
+        predict_incremental: Optional[Callable[[np.ndarray, int, float], Awaitable[str]]] = None,
+    ):
+        """
+        `predict` takes a normalized (75, 46, 140, 1) window. When
+        `predict_incremental` is given it is used instead and receives only
+        the uint8 frames appended since its previous call, with the
+        stream's normalization mean and std.
+        """
+        self.predict = predict
+        self.predict_incremental = predict_incremental
+        self._new_frames: List[np.ndarray] = []
+        # (mean, std) of the first window, used for every window
+        self.normalization: Optional[Tuple[int, float]] = None
+        self.decode = decode
+        self.hop = max(hop, 1)
+        self.ring = FrameRingBuffer()
+        self.stabilizer = TranscriptStabilizer(stable_hops)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(max_queued_frames, 1))
+        self._inference: Optional[asyncio.Task] = None
+        self._since_inference = 0
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_failed = 0
+        self.windows_run = 0
+        self.windows_failed = 0
+        self.latencies_ms: List[float] = []
+
+    def _enqueue(self, data: bytes):
+        """Queue a frame, dropping the oldest one when the client outruns the server"""
+        self.frames_received += 1
+        if self._queue.full():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.frames_dropped += 1
+        self._queue.put_nowait((data, time.perf_counter()))
+
+    async def _receive_loop(self, receive: Callable[[], Awaitable[dict]], send_json):
+        while True:
+            message = await receive()
+            if message.get("type") == "websocket.disconnect":
+                return False
+            if message.get("bytes") is not None:
+                self._enqueue(message["bytes"])
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    await send_json({"type": "error", "message": "Invalid control message"})
+                    continue
+                if control.get("type") == "config" and "hop" in control:
+                    try:
+                        hop = int(control["hop"])
+                    except (TypeError, ValueError, OverflowError):
+                        await send_json({"type": "error", "message": "hop must be an integer number of frames"})
+                        continue
+                    self.hop = min(max(hop, 1), WINDOW_FRAMES)
+                elif control.get("type") == "end":
+                    return True
+
+    async def _infer(self, window: np.ndarray, frame: int, newest_at: float, send_json, final: bool = False):
+        """Predict the window ending at frame `frame`; a failed window is reported and the stream goes on"""
+        if self.normalization is None:
+            self.normalization = normalization_params(window)
+        try:
+            if self.predict_incremental is not None:
+                new_frames = (np.stack(self._new_frames) if self._new_frames
+                              else np.zeros((0,) + EMPTY_SHAPE[1:], np.uint8))
+                self._new_frames = []
+                text = await self.predict_incremental(new_frames, *self.normalization)
+            else:
+                text = await self.predict(normalize_frames(window, *self.normalization))
+        except Exception as e:
+            self.windows_failed += 1
+            await send_json({"type": "error", "message": f"Inference failed: {str(e) or type(e).__name__}",
+                             "frame": frame})
+            return
+        self.windows_run += 1
+        latency_ms = 1000.0 * (time.perf_counter() - newest_at)
+        self.latencies_ms.append(latency_ms)
+        kind = 'final' if final else self.stabilizer.update(text)
+        if kind is None:
+            return
+        await send_json({
+            "type": kind,
+            "text": text,
+            "frame": frame,
+            "latency_ms": round(latency_ms, 1),
+            "dropped": self.frames_dropped,
+        })
+
+    async def _process_loop(self, send_json):
+        while True:
+            data, received_at = await self._queue.get()
+            try:
+                frame = await self.decode(data)
+            except Exception:
+                self.frames_failed += 1
+                continue
+            finally:
+                self._queue.task_done()
+            self.ring.append(frame)
+            if self.predict_incremental is not None:
+                self._new_frames.append(frame)
+            self._since_inference += 1
+            # At most one window in flight per connection; skipped hops are
+            # covered by the next window
+            if self._since_inference >= self.hop and (self._inference is None or self._inference.done()):
+                self._since_inference = 0
+                self._inference = asyncio.create_task(
+                    self._infer(self.ring.window(), self.ring.total, received_at, send_json)
+                )
+
+    async def run(self, receive: Callable[[], Awaitable[dict]], send_json: Callable[[dict], Awaitable[None]]):
+        """Serve the connection until the client sends {"type": "end"} or disconnects"""
+        processor = asyncio.create_task(self._process_loop(send_json))
+        try:
+            ended = await self._receive_loop(receive, send_json)
+            if ended:
+                await self._queue.join()
+                if self._inference is not None:
+                    await self._inference
+                if self.ring.count:
+                    await self._infer(self.ring.window(), self.ring.total, time.perf_counter(), send_json, final=True)
+                await send_json({"type": "end", **self.stats()})
+        finally:
+            processor.cancel()
+            if self._inference is not None and not self._inference.done():
+                self._inference.cancel()
+            await asyncio.gather(processor, return_exceptions=True)
+
+    def stats(self) -> dict:
+        latencies = self.latencies_ms
+        return {
+            "frames_received": self.frames_received,
+            "frames_dropped": self.frames_dropped,
+            "frames_failed": self.frames_failed,
+            "windows_run": self.windows_run,
+            "windows_failed": self.windows_failed,
+            "latency_ms_p50": round(float(np.percentile(latencies, 50)), 1) if latencies else None,
+            "latency_ms_max": round(max(latencies), 1) if latencies else None,
+        }
+
+
+def synthetic_scene(count: int, height: int = 288, width: int = 360, seed: int = 0) -> Iterator[np.ndarray]:
+    """
+    BGR frames of a GRID-sized scene with an opening and closing mouth
+    shape at the crop location, for testing without a camera or dataset.
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    background = rng.integers(90, 140, (height, width, 3), dtype=np.uint8)
+    center = (150, 213)
+    phase = rng.uniform(0, np.pi)
+    for i in range(count):
+        frame = background.copy()
+        opening = int(4 + 10 * abs(np.sin(phase + i * 0.35)))
+        cv2.ellipse(frame, center, (45, opening), 0, 0, 360, (40, 30, 120), -1)
+        yield frame
+
+
+def synthetic_frames(count: int, height: int = 288, width: int = 360, seed: int = 0) -> Iterator[bytes]:
+    """synthetic_scene frames encoded as JPEG, one per WebSocket message"""
+    import cv2
+
+    for frame in synthetic_scene(count, height, width, seed):
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if ok:
+            yield encoded.tobytes()
+
+
+async def _run_client(url: str, seconds: float, fps: float, hop: Optional[int]):
+    import websockets
+
+    async with websockets.connect(url, max_size=None) as ws:
+        if hop:
+            await ws.send(json.dumps({"type": "config", "hop": hop}))
+
+        async def producer():
+            interval = 1.0 / fps
+            for frame in synthetic_frames(int(seconds * fps)):
+                await ws.send(frame)
+                await asyncio.sleep(interval)
+            await ws.send(json.dumps({"type": "end"}))
+
+        send_task = asyncio.create_task(producer())
+        async for raw in ws:
+            message = json.loads(raw)
+            print(message)
+            if message.get("type") == "end":
+                break
+        await send_task
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream synthetic frames to the realtime endpoint")
+    parser.add_argument('--url', default='ws://localhost:8000/api/predict/realtime')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--fps', type=float, default=25.0)
+    parser.add_argument('--hop', type=int, default=None, help="Override the server's hop (frames)")
+    args = parser.parse_args()
+    asyncio.run(_run_client(args.url, args.seconds, args.fps, args.hop))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Quantized CPU inference with TensorFlow Lite.
+
+Exports the restored checkpoint to TFLite with float32, dynamic-range,
+float16 or full-int8 post-training quantization, serves the result with
+the same `predict(batch, verbose=0)` call as the Keras model, and reports
+CER, latency and memory against the float32 Keras baseline.
+
+Usage:
+    python backend/tflite_engine.py export --mode int8 --out models/lipnet-int8.tflite
+    python backend/tflite_engine.py report --engines models/lipnet-int8.tflite --samples 50
+"""
+import os
+import glob
+import time
+import json
+import argparse
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+try:
+    from lipnet_utils import (
+        build_model, load_weights, load_video_array, load_alignments,
+        decode_predictions, char_lookup, get_frame_store
+    )
+    from serving import CompiledModel
+except ImportError:
+    from backend.lipnet_utils import (
+        build_model, load_weights, load_video_array, load_alignments,
+        decode_predictions, char_lookup, get_frame_store
+    )
+    from backend.serving import CompiledModel
+
+QUANTIZATION_MODES = ('float32', 'dynamic', 'float16', 'int8')
+INPUT_SHAPE = (75, 46, 140, 1)
+DEFAULT_TFLITE_THREADS = int(os.getenv("LIPNET_TFLITE_THREADS", "0")) or None
+
+
+class TFLiteModel:
+    """
+    TFLite interpreter behind a Keras-style `predict`. The interpreter runs
+    one clip at a time (batch 1); calls are serialized with a lock since an
+    interpreter is not thread-safe.
+
+    The interpreter memory-maps the model file. With `mapped` it also skips
+    the default XNNPACK delegate, which copies weights into its own packed
+    buffers, so constant tensors are read from the mapped pages and every
+    process opening the same file shares one copy.
+    """
+
+    def __init__(self, path: str, num_threads: Optional[int] = DEFAULT_TFLITE_THREADS, mapped: bool = False):
+        self.path = path
+        self.mapped = mapped
+        options = {}
+        if mapped:
+            options['experimental_op_resolver_type'] = (
+                tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+            )
+        self.interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads, **options)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._lock = threading.Lock()
+        self.weights_loaded = True
+        self.ready = False
+        self.warmup_seconds: Dict[int, float] = {}
+
+    def _quantize_input(self, clip: np.ndarray) -> np.ndarray:
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return clip.astype(np.float32)
+        scale, zero_point = self._input['quantization']
+        return np.clip(np.round(clip / scale + zero_point), np.iinfo(dtype).min, np.iinfo(dtype).max).astype(dtype)
+
+    def _dequantize_output(self, out: np.ndarray) -> np.ndarray:
+        if self._output['dtype'] == np.float32:
+            return out
+        scale, zero_point = self._output['quantization']
+        return (out.astype(np.float32) - zero_point) * scale
+
+    def predict(self, video_batch, verbose: int = 0) -> np.ndarray:
+        video_batch = np.asarray(video_batch, dtype=np.float32)
+        outputs = []
+        with self._lock:
+            for clip in video_batch:
+                self.interpreter.set_tensor(self._input['index'], self._quantize_input(clip[np.newaxis]))
+                self.interpreter.invoke()
+                outputs.append(self._dequantize_output(self.interpreter.get_tensor(self._output['index']))[0])
+        return np.stack(outputs, axis=0)
+
+    def warmup(self, runs: int = 1) -> Dict[int, float]:
+        start = time.perf_counter()
+        for _ in range(max(runs, 1)):
+            self.predict(np.zeros((1,) + INPUT_SHAPE, dtype=np.float32))
+        self.warmup_seconds[1] = time.perf_counter() - start
+        self.ready = True
+        return self.warmup_seconds
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "weights_loaded": self.weights_loaded,
+            "engine": "tflite",
+            "path": self.path,
+            "mapped": self.mapped,
+            "input_dtype": np.dtype(self._input['dtype']).name,
+            "warmup_seconds": {str(k): round(v, 3) for k, v in self.warmup_seconds.items()},
+        }
+
+
+def calibration_clips(count: int = 100, video_dir: str = os.path.join('data', 's1')) -> List[np.ndarray]:
+    """Preprocessed clips for int8 calibration, from the frame store when available"""
+    store = get_frame_store()
+    clips = []
+    if store is not None:
+        for name in list(store.clips)[:count]:
+            clips.append(np.asarray(store.get(name), dtype=np.float32))
+    for path in sorted(glob.glob(os.path.join(video_dir, '*.mpg'))):
+        if len(clips) >= count:
+            break
+        clips.append(load_video_array(path))
+    return [clip for clip in clips if clip.shape == INPUT_SHAPE]
+
+
+def export_tflite(
+    model,
+    out_path: str,
+    mode: str = 'dynamic',
+    calibration: Optional[Sequence[np.ndarray]] = None,
+) -> str:
+    """
+    Convert a Keras model to a TFLite flatbuffer with the given
+    post-training quantization mode. `int8` needs calibration clips; ops
+    without int8 kernels (e.g. parts of the LSTMs) stay in float.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"mode must be one of {QUANTIZATION_MODES}")
+
+    @tf.function(input_signature=[tf.TensorSpec((1,) + INPUT_SHAPE, tf.float32)])
+    def serve(video):
+        return model(video, training=False)
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([serve.get_concrete_function()], model)
+    if mode != 'float32':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == 'int8':
+        if not calibration:
+            raise ValueError("int8 quantization needs calibration clips")
+
+        def representative_dataset() -> Iterator[List[np.ndarray]]:
+            for clip in calibration:
+                yield [clip[np.newaxis].astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+            tf.lite.OpsSet.TFLITE_BUILTINS,
+        ]
+
+    flatbuffer = converter.convert()
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, 'wb') as f:
+        f.write(flatbuffer)
+    return out_path
+
+
+def character_error_rate(predicted: str, reference: str) -> float:
+    """Levenshtein distance between the strings divided by the reference length"""
+    if not reference:
+        return 0.0 if not predicted else 1.0
+    previous = list(range(len(reference) + 1))
+    for i, p in enumerate(predicted, 1):
+        current = [i]
+        for j, r in enumerate(reference, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (p != r)))
+        previous = current
+    return previous[-1] / len(reference)
+
+
+def _rss_mb() -> Optional[float]:
+    """Current resident set size from /proc/self/statm, or None where it is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def evaluation_set(count: int, data_dir: str = 'data', speaker: str = 's1') -> List[Tuple[np.ndarray, str]]:
+    """(clip, reference transcript) pairs from GRID videos and alignments"""
+    samples = []
+    for path in sorted(glob.glob(os.path.join(data_dir, speaker, '*.mpg'))):
+        if len(samples) >= count:
+            break
+        name = os.path.splitext(os.path.basename(path))[0]
+        alignment = os.path.join(data_dir, 'alignments', speaker, f'{name}.align')
+        if not os.path.exists(alignment):
+            continue
+        clip = load_video_array(path)
+        if clip.shape != INPUT_SHAPE:
+            continue
+        tokens = load_alignments(alignment).numpy()
+        samples.append((clip, ''.join(char_lookup[np.clip(tokens, 0, len(char_lookup) - 1)]).strip()))
+    return samples
+
+
+def benchmark_engine(
+    name: str,
+    make_engine: Callable[[], object],
+    samples: Sequence[Tuple[np.ndarray, str]],
+    size_bytes: Optional[int],
+) -> dict:
+    """
+    CER, per-clip latency and memory for one engine. `make_engine` builds it
+    inside the measurement, so `rss_growth_mb` is the resident memory the
+    engine adds by loading and running (None without /proc).
+    """
+    rss_before = _rss_mb()
+    engine = make_engine()
+    engine.predict(samples[0][0][np.newaxis])  # warm-up
+    latencies, errors = [], []
+    for clip, reference in samples:
+        start = time.perf_counter()
+        yhat = engine.predict(clip[np.newaxis])
+        latencies.append(time.perf_counter() - start)
+        errors.append(character_error_rate(decode_predictions(yhat, [INPUT_SHAPE[0]])[0], reference))
+    rss_after = _rss_mb()
+    return {
+        "engine": name,
+        "cer": float(np.mean(errors)),
+        "latency_ms_p50": 1000.0 * float(np.percentile(latencies, 50)),
+        "latency_ms_p95": 1000.0 * float(np.percentile(latencies, 95)),
+        "model_size_mb": size_bytes / (1024 * 1024) if size_bytes is not None else None,
+        "rss_growth_mb": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+    }
+
+
+def accuracy_latency_report(
+    tflite_paths: Sequence[str],
+    samples: int = 50,
+    base_dir: Optional[str] = None,
+    data_dir: str = 'data',
+) -> List[dict]:
+    """Compare TFLite engines against the float32 Keras baseline"""
+    evaluation = evaluation_set(samples, data_dir)
+    if not evaluation:
+        raise FileNotFoundError(f"No GRID clips with alignments found under {data_dir}")
+
+    def keras_engine():
+        keras_model = build_model()
+        load_weights(keras_model, base_dir)
+        return CompiledModel(keras_model, batch_buckets=(1,))
+
+    rows = [benchmark_engine('keras-float32', keras_engine, evaluation, None)]
+    for path in tflite_paths:
+        rows.append(benchmark_engine(os.path.basename(path), lambda path=path: TFLiteModel(path),
+                                     evaluation, os.path.getsize(path)))
+
+    baseline = rows[0]
+    for row in rows:
+        row["cer_delta"] = row["cer"] - baseline["cer"]
+        row["speedup"] = baseline["latency_ms_p50"] / row["latency_ms_p50"] if row["latency_ms_p50"] else None
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and evaluate quantized TFLite LipNet models")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export = sub.add_parser('export', help="Convert the checkpoint to TFLite")
+    export.add_argument('--mode', default='dynamic', choices=QUANTIZATION_MODES)
+    export.add_argument('--out', default=None, help="Output .tflite path")
+    export.add_argument('--calibration-samples', type=int, default=100)
+
+    report = sub.add_parser('report', help="Compare engines against the float32 baseline")
+    report.add_argument('--engines', nargs='+', required=True, help=".tflite files to compare")
+    report.add_argument('--samples', type=int, default=50)
+    report.add_argument('--data-dir', default='data')
+    report.add_argument('--json', default=None, help="Also write the report to this file")
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        model = build_model()
+        if not load_weights(model):
+            print("Warning: No weights loaded, exporting untrained model")
+        calibration = calibration_clips(args.calibration_samples) if args.mode == 'int8' else None
+        out = args.out or os.path.join('models', f'lipnet-{args.mode}.tflite')
+        export_tflite(model, out, args.mode, calibration)
+        print(f"Wrote {out} ({os.path.getsize(out) / (1024 * 1024):.1f} MB)")
+    else:
+        rows = accuracy_latency_report(args.engines, args.samples, data_dir=args.data_dir)
+        for row in rows:
+            size = f"{row['model_size_mb']:.1f} MB" if row['model_size_mb'] is not None else "-"
+            rss = f"+{row['rss_growth_mb']:.0f} MB" if row['rss_growth_mb'] is not None else "-"
+            print(f"{row['engine']:<28} CER {row['cer']:.4f} ({row['cer_delta']:+.4f})  "
+                  f"p50 {row['latency_ms_p50']:.1f} ms  p95 {row['latency_ms_p95']:.1f} ms  "
+                  f"size {size}  rss {rss}")
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
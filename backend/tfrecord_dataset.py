@@ -0,0 +1,209 @@
+"""
+Native tf.data input pipeline backed by sharded TFRecord files.
+
+Videos are decoded once into TFRecords (uint8 mouth crops plus
+alignment tokens) for any set of GRID speakers. Reading back uses only
+native TF ops, so parsing and normalization run in parallel outside the
+GIL, unlike the tf.py_function loader in mappable_function.
+
+Usage:
+    python backend/tfrecord_dataset.py --data-dir data --out data/tfrecords --speakers s1 s2
+"""
+import os
+import glob
+import time
+import hashlib
+import argparse
+from typing import Dict, List, Optional, Sequence
+
+import tensorflow as tf
+
+try:
+    from lipnet_utils import load_alignments
+    from video_io import get_decoder, normalization_params
+except ImportError:
+    from backend.lipnet_utils import load_alignments
+    from backend.video_io import get_decoder, normalization_params
+
+
+DEFAULT_RECORD_DIR = os.path.join('data', 'tfrecords')
+DEFAULT_SPLITS = {'train': 0.9, 'val': 0.1}
+FRAME_COUNT = 75
+LABEL_LENGTH = 40
+
+_FEATURES = {
+    'frames': tf.io.FixedLenFeature([], tf.string),
+    'shape': tf.io.FixedLenFeature([4], tf.int64),
+    'mean': tf.io.FixedLenFeature([], tf.int64),
+    'std': tf.io.FixedLenFeature([], tf.float32),
+    'label': tf.io.VarLenFeature(tf.int64),
+    'speaker': tf.io.FixedLenFeature([], tf.string),
+    'name': tf.io.FixedLenFeature([], tf.string),
+}
+
+
+def assign_split(name: str, splits: Dict[str, float]) -> str:
+    """Deterministically assign a clip to a split from a hash of its name"""
+    bucket = int(hashlib.md5(name.encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+    total = sum(splits.values())
+    cumulative = 0.0
+    for split, fraction in splits.items():
+        cumulative += fraction / total
+        if bucket <= cumulative:
+            return split
+    return list(splits)[-1]
+
+
+def _example(gray, mean: int, std: float, label, speaker: str, name: str) -> bytes:
+    feature = {
+        'frames': tf.train.Feature(bytes_list=tf.train.BytesList(value=[gray.tobytes()])),
+        'shape': tf.train.Feature(int64_list=tf.train.Int64List(value=list(gray.shape))),
+        'mean': tf.train.Feature(int64_list=tf.train.Int64List(value=[mean])),
+        'std': tf.train.Feature(float_list=tf.train.FloatList(value=[std])),
+        'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[int(x) for x in label])),
+        'speaker': tf.train.Feature(bytes_list=tf.train.BytesList(value=[speaker.encode('utf-8')])),
+        'name': tf.train.Feature(bytes_list=tf.train.BytesList(value=[name.encode('utf-8')])),
+    }
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+
+
+def build_tfrecords(
+    data_dir: str = 'data',
+    out_dir: str = DEFAULT_RECORD_DIR,
+    speakers: Sequence[str] = ('s1',),
+    splits: Optional[Dict[str, float]] = None,
+    shard_size: int = 256,
+    backend: Optional[str] = None,
+) -> Dict[str, int]:
+    """
+    Write `{out_dir}/{split}/{speaker}-{shard}.tfrecord` files from
+    `{data_dir}/{speaker}/*.mpg` and `{data_dir}/alignments/{speaker}/*.align`.
+    Returns the number of clips written per split.
+    """
+    splits = splits or DEFAULT_SPLITS
+    decoder = get_decoder(backend)
+    counts = {split: 0 for split in splits}
+
+    for speaker in speakers:
+        writers: Dict[str, tf.io.TFRecordWriter] = {}
+        shard_rows = {split: 0 for split in splits}
+        shard_ids = {split: -1 for split in splits}
+
+        for video_path in sorted(glob.glob(os.path.join(data_dir, speaker, '*.mpg'))):
+            name = os.path.splitext(os.path.basename(video_path))[0]
+            alignment_path = os.path.join(data_dir, 'alignments', speaker, f'{name}.align')
+            if not os.path.exists(alignment_path):
+                print(f"Skipping {video_path}: no alignment")
+                continue
+            gray = decoder.decode(video_path)
+            if gray.shape[0] == 0:
+                print(f"Skipping {video_path}: no frames decoded")
+                continue
+            mean, std = normalization_params(gray)
+            label = load_alignments(alignment_path).numpy()
+
+            split = assign_split(f'{speaker}/{name}', splits)
+            if shard_rows[split] % shard_size == 0:
+                if split in writers:
+                    writers[split].close()
+                shard_ids[split] += 1
+                os.makedirs(os.path.join(out_dir, split), exist_ok=True)
+                writers[split] = tf.io.TFRecordWriter(
+                    os.path.join(out_dir, split, f'{speaker}-{shard_ids[split]:05d}.tfrecord')
+                )
+            writers[split].write(_example(gray, mean, std, label, speaker, name))
+            shard_rows[split] += 1
+            counts[split] += 1
+
+        for writer in writers.values():
+            writer.close()
+
+    return counts
+
+
+def parse_example(serialized):
+    """Parse one record into normalized (T, 46, 140, 1) float32 frames and int64 tokens"""
+    parsed = tf.io.parse_single_example(serialized, _FEATURES)
+    frames = tf.reshape(tf.io.decode_raw(parsed['frames'], tf.uint8), parsed['shape'])
+    # Same uint8 wraparound arithmetic as load_video
+    centered = frames - tf.cast(parsed['mean'], tf.uint8)
+    frames = tf.cast(centered, tf.float32) / (parsed['std'] + 1e-8)
+    frames = frames[:FRAME_COUNT]
+    label = tf.sparse.to_dense(parsed['label'])
+    return frames, label
+
+
+def make_dataset(
+    record_dir: str = DEFAULT_RECORD_DIR,
+    split: str = 'train',
+    speakers: Optional[Sequence[str]] = None,
+    batch_size: int = 2,
+    shuffle_buffer: int = 500,
+    deterministic: bool = False,
+    cycle_length: int = 4,
+    repeat: bool = False,
+    seed: Optional[int] = None,
+) -> tf.data.Dataset:
+    """
+    Read TFRecord shards for `split` (optionally only some speakers) with
+    parallel interleaving, parallel parsing, padded batching and prefetch.
+    `deterministic=True` fixes file and element order for reproducible runs
+    (elements are still shuffled, reproducibly, when `seed` is given).
+    """
+    patterns: List[str] = (
+        [os.path.join(record_dir, split, f'{speaker}-*.tfrecord') for speaker in speakers]
+        if speakers else [os.path.join(record_dir, split, '*.tfrecord')]
+    )
+    files = sorted(f for pattern in patterns for f in glob.glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No TFRecord shards found for split '{split}' in {record_dir}")
+
+    options = tf.data.Options()
+    options.deterministic = deterministic
+
+    dataset = tf.data.Dataset.from_tensor_slices(files)
+    if not deterministic:
+        dataset = dataset.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=min(cycle_length, len(files)),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=deterministic,
+    )
+    # Deterministic runs only shuffle elements when given a seed
+    if shuffle_buffer and (not deterministic or seed is not None):
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=not deterministic)
+    if repeat:
+        dataset = dataset.repeat()
+    dataset = dataset.map(parse_example, num_parallel_calls=tf.data.AUTOTUNE, deterministic=deterministic)
+    dataset = dataset.padded_batch(batch_size, padded_shapes=([FRAME_COUNT, None, None, None], [LABEL_LENGTH]))
+    dataset = dataset.prefetch(tf.data.AUTOTUNE)
+    return dataset.with_options(options)
+
+
+def _parse_splits(values: Sequence[str]) -> Dict[str, float]:
+    splits = {}
+    for value in values:
+        name, fraction = value.split('=')
+        splits[name] = float(fraction)
+    return splits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build sharded TFRecord files from GRID videos and alignments")
+    parser.add_argument('--data-dir', default='data', help="Directory with {speaker}/ and alignments/{speaker}/")
+    parser.add_argument('--out', default=DEFAULT_RECORD_DIR, help="Output directory")
+    parser.add_argument('--speakers', nargs='+', default=['s1'], help="Speakers to include")
+    parser.add_argument('--splits', nargs='+', default=['train=0.9', 'val=0.1'], help="Split fractions, e.g. train=0.9 val=0.1")
+    parser.add_argument('--shard-size', type=int, default=256, help="Clips per shard")
+    parser.add_argument('--backend', default=None, help="Video decoder backend (opencv or ffmpeg)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = build_tfrecords(args.data_dir, args.out, args.speakers, _parse_splits(args.splits),
+                             args.shard_size, args.backend)
+    print(f"Wrote {counts} to {args.out} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
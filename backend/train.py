@@ -0,0 +1,285 @@
+"""
+Training entry point for LipNet.
+
+Trains build_model() with CTCLoss and the notebook's learning-rate
+scheduler, tuned for CPU throughput:
+
+- Input comes from TFRecord shards (tfrecord_dataset.py), or from the
+  notebook's tf.py_function pipeline over GRID videos when no shards exist.
+- Every clip's real frame count and every label's real length go into the
+  CTC loss, so padding in a batch neither costs work nor skews the loss.
+- `--xla` compiles the forward and backward pass with XLA.
+- `--accumulate N` sums gradients over N batches before each update, for a
+  large effective batch without its memory.
+- TensorFlow's thread pools are sized before the first op (LIPNET_INTRA_OP_THREADS /
+  LIPNET_INTER_OP_THREADS, defaulting to every core and two inter-op threads).
+- Checkpoints are copied into a shadow model and written by a background
+  thread, so saving does not stall the step loop. They are written to the
+  prefix the server restores from (models/checkpoint), plus a small
+  `.train.json` with the epoch and learning rate for `--resume`.
+
+Usage:
+    python backend/train.py --records data/tfrecords --epochs 100 --batch-size 8 --accumulate 4 --xla
+    python backend/train.py --videos 'data/s1/*.mpg' --epochs 10
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from typing import Optional
+
+try:
+    from executors import available_cpus
+    from lipnet_utils import CTCLoss, build_model, mappable_function, scheduler
+    from serving import DEFAULT_INTER_OP_THREADS, DEFAULT_INTRA_OP_THREADS, INPUT_SHAPE, configure_threads
+except ImportError:
+    from backend.executors import available_cpus
+    from backend.lipnet_utils import CTCLoss, build_model, mappable_function, scheduler
+    from backend.serving import DEFAULT_INTER_OP_THREADS, DEFAULT_INTRA_OP_THREADS, INPUT_SHAPE, configure_threads
+
+DEFAULT_CHECKPOINT = os.path.join('models', 'checkpoint')
+DEFAULT_LEARNING_RATE = 1e-4
+LABEL_LENGTH = 40
+
+
+def frame_lengths(frames):
+    """
+    Real frames per clip of a (N, T, H, W, 1) batch. Clips are padded at
+    the end with all-zero frames; a normalized real frame is never all zero.
+    """
+    import tensorflow as tf
+
+    real = tf.reduce_any(tf.not_equal(frames, 0), axis=[2, 3, 4])
+    return tf.reduce_sum(tf.cast(real, tf.int32), axis=1)
+
+
+def video_dataset(pattern: str, batch_size: int):
+    """The notebook's input pipeline: decode videos on the fly with tf.py_function"""
+    import tensorflow as tf
+
+    def shaped(frames, label):
+        return tf.ensure_shape(frames, [None] + list(INPUT_SHAPE[1:])), label
+
+    dataset = tf.data.Dataset.list_files(pattern).shuffle(500, reshuffle_each_iteration=True)
+    dataset = dataset.map(mappable_function, num_parallel_calls=tf.data.AUTOTUNE).map(shaped)
+    dataset = dataset.padded_batch(batch_size, padded_shapes=([INPUT_SHAPE[0], None, None, None], [LABEL_LENGTH]))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+class Trainer:
+    """Compiled train steps with optional gradient accumulation"""
+
+    def __init__(self, model, optimizer, accumulate: int = 1, jit_compile: bool = False):
+        import tensorflow as tf
+
+        self.model = model
+        self.optimizer = optimizer
+        self.accumulate = max(1, accumulate)
+        self.pending = 0
+        self._variables = model.trainable_variables
+        if hasattr(optimizer, 'build'):
+            # Create slot variables now rather than inside the first traced step
+            optimizer.build(self._variables)
+        self._sums = [tf.Variable(tf.zeros_like(v), trainable=False) for v in self._variables] \
+            if self.accumulate > 1 else []
+        self._step = tf.function(self._train_step, jit_compile=jit_compile, reduce_retracing=True)
+        self._accumulate = tf.function(self._accumulate_step, jit_compile=jit_compile, reduce_retracing=True)
+        self._apply = tf.function(self._apply_sums)
+
+    def _loss_and_gradients(self, frames, labels):
+        import tensorflow as tf
+
+        with tf.GradientTape() as tape:
+            yhat = self.model(frames, training=True)
+            loss = tf.reduce_mean(CTCLoss(labels, yhat, frame_lengths(frames)))
+        return loss, tape.gradient(loss, self._variables)
+
+    def _train_step(self, frames, labels):
+        loss, gradients = self._loss_and_gradients(frames, labels)
+        self.optimizer.apply_gradients(zip(gradients, self._variables))
+        return loss
+
+    def _accumulate_step(self, frames, labels):
+        loss, gradients = self._loss_and_gradients(frames, labels)
+        for total, gradient in zip(self._sums, gradients):
+            total.assign_add(gradient)
+        return loss
+
+    def _apply_sums(self, count):
+        import tensorflow as tf
+
+        scale = 1.0 / tf.cast(count, tf.float32)
+        self.optimizer.apply_gradients([(total * scale, v) for total, v in zip(self._sums, self._variables)])
+        for total in self._sums:
+            total.assign(tf.zeros_like(total))
+
+    def step(self, frames, labels):
+        """One batch; returns its loss tensor (not synced to the host)"""
+        if self.accumulate == 1:
+            return self._step(frames, labels)
+        loss = self._accumulate(frames, labels)
+        self.pending += 1
+        if self.pending == self.accumulate:
+            self.flush()
+        return loss
+
+    def flush(self):
+        """Apply gradients summed over a partial accumulation (end of epoch)"""
+        if self.pending:
+            self._apply(self.pending)
+            self.pending = 0
+
+
+class AsyncCheckpointer:
+    """
+    Writes checkpoints in a background thread. The live weights are copied
+    into a shadow model first, which is the only time the step loop waits,
+    unless the previous save is still being written.
+    """
+
+    def __init__(self, model, prefix: str = DEFAULT_CHECKPOINT):
+        import tensorflow as tf
+
+        self.model = model
+        self.prefix = prefix
+        self._shadow = build_model()
+        self._checkpoint = tf.train.Checkpoint(model=self._shadow)
+        self._thread: Optional[threading.Thread] = None
+        self.error: Optional[BaseException] = None
+        self.last_save_s = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+
+    def save(self, state: dict):
+        self.wait()
+        self._shadow.set_weights(self.model.get_weights())
+        self._thread = threading.Thread(target=self._write, args=(dict(state),), daemon=True)
+        self._thread.start()
+
+    def _write(self, state: dict):
+        start = time.perf_counter()
+        try:
+            # Write under a temporary prefix and move the files into place only once complete
+            tmp = self.prefix + '.tmp'
+            self._checkpoint.write(tmp)
+            directory = os.path.dirname(os.path.abspath(tmp))
+            base = os.path.basename(tmp)
+            for name in os.listdir(directory):
+                if name.startswith(base + '.data-'):
+                    os.replace(os.path.join(directory, name), self.prefix + name[len(base):])
+            os.replace(tmp + '.index', self.prefix + '.index')
+            with open(self.prefix + '.train.json.tmp', 'w') as f:
+                json.dump(state, f)
+            os.replace(self.prefix + '.train.json.tmp', self.prefix + '.train.json')
+        except BaseException as e:
+            self.error = e
+        self.last_save_s = time.perf_counter() - start
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(f"Checkpoint write failed: {error}") from error
+
+
+def restore(model, prefix: str) -> dict:
+    """Load weights and training state saved by AsyncCheckpointer; {} when there is none"""
+    import tensorflow as tf
+
+    if not os.path.exists(prefix + '.index'):
+        return {}
+    tf.train.Checkpoint(model=model).restore(prefix).expect_partial()
+    try:
+        with open(prefix + '.train.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train LipNet with CTC loss")
+    parser.add_argument('--records', default=os.path.join('data', 'tfrecords'),
+                        help="TFRecord directory from tfrecord_dataset.py (used when it has shards)")
+    parser.add_argument('--speakers', nargs='+', default=None, help="Only these speakers' shards")
+    parser.add_argument('--videos', default=os.path.join('data', 's1', '*.mpg'),
+                        help="Video glob for the notebook pipeline when there are no shards")
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=2, help="Clips per step")
+    parser.add_argument('--accumulate', type=int, default=1, help="Steps per optimizer update")
+    parser.add_argument('--learning-rate', type=float, default=DEFAULT_LEARNING_RATE)
+    parser.add_argument('--xla', action='store_true', help="XLA-compile the train step")
+    parser.add_argument('--intra-op-threads', type=int, default=DEFAULT_INTRA_OP_THREADS or len(available_cpus()))
+    parser.add_argument('--inter-op-threads', type=int, default=DEFAULT_INTER_OP_THREADS or 2)
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="Checkpoint prefix")
+    parser.add_argument('--checkpoint-steps', type=int, default=0,
+                        help="Also checkpoint every N optimizer updates (0: once per epoch)")
+    parser.add_argument('--resume', action='store_true', help="Continue from --checkpoint")
+    parser.add_argument('--log-every', type=int, default=50, help="Steps between throughput logs")
+    args = parser.parse_args()
+
+    # Thread pools can only be sized before TensorFlow runs its first op
+    configure_threads(args.intra_op_threads, args.inter_op_threads)
+    import tensorflow as tf
+
+    try:
+        from tfrecord_dataset import make_dataset
+    except ImportError:
+        from backend.tfrecord_dataset import make_dataset
+    try:
+        dataset = make_dataset(args.records, 'train', args.speakers, batch_size=args.batch_size)
+        source = args.records
+    except FileNotFoundError:
+        dataset = video_dataset(args.videos, args.batch_size)
+        source = args.videos
+
+    model = build_model()
+    state = restore(model, args.checkpoint) if args.resume else {}
+    learning_rate = state.get('learning_rate', args.learning_rate)
+    optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
+    trainer = Trainer(model, optimizer, args.accumulate, args.xla)
+    checkpointer = AsyncCheckpointer(model, args.checkpoint)
+    print(f"Training on {source}: batch {args.batch_size} x {trainer.accumulate} accumulated, "
+          f"xla={args.xla}, threads {args.intra_op_threads}/{args.inter_op_threads}, "
+          f"starting at epoch {state.get('epoch', 0)}")
+
+    updates = state.get('updates', 0)
+    for epoch in range(state.get('epoch', 0), args.epochs):
+        # `learning_rate` is the rate entering this epoch, which is what a mid-epoch resume needs
+        epoch_rate = float(scheduler(epoch, learning_rate))
+        optimizer.learning_rate.assign(epoch_rate)
+        epoch_start = interval_start = time.perf_counter()
+        epoch_samples = interval_samples = 0
+        loss = None
+        for step, (frames, labels) in enumerate(dataset, 1):
+            loss = trainer.step(frames, labels)
+            samples = int(frames.shape[0])
+            epoch_samples += samples
+            interval_samples += samples
+            if trainer.pending == 0:
+                updates += 1
+                if args.checkpoint_steps and updates % args.checkpoint_steps == 0:
+                    checkpointer.save({'epoch': epoch, 'updates': updates, 'learning_rate': learning_rate})
+            if step % args.log_every == 0:
+                # float(loss) syncs, so the interval covers every queued step
+                value = float(loss)
+                elapsed = time.perf_counter() - interval_start
+                print(f"epoch {epoch + 1} step {step}: loss {value:.4f}, "
+                      f"{interval_samples / elapsed:.2f} samples/s")
+                interval_start, interval_samples = time.perf_counter(), 0
+        if trainer.pending:
+            trainer.flush()
+            updates += 1
+        value = float(loss) if loss is not None else float('nan')
+        elapsed = time.perf_counter() - epoch_start
+        learning_rate = epoch_rate
+        checkpointer.save({'epoch': epoch + 1, 'updates': updates, 'learning_rate': learning_rate})
+        print(f"epoch {epoch + 1}/{args.epochs}: loss {value:.4f}, lr {learning_rate:.2e}, "
+              f"{epoch_samples} samples in {elapsed:.1f}s ({epoch_samples / max(elapsed, 1e-9):.2f} samples/s), "
+              f"last checkpoint write {checkpointer.last_save_s:.1f}s")
+    checkpointer.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+"""Video decode backends producing cropped grayscale mouth frames"""
+import os
+import shutil
+import struct
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple, Type
+
+import numpy as np
+
+
+# Mouth region used by the GRID-trained model: frame[190:236, 80:220]
+CROP_TOP, CROP_BOTTOM = 190, 236
+CROP_LEFT, CROP_RIGHT = 80, 220
+
+# Shape returned for unreadable or empty videos (matches load_video)
+EMPTY_SHAPE = (75, 46, 140, 1)
+
+# Weights used by tf.image.rgb_to_grayscale. OpenCV frames are BGR and the
+# model was trained on them as-is, so the weights apply in B, G, R order.
+GRAY_WEIGHTS = np.array([0.2989, 0.5870, 0.1140], dtype=np.float32)
+
+DEFAULT_BACKEND = os.getenv("LIPNET_VIDEO_BACKEND", "opencv")
+# Mouth region: 'fixed' GRID crop, or 'track' for detection and tracking (see roi.py)
+ROI_MODES = ("fixed", "track")
+DEFAULT_ROI_MODE = os.getenv("LIPNET_ROI", "fixed")
+
+
+def crop_bounds(height: int, width: int) -> Tuple[int, int, int, int]:
+    """Return (top, bottom, left, right) of the mouth crop clipped to the frame"""
+    top = min(CROP_TOP, height)
+    left = min(CROP_LEFT, width)
+    return top, min(CROP_BOTTOM, height), left, min(CROP_RIGHT, width)
+
+
+def to_grayscale(frames: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Vectorized equivalent of tf.image.rgb_to_grayscale for uint8 frames.
+    Works on any (..., 3) array and returns (..., 1) uint8.
+    """
+    gray = np.tensordot(frames.astype(np.float32) * np.float32(1.0 / 255.0), GRAY_WEIGHTS, axes=([-1], [0]))
+    gray *= np.float32(255.5)
+    if out is None:
+        return gray.astype(np.uint8)[..., np.newaxis]
+    out[..., 0] = gray
+    return out
+
+
+def normalization_params(gray: np.ndarray) -> Tuple[int, float]:
+    """Integer mean and float32 std used by normalize_frames"""
+    mean = int(gray.sum(dtype=np.uint64) // np.uint64(gray.size))
+    std = float(np.float32(gray.std(dtype=np.float64)))
+    return mean, std
+
+
+def normalize_frames(gray: np.ndarray, mean: Optional[int] = None, std: Optional[float] = None) -> np.ndarray:
+    """
+    Normalize (T, H, W, 1) uint8 frames exactly like load_video.
+
+    The original pipeline takes an integer mean and subtracts it in uint8,
+    which wraps around for pixels darker than the mean. The model was
+    trained on that input, so it is reproduced here. `mean`/`std` default
+    to the statistics of `gray` itself.
+    """
+    if gray.size == 0:
+        return np.zeros(EMPTY_SHAPE, dtype=np.float32)
+    if mean is None or std is None:
+        mean, std = normalization_params(gray)
+    centered = np.subtract(gray, np.uint8(mean), dtype=np.uint8)
+    return centered.astype(np.float32) / (np.float32(std) + np.float32(1e-8))
+
+
+def needs_seek(data: bytes) -> bool:
+    """
+    True when the container cannot be decoded from a forward-only stream.
+    That is the case for MP4/MOV files whose `moov` index comes after the
+    `mdat` payload; MPEG-PS (GRID .mpg), AVI, MKV and fast-start MP4 stream fine.
+    """
+    if data[4:8] != b"ftyp":
+        return False
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box = struct.unpack(">I4s", data[offset:offset + 8])
+        if box == b"moov":
+            return False
+        if box == b"mdat":
+            return True
+        if size == 1 and offset + 16 <= len(data):
+            size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+        if size < 8:
+            break
+        offset += size
+    return True
+
+
+@contextmanager
+def memory_file(data: bytes, suffix: str = ".mpg") -> Iterator[str]:
+    """
+    Expose an in-memory buffer as a seekable file path. Uses an anonymous
+    memfd on Linux; falls back to a temp file elsewhere.
+    """
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("lipnet-upload")
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            os.lseek(fd, 0, os.SEEK_SET)
+            # pid rather than "self" so ffmpeg child processes can open it too
+            yield f"/proc/{os.getpid()}/fd/{fd}"
+        finally:
+            os.close(fd)
+        return
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        tmp_file.write(data)
+        tmp_path = tmp_file.name
+    try:
+        yield tmp_path
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def decode_frame(data: bytes, tracker=None) -> np.ndarray:
+    """
+    Decode one compressed image (JPEG/PNG/WebP) into a (46, 140, 1) uint8
+    grayscale mouth crop. Images already 46x140 are taken as a pre-cropped
+    ROI; other sizes are cropped by `tracker` (a roi.MouthTracker kept per
+    stream) when given, else at the GRID mouth region and resized if the
+    frame is too small for it.
+    """
+    import cv2
+
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode frame")
+    out_h, out_w = EMPTY_SHAPE[1:3]
+    if frame.shape[:2] != (out_h, out_w) and tracker is not None:
+        return tracker.crop(frame)
+    if frame.shape[:2] != (out_h, out_w):
+        top, bottom, left, right = crop_bounds(*frame.shape[:2])
+        crop = frame[top:bottom, left:right]
+        if crop.shape[:2] != (out_h, out_w):
+            crop = cv2.resize(frame if crop.size == 0 else crop, (out_w, out_h), interpolation=cv2.INTER_AREA)
+        frame = crop
+    return to_grayscale(frame)
+
+
+class VideoDecoder:
+    """Base class: decode a video into cropped grayscale uint8 frames"""
+
+    name = "base"
+
+    def decode(self, path: str) -> np.ndarray:
+        """Return a (T, H, W, 1) uint8 array of cropped grayscale frames"""
+        raise NotImplementedError
+
+    def load(self, path: str) -> np.ndarray:
+        """Decode and normalize; same output as load_video"""
+        gray = self.decode(path)
+        if gray.shape[0] == 0:
+            return np.zeros(EMPTY_SHAPE, dtype=np.float32)
+        return normalize_frames(gray)
+
+    def decode_bytes(self, data: bytes, suffix: str = ".mpg") -> np.ndarray:
+        """Decode an in-memory video; see decode"""
+        with memory_file(data, suffix) as path:
+            return self.decode(path)
+
+    def load_bytes(self, data: bytes, suffix: str = ".mpg") -> np.ndarray:
+        """Decode and normalize an in-memory video"""
+        gray = self.decode_bytes(data, suffix)
+        if gray.shape[0] == 0:
+            return np.zeros(EMPTY_SHAPE, dtype=np.float32)
+        return normalize_frames(gray)
+
+    def iter_frames(self, path: str) -> Iterator[np.ndarray]:
+        """
+        Yield (H, W, 1) uint8 crops one at a time, so long videos never sit
+        in memory whole. The base implementation decodes everything first.
+        """
+        yield from self.decode(path)
+
+    def iter_frames_bytes(self, data: bytes, suffix: str = ".mpg") -> Iterator[np.ndarray]:
+        """iter_frames for an in-memory video"""
+        with memory_file(data, suffix) as path:
+            yield from self.iter_frames(path)
+
+    def iter_color_frames(self, path: str) -> Iterator[np.ndarray]:
+        """Yield uncropped (H, W, 3) BGR frames, for ROI tracking"""
+        raise NotImplementedError
+
+    def frame_rate(self, path: str) -> Optional[float]:
+        """Frames per second of the video, when the container reports it"""
+        return None
+
+
+class OpenCVDecoder(VideoDecoder):
+    """
+    cv2.VideoCapture decode into a preallocated frame buffer. Only the crop
+    is converted to grayscale, straight into the output array.
+    """
+
+    name = "opencv"
+
+    def decode(self, path: str) -> np.ndarray:
+        import cv2
+
+        cap = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                return np.zeros((0,) + EMPTY_SHAPE[1:], dtype=np.uint8)
+            return self._read_all(cap, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        finally:
+            cap.release()
+
+    def iter_frames(self, path: str) -> Iterator[np.ndarray]:
+        import cv2
+
+        cap = cv2.VideoCapture(path)
+        try:
+            buf = None
+            bounds = None
+            while cap.isOpened():
+                ret, buf = cap.read(buf)
+                if not ret:
+                    break
+                if bounds is None:
+                    bounds = crop_bounds(*buf.shape[:2])
+                top, bottom, left, right = bounds
+                yield to_grayscale(buf[top:bottom, left:right])
+        finally:
+            cap.release()
+
+    def iter_color_frames(self, path: str) -> Iterator[np.ndarray]:
+        import cv2
+
+        cap = cv2.VideoCapture(path)
+        try:
+            while cap.isOpened():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield frame
+        finally:
+            cap.release()
+
+    def frame_rate(self, path: str) -> Optional[float]:
+        import cv2
+
+        cap = cv2.VideoCapture(path)
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0.0
+        finally:
+            cap.release()
+        return fps if fps > 0 else None
+
+    @staticmethod
+    def _read_all(cap, frame_count: int) -> np.ndarray:
+        out = None
+        buf = None
+        count = 0
+        for _ in range(frame_count):
+            ret, buf = cap.read(buf)
+            if not ret:
+                break
+            if out is None:
+                top, bottom, left, right = crop_bounds(*buf.shape[:2])
+                out = np.empty((frame_count, bottom - top, right - left, 1), dtype=np.uint8)
+            to_grayscale(buf[top:bottom, left:right], out=out[count])
+            count += 1
+        if out is None:
+            return np.zeros((0,) + EMPTY_SHAPE[1:], dtype=np.uint8)
+        return out[:count]
+
+
+class FFmpegDecoder(VideoDecoder):
+    """
+    ffmpeg raw-pipe decode. The crop runs inside the decoder's filter graph
+    so only the mouth region crosses the pipe.
+
+    With `gray_in_decoder=True` ffmpeg also does the grayscale conversion
+    (`format=gray`). That is the fastest path but uses ffmpeg's BT.601 luma,
+    so values differ slightly from load_video. The default converts the
+    cropped BGR pixels with the same weights as load_video.
+    """
+
+    name = "ffmpeg"
+
+    def __init__(self, ffmpeg: str = "ffmpeg", ffprobe: str = "ffprobe", gray_in_decoder: bool = False):
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.gray_in_decoder = gray_in_decoder
+
+    @classmethod
+    def available(cls) -> bool:
+        return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+    def probe_size(self, path: str, data: Optional[bytes] = None) -> Optional[Tuple[int, int]]:
+        """Return (height, width) of the first video stream (from stdin if `data` is given)"""
+        result = subprocess.run(
+            [self.ffprobe, "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "stream=width,height", "-of", "csv=p=0:s=x", path],
+            input=data, capture_output=True,
+        )
+        stdout = result.stdout.decode("utf-8", "replace")
+        if result.returncode != 0 or "x" not in stdout:
+            return None
+        width, height = stdout.strip().split("\n")[0].split("x")[:2]
+        return int(height), int(width)
+
+    def filter_graph(self, height: int, width: int) -> Tuple[str, str, int]:
+        """Return (filter, pix_fmt, channels) for the in-decoder crop"""
+        top, bottom, left, right = crop_bounds(height, width)
+        crop = f"crop={right - left}:{bottom - top}:{left}:{top}"
+        if self.gray_in_decoder:
+            return f"{crop},format=gray", "gray", 1
+        return crop, "bgr24", 3
+
+    def decode(self, path: str) -> np.ndarray:
+        size = self.probe_size(path)
+        if size is None:
+            return np.zeros((0,) + EMPTY_SHAPE[1:], dtype=np.uint8)
+        return self._run(["-i", path], None, *size)
+
+    def decode_bytes(self, data: bytes, suffix: str = ".mpg") -> np.ndarray:
+        """Pipe streamable containers straight into ffmpeg's stdin"""
+        if needs_seek(data):
+            return super().decode_bytes(data, suffix)
+        size = self.probe_size("pipe:0", data)
+        if size is None:
+            return np.zeros((0,) + EMPTY_SHAPE[1:], dtype=np.uint8)
+        return self._run(["-i", "pipe:0"], data, *size)
+
+    def iter_frames(self, path: str) -> Iterator[np.ndarray]:
+        """Read the raw pipe one frame at a time instead of buffering all of stdout"""
+        size = self.probe_size(path)
+        if size is None:
+            return
+        top, bottom, left, right = crop_bounds(*size)
+        vf, pix_fmt, channels = self.filter_graph(*size)
+        for frame in self._pipe_frames(path, ["-vf", vf], pix_fmt, (bottom - top, right - left, channels)):
+            yield frame.copy() if channels == 1 else to_grayscale(frame)
+
+    def iter_color_frames(self, path: str) -> Iterator[np.ndarray]:
+        size = self.probe_size(path)
+        if size is None:
+            return
+        for frame in self._pipe_frames(path, [], "bgr24", size + (3,)):
+            yield frame.copy()
+
+    def _pipe_frames(self, path: str, filter_args: list, pix_fmt: str, shape: Tuple[int, int, int]) -> Iterator[np.ndarray]:
+        """Yield read-only views of each raw frame ffmpeg writes to its stdout"""
+        cmd = [self.ffmpeg, "-v", "error", "-nostdin", "-i", path,
+               "-an", "-vsync", "0"] + filter_args + ["-f", "rawvideo", "-pix_fmt", pix_fmt, "pipe:1"]
+        frame_bytes = shape[0] * shape[1] * shape[2]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                raw = proc.stdout.read(frame_bytes)
+                if len(raw) < frame_bytes:
+                    break
+                yield np.frombuffer(raw, dtype=np.uint8).reshape(shape)
+        finally:
+            proc.stdout.close()
+            proc.kill()
+            proc.wait()
+
+    def frame_rate(self, path: str) -> Optional[float]:
+        result = subprocess.run(
+            [self.ffprobe, "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "stream=avg_frame_rate", "-of", "csv=p=0", path],
+            capture_output=True,
+        )
+        rate = result.stdout.decode("utf-8", "replace").strip().split("\n")[0]
+        try:
+            num, _, den = rate.partition("/")
+            fps = float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            return None
+        return fps if fps > 0 else None
+
+    def _run(self, input_args: list, stdin_data: Optional[bytes], height: int, width: int) -> np.ndarray:
+        top, bottom, left, right = crop_bounds(height, width)
+        out_h, out_w = bottom - top, right - left
+        vf, pix_fmt, channels = self.filter_graph(height, width)
+        cmd = [self.ffmpeg, "-v", "error", "-nostdin"] if stdin_data is None else [self.ffmpeg, "-v", "error"]
+        cmd += input_args + ["-an", "-vsync", "0", "-vf", vf, "-f", "rawvideo", "-pix_fmt", pix_fmt, "pipe:1"]
+        result = subprocess.run(cmd, input=stdin_data, capture_output=True)
+        raw = np.frombuffer(result.stdout, dtype=np.uint8)
+        frame_bytes = out_h * out_w * channels
+        if frame_bytes == 0 or raw.size < frame_bytes:
+            return np.zeros((0,) + EMPTY_SHAPE[1:], dtype=np.uint8)
+        frames = raw[: raw.size - raw.size % frame_bytes].reshape(-1, out_h, out_w, channels)
+        if channels == 1:
+            return frames.copy()
+        return to_grayscale(frames)
+
+
+DECODERS: Dict[str, Type[VideoDecoder]] = {
+    OpenCVDecoder.name: OpenCVDecoder,
+    FFmpegDecoder.name: FFmpegDecoder,
+}
+
+_decoder_cache: Dict[str, VideoDecoder] = {}
+
+
+def get_decoder(backend: Optional[str] = None, roi: Optional[str] = None) -> VideoDecoder:
+    """
+    Return a (shared) decoder instance by backend name. `roi` is 'fixed'
+    for the GRID crop or 'track' for mouth detection and tracking
+    (default: LIPNET_ROI).
+    """
+    backend = backend or DEFAULT_BACKEND
+    roi = roi or DEFAULT_ROI_MODE
+    if backend not in DECODERS:
+        raise ValueError(f"Unknown video backend '{backend}'. Choose from: {', '.join(DECODERS)}")
+    if roi not in ROI_MODES:
+        raise ValueError(f"Unknown ROI mode '{roi}'. Choose from: {', '.join(ROI_MODES)}")
+    if backend not in _decoder_cache:
+        _decoder_cache[backend] = DECODERS[backend]()
+    if roi == 'fixed':
+        return _decoder_cache[backend]
+    key = f"{backend}+{roi}"
+    if key not in _decoder_cache:
+        try:
+            from roi import ROIDecoder
+        except ImportError:
+            from backend.roi import ROIDecoder
+        _decoder_cache[key] = ROIDecoder(_decoder_cache[backend])
+    return _decoder_cache[key]
+
+
+__all__ = [
+    'VideoDecoder',
+    'OpenCVDecoder',
+    'FFmpegDecoder',
+    'DECODERS',
+    'get_decoder',
+    'ROI_MODES',
+    'DEFAULT_ROI_MODE',
+    'to_grayscale',
+    'normalize_frames',
+    'normalization_params',
+    'crop_bounds',
+    'needs_seek',
+    'decode_frame',
+    'memory_file',
+]
@@ -2,10 +2,8 @@
 import streamlit as st
 import requests
 import os
-import cv2
-import numpy as np
 import tempfile
-from PIL import Image
+import json
 import time
 
 # Page configuration with custom icon
@@ -128,7 +126,7 @@ st.sidebar.info("""
 
 **Features:**
 - 📤 Video Upload
-- 📹 Realtime Camera
+- 📹 Realtime Camera (WebSocket streaming)
 - 🤖 AI Predictions
 """)
 
@@ -145,6 +143,61 @@ st.markdown("""
 """, unsafe_allow_html=True)
 st.markdown("---")
 
+# Longest time the upload tab waits for a background transcription job
+JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", "600"))
+
+
+def wait_for_job(job_id, status_box):
+    """Poll a backend job until it finishes; returns the response of its result URL"""
+    deadline = time.time() + JOB_TIMEOUT_SECONDS
+    while time.time() < deadline:
+        response = requests.get(f"{API_URL}/api/jobs/{job_id}/result", timeout=10)
+        if response.status_code != 202:
+            return response
+        status_box.caption(f"Job {job_id[:8]}: {response.json().get('status', 'queued')}...")
+        time.sleep(float(response.headers.get("Retry-After", 1)))
+    # Give up: free the server-side slot as well
+    requests.delete(f"{API_URL}/api/jobs/{job_id}", timeout=10)
+    raise TimeoutError(f"Prediction did not finish within {JOB_TIMEOUT_SECONDS} seconds")
+
+
+def compact_frames(path):
+    """
+    Crop and compress a video here instead of on the backend: the .lipf
+    frame tensor of backend/frame_tensor.py (46x140 grayscale mouth crops,
+    frame deltas, zlib). Returns None if the video is unreadable or smaller
+    than the GRID crop, in which case the video itself should be sent.
+    """
+    import cv2
+    import numpy as np
+    import struct
+    import zlib
+
+    # Same crop and grayscale weights (BGR order) as backend/video_io.py
+    weights = np.array([0.2989, 0.5870, 0.1140], dtype=np.float32)
+    cap = cv2.VideoCapture(path)
+    frames = []
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            crop = frame[190:236, 80:220].astype(np.float32) * np.float32(1.0 / 255.0)
+            gray = np.tensordot(crop, weights, axes=([-1], [0])) * np.float32(255.5)
+            frames.append(gray.astype(np.uint8))
+    finally:
+        cap.release()
+    if not frames or frames[0].shape != (46, 140):
+        return None
+    frames = np.stack(frames)
+    deltas = frames.copy()
+    np.subtract(frames[1:], frames[:-1], out=deltas[1:], dtype=np.uint8)
+    # Header: magic, version 1, codec 1 (zlib), flags 1 (delta), frames, height, width, fps
+    header = struct.pack("<4sBBBxHHHf", b"LIPF", 1, 1, 1, len(frames), 46, 140, fps)
+    return header + zlib.compress(deltas.tobytes(), 6)
+
+
 # Tabs for different modes
 tab1, tab2 = st.tabs(["📤 Upload Video", "📹 Realtime Camera"])
 
@@ -158,6 +211,12 @@ with tab1:
         type=['mpg', 'mp4', 'avi', 'mov'],
         help="Upload a video file containing lip movements"
     )
+    compact_upload = st.checkbox(
+        "Crop and compress before upload",
+        value=False,
+        help="Extract the mouth region here and send only the compressed crops. "
+             "Much smaller uploads and no video decoding on the server; assumes GRID-style framing."
+    )
     
     col1, col2 = st.columns([1, 1])
     
@@ -175,18 +234,33 @@ with tab1:
             if st.button("🚀 Run Prediction", use_container_width=True, type="primary"):
                 with st.spinner("Processing video and making prediction..."):
                     try:
-                        # Upload to backend
-                        with open(tmp_path, 'rb') as f:
-                            files = {'file': (uploaded_file.name, f, 'video/mpeg')}
-                            params = {"session_token": st.session_state.session_token}
-                            response = requests.post(
-                                f"{API_URL}/api/predict/upload",
-                                files=files,
-                                params=params,
-                                timeout=60
-                            )
+                        payload = compact_frames(tmp_path) if compact_upload else None
+                        if compact_upload and payload is None:
+                            st.caption("Could not crop this video locally; uploading it as is.")
+                        if payload is None:
+                            with open(tmp_path, 'rb') as f:
+                                payload = f.read()
+                            files = {'file': (uploaded_file.name, payload, 'video/mpeg')}
+                        else:
+                            st.caption(f"Uploading {len(payload) // 1024} KB of cropped frames "
+                                       f"instead of {os.path.getsize(tmp_path) // 1024} KB of video")
+                            files = {'file': (os.path.splitext(uploaded_file.name)[0] + '.lipf', payload,
+                                              'application/octet-stream')}
+                        # Submit as a background job, then poll for the result
+                        params = {"session_token": st.session_state.session_token}
+                        response = requests.post(
+                            f"{API_URL}/api/jobs",
+                            files=files,
+                            params=params,
+                            timeout=60
+                        )
+                        if response.status_code == 202:
+                            response = wait_for_job(response.json()["job_id"], st.empty())
                         
-                        if response.status_code == 200:
+                        if response.status_code == 429:
+                            retry_after = response.headers.get("Retry-After", "a few")
+                            st.warning(f"⏳ The server is busy. Please try again in {retry_after} seconds.")
+                        elif response.status_code == 200:
                             result = response.json()
                             st.success("✅ Prediction Complete!")
                             
@@ -215,18 +289,37 @@ with tab1:
             st.info("👆 Please upload a video file to get started")
 
 # Tab 2: Realtime Camera
+def realtime_ws_url():
+    """WebSocket URL of the realtime endpoint, derived from API_URL"""
+    base = API_URL.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+    return f"{base}/api/predict/realtime?session_token={st.session_state.session_token}"
+
+
+def test_pattern_frame(i):
+    """Synthetic GRID-sized frame with an opening and closing mouth shape"""
+    import cv2
+    import numpy as np
+
+    frame = np.full((288, 360, 3), 115, dtype=np.uint8)
+    opening = int(4 + 10 * abs(np.sin(i * 0.35)))
+    cv2.ellipse(frame, (150, 213), (45, opening), 0, 0, 360, (40, 30, 120), -1)
+    return frame
+
+
 with tab2:
-    st.header("Realtime Camera Lip Tracking")
-    st.markdown("**Note:** This is a dummy implementation. Real-time camera tracking is in development.")
+    st.header("Realtime Camera Lip Reading")
+    st.markdown("Frames are streamed to the backend over a WebSocket; transcripts update as you speak.")
     
     col1, col2 = st.columns([1, 1])
     
     with col1:
         st.subheader("Camera Control")
+        source = st.radio("Source", ["Webcam", "Test pattern"], horizontal=True)
+        seconds = st.slider("Duration (seconds)", 2, 30, 6)
+        fps = st.slider("Frames per second", 5, 30, 25)
         
         if st.button("📹 Start Camera", use_container_width=True, type="primary"):
             st.session_state.camera_active = True
-            st.info("Camera started (dummy mode)")
         
         if st.button("⏹️ Stop Camera", use_container_width=True):
             st.session_state.camera_active = False
@@ -235,42 +328,85 @@ with tab2:
     with col2:
         if st.session_state.camera_active:
             st.subheader("Live Feed")
-            # Dummy camera feed
             placeholder = st.empty()
+            transcript = st.empty()
+            status_line = st.empty()
             
-            # Simulate camera frames
-            for i in range(10):
-                # Create dummy frame
-                dummy_frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
-                placeholder.image(dummy_frame, caption=f"Frame {i+1} (Dummy)", use_container_width=True)
-                time.sleep(0.5)
-                
-                if not st.session_state.camera_active:
-                    break
+            # Only the realtime tab needs OpenCV, so the upload page loads without it
+            import cv2
+            try:
+                import websocket  # websocket-client
+            except ImportError:
+                websocket = None
+                st.error("Realtime mode needs the `websocket-client` package: `pip install websocket-client`")
             
-            if st.button("🚀 Run Realtime Prediction", use_container_width=True, type="primary"):
-                with st.spinner("Processing realtime frames..."):
-                    try:
-                        response = requests.post(
-                            f"{API_URL}/api/predict/realtime",
-                            json={"frame_count": 10},
-                            params={"session_token": st.session_state.session_token},
-                            timeout=10
+            capture = None
+            if websocket is not None and source == "Webcam":
+                capture = cv2.VideoCapture(0)
+                if not capture.isOpened():
+                    st.error("❌ No camera found. Choose 'Test pattern' to try the stream without one.")
+                    capture = None
+            
+            if websocket is not None and (capture is not None or source == "Test pattern"):
+                def show(message):
+                    kind = message.get("type")
+                    if kind == "partial":
+                        transcript.info(f'**Partial:** "{message["text"]}"')
+                    elif kind == "final":
+                        transcript.success(f'**Final:** "{message["text"]}"')
+                    if "latency_ms" in message:
+                        status_line.caption(
+                            f"Frame {message['frame']} · latency {message['latency_ms']} ms · "
+                            f"dropped {message['dropped']}"
                         )
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            st.success("✅ Realtime Prediction Complete!")
-                            st.info(f'**Prediction:** "{result["prediction"]}"')
+                
+                try:
+                    ws = websocket.create_connection(realtime_ws_url(), timeout=10)
+                    interval = 1.0 / fps
+                    for i in range(int(seconds * fps)):
+                        if capture is not None:
+                            ok, frame = capture.read()
+                            if not ok:
+                                break
                         else:
-                            st.error(f"Error: {response.json().get('detail', 'Unknown error')}")
+                            frame = test_pattern_frame(i)
+                        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                        if ok:
+                            ws.send_binary(encoded.tobytes())
+                        placeholder.image(frame[:, :, ::-1], caption=f"Frame {i + 1}", use_container_width=True)
+                        
+                        # Drain any transcripts that have arrived without blocking capture
+                        ws.settimeout(0)
+                        try:
+                            while True:
+                                show(json.loads(ws.recv()))
+                        except (websocket.WebSocketTimeoutException, BlockingIOError):
+                            pass
+                        ws.settimeout(10)
+                        time.sleep(interval)
                     
-                    except requests.exceptions.ConnectionError:
-                        st.error("❌ Cannot connect to backend server.")
-                    except Exception as e:
-                        st.error(f"Error: {str(e)}")
+                    ws.send(json.dumps({"type": "end"}))
+                    while True:
+                        message = json.loads(ws.recv())
+                        show(message)
+                        if message.get("type") == "end":
+                            st.success("✅ Realtime Prediction Complete!")
+                            st.caption(
+                                f"{message['windows_run']} windows · p50 latency {message['latency_ms_p50']} ms · "
+                                f"{message['frames_dropped']} frames dropped"
+                            )
+                            break
+                    ws.close()
+                except (ConnectionRefusedError, OSError):
+                    st.error("❌ Cannot connect to backend server.")
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
+                finally:
+                    if capture is not None:
+                        capture.release()
+                    st.session_state.camera_active = False
         else:
-            st.info("👆 Click 'Start Camera' to begin realtime tracking")
+            st.info("👆 Click 'Start Camera' to begin realtime lip reading")
 
 # Footer with links
 st.markdown("---")
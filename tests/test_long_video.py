@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from backend.long_video import TranscriptStitcher, iter_windows
+
+LOOKUP = np.array(['a', 'b', 'c', ' ', ''])
+WINDOW = 75
+
+
+def greedy_text(tokens):
+    """Reference: one greedy CTC decode over the whole clip"""
+    blank = len(LOOKUP) - 1
+    chars, previous = [], -1
+    for token in tokens:
+        if token != previous and token != blank:
+            chars.append(LOOKUP[token])
+        previous = token
+    return ' '.join(''.join(chars).split())
+
+
+def stitched_text(tokens, overlap):
+    stitcher = TranscriptStitcher(LOOKUP, overlap, WINDOW)
+    # Token ids stand in for frames, so each window's one-hot output is its own clip
+    frames = (np.array([token], dtype=np.uint8) for token in tokens)
+    for start, clip, valid in iter_windows(frames, WINDOW, overlap):
+        stitcher.add(start, np.eye(len(LOOKUP), dtype=np.float32)[clip[:, 0]], valid)
+    result = stitcher.finish()
+    assert stitcher.frames == len(tokens)
+    return result["text"]
+
+
+@pytest.mark.parametrize("overlap", range(WINDOW))
+@pytest.mark.parametrize("length", [1, 40, 75, 76, 300, 1001])
+def test_stitching_matches_full_greedy_decode(overlap, length):
+    rng = np.random.default_rng(overlap * 7919 + length)
+    # Runs of a few frames per token, like real CTC output
+    tokens = np.repeat(rng.integers(0, len(LOOKUP), size=length), rng.integers(1, 4, size=length))[:length]
+    assert stitched_text(tokens, overlap) == greedy_text(tokens)